@@ -0,0 +1,190 @@
+"""
+ASGI-native versions of the read-heavy pages. When ASYNC_VIEWS is on,
+urls.py routes to these in place of the sync views.
+
+Queries go through the async ORM and are awaited one after another.
+The async ORM runs each query through ``sync_to_async`` on the one
+shared thread for sync code, so gathering them would not overlap them.
+What these views save is the request's thread, not query time. Two
+things still run in a worker thread:
+- the versioned cache helpers and the ETag functions, which query on a
+  miss;
+- template rendering, because templates may follow a relation lazily,
+  which the async ORM forbids.
+
+Requests other than GET/HEAD are handed to the sync view, since the
+writes behind them are not the hot path.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.core.paginator import Page, Paginator
+from django.shortcuts import aget_object_or_404, render
+
+from . import caching, search, views
+from .conditional import async_condition, feed_etag, post_etag, profile_etag
+from .feed import POST_COMMENTS_PREVIEW, aget_feed_page, attach_previews
+from .follow_state import follow_state_for
+from .forms import CommentForm, ProfileForm
+from .models import Comment, Facet, Follow, Like, Post, Profile
+
+arender = sync_to_async(render)
+
+
+# helpers
+
+def resolve_user(view):
+    """Load ``request.user`` up front, so sync code (ETags, context
+    processors, templates) can use it without touching the database."""
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+    return inner
+
+
+def login_required_async(view):
+    return login_required(resolve_user(view))
+
+
+def reads_only(sync_view):
+    """Serve GET/HEAD asynchronously and hand anything else to ``sync_view``."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            return await view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+async def apaginate(queryset, number, per_page):
+    """Paginator.get_page() for async code."""
+    paginator = Paginator(queryset, per_page)
+    try:
+        number = max(1, int(number))
+    except (TypeError, ValueError):
+        number = 1
+
+    paginator.count = await queryset.acount()
+    number = min(number, paginator.num_pages)
+    bottom = (number - 1) * per_page
+    return Page([obj async for obj in queryset[bottom:bottom + per_page]], number, paginator)
+
+
+#feed
+
+@login_required_async
+@async_condition(feed_etag)
+async def feed(request):
+    page = await aget_feed_page(request.user, request.GET.get("cursor"))
+
+    return await arender(request, "accounts/feed.html", {
+        "posts": page.posts,
+        "comments_by_post": page.comments_by_post,
+        "next_cursor": page.next_cursor,
+        "has_next": page.has_next,
+    })
+
+
+#profile
+
+async def _is_following(viewer, user):
+    if viewer == user:
+        return False
+    following = await Follow.objects.filter(follower=viewer, following=user).aexists()
+    # templates ask through the is_following filter; answer it from here
+    follow_state_for(viewer).set(user, following)
+    return following
+
+
+async def _liked_post_ids(viewer, author_id):
+    likes = Like.objects.filter(user=viewer, post__author_id=author_id).values_list("post_id", flat=True)
+    return {post_id async for post_id in likes}
+
+
+@login_required_async
+@async_condition(profile_etag)
+@reads_only(views.profile_view)
+async def profile_view(request, username=None):
+    if username:
+        profile = await sync_to_async(caching.profile_by_username)(username)
+        if profile is None:
+            # users made outside signup (createsuperuser, the admin) have none yet
+            user = await aget_object_or_404(User, username=username)
+            profile, _ = await Profile.objects.select_related("user").aget_or_create(user=user)
+    else:
+        profile = await sync_to_async(caching.profile_header)(request.user.id)
+        if profile is None:
+            profile, _ = await Profile.objects.aget_or_create(user=request.user)
+    profile_user = profile.user
+
+    posts, comments_by_post = await sync_to_async(caching.profile_posts)(profile_user.id)
+    liked_posts = await _liked_post_ids(request.user, profile_user.id)
+    is_following = await _is_following(request.user, profile_user)
+
+    return await arender(request, "accounts/profile.html", {
+        "profile_user": profile_user,
+        "profile": profile,
+        "posts": posts,
+        "follower_count": profile.follower_count,
+        "following_count": profile.following_count,
+        "total_posts": profile.post_count,
+        "liked_posts": liked_posts,
+        "comments_by_post": comments_by_post,
+        "form": ProfileForm(instance=profile) if request.user == profile_user else None,
+        "is_following": is_following,
+    })
+
+
+#search
+
+@resolve_user
+async def search_musicians(request):
+    query = request.GET.get("q", "")
+    instrument = request.GET.get("instrument", "")
+    location = request.GET.get("location", "")
+
+    # the MySQL backend reads its parser settings on first use
+    documents = await sync_to_async(search.matching_documents)(query, instrument=instrument, location=location)
+    page = await apaginate(documents, request.GET.get("page"), search.SEARCH_PAGE_SIZE)
+    instrument_facets = await search.afacets(Facet.INSTRUMENT)
+    location_facets = await search.afacets(Facet.LOCATION)
+    page.object_list = [document.profile for document in page.object_list]
+    await sync_to_async(follow_state_for(request.user).prime)(profile.user_id for profile in page.object_list)
+
+    return await arender(request, "accounts/search.html", {
+        "query": query,
+        "results": page.object_list,
+        "page_obj": page,
+        "instrument": instrument,
+        "location": location,
+        "instrument_facets": instrument_facets,
+        "location_facets": location_facets,
+    })
+
+
+#posts
+
+@login_required_async
+@async_condition(post_etag)
+@reads_only(views.view_post)
+async def view_post(request, post_id):
+    post = await aget_object_or_404(Post.objects.select_related("author__profile"), id=post_id)
+    # the newest comments; older ones are paged in from post_comments
+    comments_by_post = await Comment.objects.apreviews([post], POST_COMMENTS_PREVIEW)
+    attach_previews([post], comments_by_post)
+    comments = comments_by_post[post.id]
+    is_liked_by_user = await Like.objects.filter(post_id=post_id, user=request.user).aexists()
+
+    return await arender(request, "accounts/view_post.html", {
+        "post": post,
+        "comments": comments,
+        "comment_total": post.comment_total,
+        "comments_cursor": post.comments_cursor,
+        "is_liked_by_user": is_liked_by_user,
+        "comment_form": CommentForm(),
+    })
@@ -0,0 +1,169 @@
+"""
+In-process prefix autocomplete for usernames, instruments and locations.
+
+Each kind is a sorted array of lower-cased keys searched with bisect.
+The top-K results for every prefix that has been asked for are cached
+until an entry under that prefix changes, so a keystroke is a dict hit
+and never touches the database.
+
+Usernames are weighted by follower count, and instruments and locations
+by how many profiles use them (their Facet.profile_count). The index is
+refreshed incrementally from the Profile receivers in this process (a
+facet a profile leaves loses weight, and is dropped at zero; a deleted
+profile's username is dropped), and rebuilt every
+AUTOCOMPLETE_REFRESH_SECONDS so that other workers' writes show up too.
+
+The index lives in this process's memory, so builds run in a background
+thread here rather than as a queued job, which would fill another
+process's memory. No request waits for one: until the first build has
+finished suggestions are empty, and afterwards requests keep using the
+old index until the new one is swapped in.
+
+Each PrefixIndex guards its arrays with its own lock: receivers write to
+it from other request threads while searches are reading.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Facet, Profile
+
+TOP_K = 10
+MAX_CACHED_PREFIXES = 50000
+KINDS = ("username", "instrument", "location")
+
+
+def _key(text):
+    # the display form rides along so "Bob" and "bob" stay distinct entries
+    return f"{text.strip().lower()}\x00{text}"
+
+
+class PrefixIndex:
+    def __init__(self, items=()):
+        self._weights = {_key(text): (text, weight) for text, weight in items}
+        self._keys = sorted(self._weights)
+        self._top = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _invalidate(self, key):
+        normalized = key.split("\x00", 1)[0]
+        for end in range(len(normalized) + 1):
+            self._top.pop(normalized[:end], None)
+
+    def upsert(self, text, weight):
+        key = _key(text)
+        with self._lock:
+            if key not in self._weights:
+                insort(self._keys, key)
+            self._weights[key] = (text, weight)
+            self._invalidate(key)
+
+    def remove(self, text):
+        key = _key(text)
+        with self._lock:
+            if self._weights.pop(key, None) is None:
+                return
+            del self._keys[bisect_left(self._keys, key)]
+            self._invalidate(key)
+
+    def search(self, prefix, limit=TOP_K):
+        prefix = prefix.strip().lower()
+        top = self._top.get(prefix)
+        if top is None:
+            with self._lock:
+                lo = bisect_left(self._keys, prefix)
+                hi = bisect_left(self._keys, prefix + "\uffff", lo)
+                best = heapq.nlargest(TOP_K, self._keys[lo:hi], key=lambda key: self._weights[key][1])
+                top = [self._weights[key][0] for key in best]
+                if len(self._top) >= MAX_CACHED_PREFIXES:
+                    self._top.clear()
+                self._top[prefix] = top
+        return top[:limit]
+
+
+class Autocomplete:
+    def __init__(self):
+        self.indexes = {kind: PrefixIndex() for kind in KINDS}
+        self.usernames = {}
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def rebuild(self):
+        profiles = list(Profile.objects.values_list("user_id", "user__username", "follower_count").iterator())
+        facets = Facet.objects.filter(profile_count__gt=0).values_list("kind", "name", "profile_count")
+        by_kind = {Facet.INSTRUMENT: [], Facet.LOCATION: []}
+        for kind, name, count in facets.iterator():
+            by_kind[kind].append((name, count))
+
+        indexes = {
+            "username": PrefixIndex((username, followers) for _, username, followers in profiles),
+            "instrument": PrefixIndex(by_kind[Facet.INSTRUMENT]),
+            "location": PrefixIndex(by_kind[Facet.LOCATION]),
+        }
+        with self._lock:
+            self.indexes = indexes
+            self.usernames = {user_id: username for user_id, username, _ in profiles}
+            self.built_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Start a background build if there is no index yet, or it is stale."""
+        if self.built_at is not None and time.monotonic() - self.built_at <= settings.AUTOCOMPLETE_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="autocomplete-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.rebuild()
+        finally:
+            self._refreshing = False
+            connection.close()
+
+    def suggest(self, prefix, kinds=KINDS, limit=TOP_K):
+        self.ensure_fresh()
+        indexes = self.indexes
+        return {kind: indexes[kind].search(prefix, limit) for kind in kinds}
+
+    def _refresh_facets(self, facet_ids):
+        for facet in Facet.objects.filter(id__in=facet_ids):
+            if facet.profile_count > 0:
+                self.indexes[facet.kind].upsert(facet.name, facet.profile_count)
+            else:
+                self.indexes[facet.kind].remove(facet.name)
+
+    def profile_indexed(self, profile, facet_ids):
+        """Apply a profile save, which moved the counts of ``facet_ids``, to the live index."""
+        if self.built_at is None:
+            return
+        username = profile.user.username
+        with self._lock:
+            previous = self.usernames.get(profile.user_id)
+            if previous and previous != username:
+                self.indexes["username"].remove(previous)
+            self.usernames[profile.user_id] = username
+            self.indexes["username"].upsert(username, profile.follower_count)
+            self._refresh_facets(facet_ids)
+
+    def profile_removed(self, profile, facet_ids):
+        """Apply a profile delete, which moved the counts of ``facet_ids``, to the live index."""
+        if self.built_at is None:
+            return
+        with self._lock:
+            username = self.usernames.pop(profile.user_id, None)
+            if username:
+                self.indexes["username"].remove(username)
+            self._refresh_facets(facet_ids)
+
+
+autocomplete = Autocomplete()
@@ -0,0 +1,30 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+from . import caching
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the session's user (and profile) from the cache.
+
+    A password change or deactivation bumps the user's version in the
+    shared cache, so every worker reloads the user and checks the session
+    hash against the new password (see caching.session_user).
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # wrong credentials; stop here rather than let the plain
+            # ModelBackend listed after this one hash the password again
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        user = caching.session_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
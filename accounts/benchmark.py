@@ -0,0 +1,164 @@
+"""
+Benchmark harness for the main pages.
+
+Each scenario is a GET through Django's test client as one logged-in
+user. The client gives no network noise and no server to run, but it
+exercises the full middleware, view and template stack. For each page
+the harness records:
+- the query count, on the primary and the read replica together;
+- p50/p95/mean latency over the timed iterations;
+- the tracemalloc peak of one extra request (tracing is kept out of the
+  timed runs).
+
+It also records the distinct SQL the page ran, for ``index_advisor``.
+
+Results are a JSON-serializable dict, so a run can be saved as a
+baseline and compared with a later one across commits.
+"""
+import math
+import statistics
+import subprocess
+import time
+import tracemalloc
+from contextlib import ExitStack
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from chat.models import ChatThread
+from resonate.db import REPLICA
+
+from .models import Facet, Profile
+
+# compared between runs; for each of them larger is worse
+METRICS = ("queries", "p50_ms", "p95_ms", "peak_kib")
+
+
+def default_viewer():
+    """A user with both chat history and a home feed: one end of the busiest thread."""
+    thread = ChatThread.objects.order_by("-last_message_at").first()
+    if thread is not None:
+        return thread.user1
+    profile = Profile.objects.select_related("user").order_by("-following_count").first()
+    return profile.user if profile else None
+
+
+def scenarios(viewer):
+    """``{name: url}`` for the benchmarked pages, as seen by ``viewer``."""
+    urls = {"feed": reverse("accounts:feed")}
+
+    popular = Profile.objects.select_related("user").order_by("-follower_count").first()
+    if popular is not None:
+        urls["profile_view"] = reverse("accounts:profile_with_username", args=[popular.user.username])
+
+    facet = Facet.objects.filter(kind=Facet.INSTRUMENT).order_by("-profile_count").first()
+    urls["search_musicians"] = reverse("accounts:search_musicians") + "?" + urlencode(
+        {"q": facet.name if facet else "guitar"}
+    )
+
+    thread = (
+        ChatThread.objects.filter(Q(user1=viewer) | Q(user2=viewer))
+        .order_by("-last_message_at").first()
+    )
+    if thread is not None:
+        urls["thread_view"] = reverse("thread", args=[thread.id])
+    urls["inbox_view"] = reverse("inbox")
+    return urls
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def measure(client, url, iterations=30, warmup=3, cold=False):
+    for _ in range(warmup):
+        client.get(url)
+
+    aliases = [alias for alias in (DEFAULT_DB_ALIAS, REPLICA) if alias in connections]
+    timings, queries = [], []
+    for _ in range(iterations):
+        if cold:
+            cache.clear()
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases]
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(sum(len(context) for context in captured))
+
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        client.get(url)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "url": url,
+        "status": response.status_code,
+        "queries": max(queries),
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "peak_kib": round(peak / 1024, 1),
+        "sql": sorted({query["sql"] for context in captured for query in context.captured_queries}),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(viewer, iterations=30, warmup=3, cold=False, only=None):
+    client = Client()
+    client.force_login(viewer)
+    results = {}
+    for name, url in scenarios(viewer).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(client, url, iterations=iterations, warmup=warmup, cold=cold)
+    return {
+        "created_at": timezone.now().isoformat(),
+        "commit": _commit(),
+        "viewer": viewer.username,
+        "iterations": iterations,
+        "cold": cold,
+        "scenarios": results,
+    }
+
+
+def compare(baseline, current, threshold=10.0):
+    """
+    Rows of ``(scenario, metric, before, after, change %, regressed)``.
+    A metric regresses when it grows by more than ``threshold`` percent;
+    any increase in the query count counts as a regression.
+    """
+    rows = []
+    for name, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        for metric in METRICS:
+            old, new = before[metric], after[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            if metric == "queries":
+                regressed = new > old
+            else:
+                regressed = change > threshold
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
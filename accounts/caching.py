@@ -0,0 +1,306 @@
+"""
+Versioned caching for profile pages.
+
+Each cached object has a version in the cache: ``profile`` per user
+(profile and user fields plus the denormalized counters), ``posts`` per
+author (which posts they have), and ``post`` per post (its fields,
+counters and comments). A write invalidates by bumping a version (see the
+receivers in signals.py and the counter updates in counters.py).
+
+Every object has one slot per kind of entry (``card:post:7``), holding
+the value together with the version it was built from. A read whose
+version no longer matches rebuilds the entry and overwrites the slot, so
+the cache holds at most one entry per object rather than one per
+version. There are no pattern deletes.
+
+A bump stores a fresh random version rather than incrementing: ``incr``
+is a read followed by a write on the file backend, so two concurrent
+bumps could both land on the same number, and an entry built between
+them would look current after the second write. Random versions also
+mean an evicted version is replaced by one no entry was built from.
+
+Bumps take effect when the surrounding transaction commits (straight
+away outside one). A version moved before the commit could be read by
+another request that then builds from the old committed rows and stores
+them under the new version, where they would stay until the next write.
+
+Every version is read together with a ``site`` version and includes it.
+bump_all() moves that one after bulk writes that skip the per-object
+bumps (seeding, imports), which invalidates everything at once.
+
+The versions only reach other processes through a shared cache (Redis,
+or files on one host). With ``locmem`` each process sees only its own
+bumps; settings.py caps the timeouts in that case, and ``manage.py
+check`` warns when workers run out of process (checks.py).
+
+Entries are always built from the primary database (resonate.db.primary),
+so a lagging replica cannot store old data under a new version.
+"""
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from resonate.db import primary
+
+from .feed import attach_previews
+from .models import Comment, Post, Profile
+
+PROFILE = "profile"
+POSTS = "posts"
+POST = "post"
+SITE = "site"
+
+# latest comments kept on each post card; the rest are paged in from
+# post_comments, starting at each post's ``comments_cursor``
+CARD_COMMENTS = 3
+
+
+def _version_key(kind, pk):
+    return f"v:{kind}:{pk}"
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def versions(refs):
+    """Current version for each ``(kind, pk)`` in ``refs``, one cache round trip."""
+    keys = {ref: _version_key(*ref) for ref in refs}
+    site_key = _version_key(SITE, 0)
+    found = cache.get_many([site_key, *keys.values()])
+    for key in [site_key, *keys.values()]:
+        if key not in found:
+            cache.add(key, _new_version(), timeout=None)
+            found[key] = cache.get(key)
+    return {ref: f"{found[site_key]}.{found[key]}" for ref, key in keys.items()}
+
+
+def _set_version(kind, pk):
+    cache.set(_version_key(kind, pk), _new_version(), timeout=None)
+
+
+def bump(kind, pk):
+    transaction.on_commit(lambda: _set_version(kind, pk))
+
+
+def bump_all():
+    transaction.on_commit(lambda: _set_version(SITE, 0))
+
+
+def bump_profile(user_id):
+    bump(PROFILE, user_id)
+
+
+def bump_post(post_id, author_id=None):
+    bump(POST, post_id)
+    if author_id is not None:
+        bump(POSTS, author_id)
+
+
+def shared():
+    """Whether other processes see this process's bumps."""
+    return settings.CACHE_BACKEND != "locmem"
+
+
+def _slot(name, ref):
+    kind, pk = ref
+    return f"{name}:{kind}:{pk}"
+
+
+def _lookup(name, refs):
+    """
+    ``({ref: value}, {ref: version})``: the cached ``name`` entries that
+    were built at their ref's current version, and those versions, which
+    _store() needs for whatever the caller builds.
+    """
+    current = versions(refs)
+    found = cache.get_many([_slot(name, ref) for ref in refs])
+    hits = {}
+    for ref in refs:
+        entry = found.get(_slot(name, ref))
+        if entry is not None and entry[0] == current[ref]:
+            hits[ref] = entry[1]
+    return hits, current
+
+
+def _store(name, values, current, timeout):
+    """Cache ``{ref: value}``, each over its ref's slot, tagged with the version read before building."""
+    cache.set_many({_slot(name, ref): (current[ref], value) for ref, value in values.items()}, timeout)
+
+
+# profile header
+
+def profile_headers(user_ids):
+    """``{user id: Profile}`` with ``user`` loaded; users without a profile are left out."""
+    refs = [(PROFILE, user_id) for user_id in set(user_ids)]
+    found, current = _lookup("header", refs)
+    headers = {pk: profile for (_, pk), profile in found.items()}
+
+    missing = [pk for _, pk in refs if pk not in headers]
+    if missing:
+        with primary():
+            # the password hash stays out of the cache
+            profiles = Profile.objects.select_related("user").defer("user__password").filter(user_id__in=missing)
+            built = {profile.user_id: profile for profile in profiles}
+        _store("header", {(PROFILE, pk): profile for pk, profile in built.items()}, current,
+               settings.PROFILE_CACHE_TIMEOUT)
+        headers.update(built)
+    return headers
+
+
+def profile_header(user_id):
+    """The user's Profile with ``user`` loaded, or None if there is none."""
+    return profile_headers([user_id]).get(user_id)
+
+
+def profile_by_username(username):
+    """Like profile_header(), looked up by username."""
+    key = f"username:{username}"
+    user_id = cache.get(key)
+    if user_id is not None:
+        profile = profile_header(user_id)
+        if profile is not None and profile.user.username == username:
+            return profile
+        # the user was renamed or deleted since the id was cached
+
+    with primary():
+        user_id = Profile.objects.filter(user__username=username).values_list("user_id", flat=True).first()
+    if user_id is None:
+        cache.delete(key)
+        return None
+    cache.set(key, user_id, settings.PROFILE_CACHE_TIMEOUT)
+    return profile_header(user_id)
+
+
+def _session_entry(user):
+    """What session_user() caches for ``user``: every field but the password hash."""
+    fields = {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+    del fields["password"]
+    hashes = (user.get_session_auth_hash(), list(user.get_session_auth_fallback_hash()))
+    profile = getattr(user, "profile", None)
+    if profile is not None:
+        # it points back at this user, password and all
+        Profile._meta.get_field("user").delete_cached_value(profile)
+    return fields, profile, hashes
+
+
+def _session_user(entry):
+    """
+    The User a _session_entry() describes. Its password is deferred, so
+    check_password() loads it and save() leaves it alone, and the session
+    hashes come from the entry until it is loaded.
+    """
+    fields, profile, (session_hash, fallback_hashes) = entry
+    user = User.from_db(DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+    related = User._meta.get_field("profile")
+    related.set_cached_value(user, profile)
+    if profile is not None:
+        related.field.set_cached_value(profile, user)
+
+    def get_session_auth_hash():
+        if "password" in user.__dict__:
+            return User.get_session_auth_hash(user)
+        return session_hash
+
+    def get_session_auth_fallback_hash():
+        if "password" in user.__dict__:
+            return User.get_session_auth_fallback_hash(user)
+        return iter(fallback_hashes)
+
+    user.get_session_auth_hash = get_session_auth_hash
+    user.get_session_auth_fallback_hash = get_session_auth_fallback_hash
+    return user
+
+
+def session_user(user_id):
+    """
+    The User with ``profile`` joined, as the auth backend loads it on every
+    request. Cached under the ``profile`` version, so saving the user (a
+    password change included) or their profile loads a fresh copy. The
+    password hash is not cached, only the session hashes derived from it
+    (see _session_user).
+
+    A per-process cache would miss the bumps made by other workers, and
+    keep accepting a session its password change should have ended, so
+    then the user is read from the database every time.
+    """
+    if not shared():
+        with primary():
+            return User.objects.select_related("profile").filter(pk=user_id).first()
+    ref = (PROFILE, user_id)
+    found, current = _lookup("session", [ref])
+    entry = found.get(ref)
+    if entry is None:
+        with primary():
+            user = User.objects.select_related("profile").filter(pk=user_id).first()
+        if user is None:
+            return None
+        entry = _session_entry(user)
+        _store("session", {ref: entry}, current, settings.USER_CACHE_TIMEOUT)
+    return _session_user(entry)
+
+
+# posts
+
+@primary()
+def _build_cards(post_ids):
+    posts = Post.objects.in_bulk(post_ids)
+    comments_by_post = Comment.objects.previews(posts.values(), CARD_COMMENTS)
+    return {post_id: (post, comments_by_post[post_id]) for post_id, post in posts.items()}
+
+
+def _attach_users(instances, attribute):
+    """Point ``instance.<attribute>`` at cached profile headers instead of querying."""
+    user_ids = {getattr(instance, f"{attribute}_id") for instance in instances}
+    users = {user_id: profile.user for user_id, profile in profile_headers(user_ids).items()}
+    missing = user_ids - users.keys()
+    if missing:
+        users.update(User.objects.in_bulk(missing))
+    for instance in instances:
+        setattr(instance, attribute, users[getattr(instance, f"{attribute}_id")])
+
+
+def author_post_ids(author_id):
+    """Ids of the author's posts, newest first."""
+    ref = (POSTS, author_id)
+    found, current = _lookup("post-ids", [ref])
+    post_ids = found.get(ref)
+    if post_ids is None:
+        with primary():
+            post_ids = list(
+                Post.objects.filter(author_id=author_id).order_by("-created_at", "-id").values_list("id", flat=True)
+            )
+        _store("post-ids", {ref: post_ids}, current, settings.PROFILE_CACHE_TIMEOUT)
+    return post_ids
+
+
+def profile_posts(author_id):
+    """
+    The author's posts, newest first, and ``{post id: [latest comments]}``.
+
+    The id list is cached against the author's ``posts`` version and each
+    post card against its own ``post`` version, so one new like rebuilds
+    one card. Authors and commenters are filled in from their own profile
+    headers, so an avatar change does not have to touch every card. When
+    everything is cached it makes no queries.
+    """
+    post_ids = author_post_ids(author_id)
+    found, current = _lookup("card", [(POST, post_id) for post_id in post_ids])
+    cards = {pk: card for (_, pk), card in found.items()}
+
+    missing = [post_id for post_id in post_ids if post_id not in cards]
+    if missing:
+        built = _build_cards(missing)
+        _store("card", {(POST, pk): card for pk, card in built.items()}, current, settings.PROFILE_CACHE_TIMEOUT)
+        cards.update(built)
+
+    posts = [cards[post_id][0] for post_id in post_ids if post_id in cards]
+    comments_by_post = {post_id: cards[post_id][1] for post_id in post_ids if post_id in cards}
+    _attach_users(posts, "author")
+    _attach_users([comment for comments in comments_by_post.values() for comment in comments], "user")
+    attach_previews(posts, comments_by_post)
+    return posts, comments_by_post
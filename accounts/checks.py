@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # runworkers bumps cache versions after processing images and fanning
+    # out posts; with locmem those bumps never reach the web processes
+    if settings.CACHE_BACKEND == "locmem" and not settings.JOBS_RUN_INLINE:
+        return [Warning(
+            "CACHE_BACKEND=locmem is per process, so writes made by runworkers "
+            "or other web workers do not invalidate this process's cached pages.",
+            hint="Use CACHE_BACKEND=redis (or file on a single host), or run jobs "
+                 "inline with JOBS_RUN_INLINE=True for a single-process setup.",
+            id="accounts.W001",
+        )]
+    return []
@@ -0,0 +1,124 @@
+"""
+ETags for conditional GET (``django.views.decorators.http.condition``).
+
+Each ETag hashes the cache versions behind a page (see caching.py), so
+it can be computed without a render and with at most a couple of narrow
+queries. An unchanged page then answers ``304 Not Modified``.
+
+The hash also includes:
+- the viewer, since liked/following state differs per viewer;
+- the viewer's own profile version, which covers the navigation bar;
+- the CSRF cookie, which is embedded in the page's forms;
+- the full path, which covers cursors and query strings.
+
+No ETag is given for unsafe methods, or while flash messages are
+waiting, because the page that shows them must be rendered. Nor with a
+per-process cache (``caching.shared()``): another worker's write would
+not change this worker's versions, so it would answer 304 for a page
+that changed.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from . import caching
+from .feed import FEED_PAGE_SIZE, after_cursor
+from .models import Comment, Post
+
+
+def _etag(request, refs):
+    if request.method not in ("GET", "HEAD") or len(get_messages(request)) or not caching.shared():
+        return None
+    refs = list(refs) + [(caching.PROFILE, request.user.pk)]
+    found = caching.versions(refs)
+    parts = [
+        str(request.user.pk),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+        request.get_full_path(),
+    ] + [f"{kind}{pk}.{found[(kind, pk)]}" for kind, pk in refs]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def _commenter_ids(post_ids):
+    """Users who commented on ``post_ids``; their names and avatars are on the page."""
+    return set(Comment.objects.filter(post_id__in=post_ids).values_list("user_id", flat=True).distinct())
+
+
+def _profile_refs(user_id):
+    post_ids = caching.author_post_ids(user_id)
+    return [(caching.PROFILE, user_id), (caching.POSTS, user_id)] + [
+        (caching.POST, post_id) for post_id in post_ids
+    ] + [(caching.PROFILE, commenter_id) for commenter_id in sorted(_commenter_ids(post_ids) - {user_id})]
+
+
+def feed_etag(request):
+    """
+    Keyed on what the page shows: which posts (so a new or deleted one
+    changes it), each post's version (likes, comments, edits), and the
+    profiles of their authors and commenters.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    rows = list(
+        after_cursor(Post.objects.order_by("-created_at", "-id"), request.GET.get("cursor"))
+        .values_list("id", "author_id")[:FEED_PAGE_SIZE + 1]
+    )
+    post_ids = [post_id for post_id, _ in rows]
+    user_ids = {author_id for _, author_id in rows if author_id is not None} | _commenter_ids(post_ids)
+    return _etag(
+        request,
+        [(caching.POST, post_id) for post_id in post_ids] + [(caching.PROFILE, user_id) for user_id in sorted(user_ids)],
+    )
+
+
+def profile_etag(request, username=None):
+    if username:
+        profile = caching.profile_by_username(username)
+        if profile is None:
+            return None
+        user_id = profile.user_id
+    else:
+        user_id = request.user.pk
+    return _etag(request, _profile_refs(user_id))
+
+
+def musician_detail_etag(request, user_id):
+    return _etag(request, _profile_refs(user_id))
+
+
+def post_etag(request, post_id):
+    """Keyed on the post's version and the profiles of its author and commenters."""
+    if request.method not in ("GET", "HEAD"):
+        return None
+    author_id = Post.objects.filter(pk=post_id).values_list("author_id", flat=True).first()
+    if author_id is None:
+        return None
+    user_ids = {author_id} | _commenter_ids([post_id])
+    return _etag(request, [(caching.POST, post_id)] + [(caching.PROFILE, user_id) for user_id in sorted(user_ids)])
+
+
+def async_condition(etag_func):
+    """condition(etag_func=...) for async views.
+
+    Django's decorator calls the ETag function inline, and on a cache
+    miss these functions query the database. So here the function runs
+    in a worker thread.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ("GET", "HEAD"):
+                response.headers.setdefault("ETag", etag)
+            return response
+        return inner
+    return decorator
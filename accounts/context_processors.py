@@ -0,0 +1,5 @@
+from .follow_state import follow_state_for
+
+
+def follow_state(request):
+    return {"follow_state": follow_state_for(request.user)}
@@ -0,0 +1,132 @@
+"""
+Denormalized like/comment/follower/post counters.
+
+Views adjust the counter columns on Post and Profile with single atomic
+``F()`` updates as they write, so displaying a count is a column read.
+Anything that slips past them (admin deletes, cascades) is repaired by
+the ``reconcile_counters`` management command.
+
+Queryset updates send no signals, so each adjuster bumps the cache
+version of the row it changed itself (see caching.py).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import caching
+from .models import Comment, Follow, Like, Post, Profile
+
+
+def _adjust(queryset, field, delta):
+    if delta < 0:
+        # never let drift push a counter below zero
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def _adjust_and_read(queryset, field, delta):
+    """_adjust(), then the new value (None if the row is gone). The UPDATE
+    holds the row lock until commit, so the value read is this write's."""
+    with transaction.atomic():
+        _adjust(queryset, field, delta)
+        return queryset.values_list(field, flat=True).first()
+
+
+def post_commented(post_id, delta=1):
+    """Returns the post's new comment count."""
+    comment_count = _adjust_and_read(Post.objects.filter(pk=post_id), "comment_count", delta)
+    caching.bump_post(post_id)
+    return comment_count or 0
+
+
+def post_published(author_id, delta=1):
+    _adjust(Profile.objects.filter(user_id=author_id), "post_count", delta)
+    caching.bump_profile(author_id)
+
+
+def user_followed(follower_id, following_id, delta=1):
+    """Returns the followed user's new follower count."""
+    _adjust(Profile.objects.filter(user_id=follower_id), "following_count", delta)
+    follower_count = _adjust_and_read(Profile.objects.filter(user_id=following_id), "follower_count", delta)
+    caching.bump_profile(follower_id)
+    caching.bump_profile(following_id)
+    return follower_count or 0
+
+
+def set_liked(post_id, user_id, liked):
+    """Like or unlike idempotently and return the new like count, or None
+    if the post does not exist.
+
+    The counter moves by one only when the INSERT or DELETE changed a row,
+    so repeating a request, or racing a duplicate of it, changes nothing.
+    Saving or deleting the Like bumps the post's cache version (signals.py).
+    """
+    posts = Post.objects.filter(pk=post_id)
+    with transaction.atomic():
+        if liked:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(post_id=post_id, user_id=user_id)
+                delta = 1
+            except IntegrityError:
+                delta = 0  # already liked, or (without deferred constraints) the post is gone
+        else:
+            deleted, _ = Like.objects.filter(post_id=post_id, user_id=user_id).delete()
+            delta = -deleted
+
+        if delta:
+            like_count = _adjust_and_read(posts, "like_count", delta)
+        else:
+            like_count = posts.values_list("like_count", flat=True).first()
+        if like_count is None:
+            # the post is gone; don't leave a like pointing at it
+            transaction.set_rollback(True)
+        return like_count
+
+
+def follower_count(user):
+    return Profile.objects.filter(user=user).values_list("follower_count", flat=True).first() or 0
+
+
+# reconciliation
+
+def _actual(model, outer, ref="pk"):
+    counts = (
+        model.objects.filter(**{outer: OuterRef(ref)})
+        .order_by()
+        .values(outer)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def post_counts():
+    return {
+        "like_count": _actual(Like, "post"),
+        "comment_count": _actual(Comment, "post"),
+    }
+
+
+def profile_counts():
+    return {
+        "follower_count": _actual(Follow, "following", ref="user_id"),
+        "following_count": _actual(Follow, "follower", ref="user_id"),
+        "post_count": _actual(Post, "author", ref="user_id"),
+    }
+
+
+def reconcile(queryset, counts, dry_run=False):
+    """Recompute ``counts`` for the drifted rows of ``queryset``.
+
+    Returns the number of rows whose stored counters were wrong.
+    """
+    actual = {f"actual_{field}": expression for field, expression in counts.items()}
+    drift = Q()
+    for field in counts:
+        drift |= ~Q(**{field: F(f"actual_{field}")})
+
+    drifted = list(queryset.annotate(**actual).filter(drift).values_list("pk", flat=True))
+    if drifted and not dry_run:
+        queryset.model.objects.filter(pk__in=drifted).update(**counts)
+    return len(drifted)
@@ -0,0 +1,203 @@
+"""
+Feed engine: keyset (cursor) pagination over posts ordered by
+``(created_at, id)``.
+
+A page always costs the same number of queries regardless of its size:
+one for the posts (with the viewer's liked flag annotated in) and one
+windowed query for the latest comments of every post on the page
+(``Comment.objects.previews``).
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.files.storage import default_storage
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Post, Like, Comment
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 50
+FEED_COMMENTS_PER_POST = 3
+# comments shown on a post's own page, and per page of its full thread
+POST_COMMENTS_PREVIEW = 20
+COMMENTS_PAGE_SIZE = 50
+
+
+# cursors
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` for a cursor, or None if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def after_cursor(queryset, cursor, field="created_at", pk_field="id"):
+    """Restrict a newest-first queryset to the rows strictly after ``cursor``."""
+    position = decode_cursor(cursor)
+    if position is None:
+        return queryset
+    created_at, pk = position
+    return queryset.filter(
+        Q(**{f"{field}__lt": created_at}) | Q(**{field: created_at, f"{pk_field}__lt": pk})
+    )
+
+
+# queries
+
+class FeedPage:
+    def __init__(self, posts, comments_by_post, next_cursor):
+        self.posts = posts
+        self.comments_by_post = comments_by_post
+        self.next_cursor = next_cursor
+        attach_previews(posts, comments_by_post)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def clamp_page_size(page_size):
+    return max(1, min(page_size, FEED_MAX_PAGE_SIZE))
+
+
+def annotated_posts(viewer):
+    """Posts with their author and the viewer's liked flag."""
+    return Post.objects.select_related("author", "author__profile").annotate(
+        is_liked_by_user=Exists(Like.objects.filter(post=OuterRef("pk"), user=viewer)),
+    )
+
+
+def _trim(rows, page_size):
+    """Cut up to ``page_size + 1`` newest-first rows to a page and its next cursor."""
+    rows = list(rows)
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, None
+
+
+def build_page(posts, page_size, comments_per_post=FEED_COMMENTS_PER_POST):
+    """Turn up to ``page_size + 1`` newest-first posts into a FeedPage."""
+    posts, next_cursor = _trim(posts, page_size)
+    return FeedPage(posts, Comment.objects.previews(posts, comments_per_post), next_cursor)
+
+
+def _feed_posts(viewer, cursor, page_size):
+    posts = after_cursor(annotated_posts(viewer).order_by("-created_at", "-id"), cursor)
+    return posts[:page_size + 1]
+
+
+def get_feed_page(viewer, cursor=None, page_size=FEED_PAGE_SIZE, comments_per_post=FEED_COMMENTS_PER_POST):
+    page_size = clamp_page_size(page_size)
+    return build_page(_feed_posts(viewer, cursor, page_size), page_size, comments_per_post)
+
+
+def get_comment_page(post_id, cursor=None, page_size=COMMENTS_PAGE_SIZE):
+    """A post's comments, newest first, as ``(comments, next_cursor)``."""
+    page_size = clamp_page_size(page_size)
+    comments = after_cursor(
+        Comment.objects.filter(post_id=post_id).select_related("user__profile").order_by("-created_at", "-id"),
+        cursor,
+    )
+    return _trim(comments[:page_size + 1], page_size)
+
+
+def preview_cursor(comments, total):
+    """Cursor for the comments after a newest-first preview, or None if it shows them all."""
+    if not comments or len(comments) >= total:
+        return None
+    return encode_cursor(comments[-1].created_at, comments[-1].id)
+
+
+def attach_previews(posts, comments_by_post):
+    """
+    Set ``post.preview_comments``, the preview oldest first for templates
+    to iterate, and ``post.comments_cursor``, the post_comments cursor for
+    the comments it leaves out (None if it shows them all). The preview is
+    not the post's comments: counts come from ``post.comment_count``, and
+    ``post.comments`` still queries the whole thread.
+    """
+    for post in posts:
+        comments = comments_by_post.get(post.id, [])
+        post.preview_comments = comments[::-1]
+        post.comments_cursor = preview_cursor(comments, post.comment_total)
+
+
+async def aget_feed_page(viewer, cursor=None, page_size=FEED_PAGE_SIZE, comments_per_post=FEED_COMMENTS_PER_POST):
+    page_size = clamp_page_size(page_size)
+    posts, next_cursor = _trim([post async for post in _feed_posts(viewer, cursor, page_size)], page_size)
+    return FeedPage(posts, await Comment.objects.apreviews(posts, comments_per_post), next_cursor)
+
+
+# serialization
+# Images are served as their processed variants only; until those exist
+# the upload may still carry EXIF (GPS included), so it is left out.
+
+def _variant_url(variants, name):
+    variant = variants.get(name)
+    return default_storage.url(variant["jpeg"]) if variant else None
+
+
+def _variant_urls(variants):
+    return {
+        name: {key: value if key in ("width", "height") else default_storage.url(value) for key, value in variant.items()}
+        for name, variant in variants.items()
+    }
+
+
+def _avatar_url(user):
+    profile = getattr(user, "profile", None)
+    if profile is not None:
+        return _variant_url(profile.avatar_variants, "thumbnail")
+    return None
+
+
+def serialize_comment(comment):
+    return {
+        "id": comment.id,
+        "user": comment.user.username,
+        "avatar": _avatar_url(comment.user),
+        "text": comment.text,
+        "created_at": comment.created_at.isoformat(),
+    }
+
+
+def serialize_post(post, comments=()):
+    return {
+        "id": post.id,
+        "title": post.title,
+        "description": post.description,
+        "category": post.category,
+        "image": _variant_url(post.image_variants, "feed"),
+        "image_variants": _variant_urls(post.image_variants),
+        "created_at": post.created_at.isoformat(),
+        "author": {
+            "username": post.author.username,
+            "avatar": _avatar_url(post.author),
+        } if post.author else None,
+        "is_liked_by_user": post.is_liked_by_user,
+        "like_count": post.like_count,
+        "comment_count": post.comment_count,
+        "comments": [serialize_comment(comment) for comment in comments],
+        "comments_cursor": getattr(post, "comments_cursor", None),
+    }
+
+
+def serialize_page(page):
+    return {
+        "posts": [serialize_post(post, page.comments_by_post[post.id]) for post in page.posts],
+        "next_cursor": page.next_cursor,
+        "has_next": page.has_next,
+    }
@@ -0,0 +1,57 @@
+"""
+Batch-evaluated follow state.
+
+A FollowState answers "does the viewer follow X?" from memory. Views
+prime it with every user on the page, which costs one ``IN`` query, and
+templates read the answers through the ``is_following`` filter or the
+``follow_state`` context variable. It lives on the request's user
+object, so it lasts exactly one request.
+"""
+from .models import Follow
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+class FollowState:
+    def __init__(self, viewer):
+        self.viewer = viewer
+        self._following = {}
+
+    def prime(self, users):
+        """Resolve follow edges to all of ``users`` at once."""
+        if not self.viewer.is_authenticated:
+            return
+        wanted = {_user_id(user) for user in users} - self._following.keys()
+        if not wanted:
+            return
+        followed = set(
+            Follow.objects.filter(follower=self.viewer, following_id__in=wanted)
+            .values_list("following_id", flat=True)
+        )
+        for user_id in wanted:
+            self._following[user_id] = user_id in followed
+
+    def is_following(self, user):
+        if not self.viewer.is_authenticated:
+            return False
+        user_id = _user_id(user)
+        if user_id not in self._following:
+            self.prime([user_id])
+        return self._following[user_id]
+
+    # lets templates use the existing get_item filter: follow_state|get_item:user.id
+    get = is_following
+
+    def set(self, user, following):
+        """Record an edge that was just created or removed."""
+        self._following[_user_id(user)] = following
+
+
+def follow_state_for(viewer):
+    state = getattr(viewer, "_follow_state", None)
+    if state is None:
+        state = FollowState(viewer)
+        viewer._follow_state = state
+    return state
@@ -1,7 +1,10 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
+from django.db import transaction
+from jobs.queue import enqueue
 from django.contrib.auth.models import User
 from .models import Profile,Post,Comment
+from .tasks import PRIORITY_EMAIL
 
 class SignUpForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -10,6 +13,16 @@ class SignUpForm(UserCreationForm):
         model = User
         fields = ("username", "email", "password1", "password2")
 
+    def save(self, commit=True):
+        """Create the user and their profile together: one insert each, in one transaction."""
+        user = super().save(commit=False)
+        if commit:
+            with transaction.atomic():
+                user.save()
+                self.save_m2m()
+                Profile.objects.get_or_create(user=user)
+        return user
+
 class ProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
@@ -30,4 +43,23 @@ class CommentForm(forms.ModelForm):
 class EditProfileForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['avatar', 'bio']
\ No newline at end of file
+        fields = ['avatar', 'bio']
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """
+    Leaves building and sending the reset email to a worker. The job holds
+    the user id and template names only; the token and link are made when
+    it runs, so no live reset link sits in the jobs table.
+    """
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        enqueue("accounts.send_password_reset", {
+            "user_id": context["user"].pk,
+            "subject_template_name": subject_template_name,
+            "email_template_name": email_template_name,
+            "html_email_template_name": html_email_template_name,
+            "from_email": from_email,
+            "context": {key: context[key] for key in ("domain", "site_name", "protocol")},
+        }, priority=PRIORITY_EMAIL)
@@ -0,0 +1,317 @@
+"""
+Streaming NDJSON export and import of the social graph.
+
+The graph is users, profiles, follows, posts, likes, comments, chat
+threads, messages and read markers. Each row becomes one line:
+
+    {"model": "accounts.post", "fields": {"id": 7, "author_id": 3, ...}}
+
+Rows are written in dependency order, so the file can be loaded from top
+to bottom. Both directions hold one batch at a time: the export reads
+each table in primary key pages (``pk > last``), one query per page,
+since mysqlclient buffers a whole result set even behind ``iterator()``.
+The import groups consecutive lines of a model into ``bulk_create``
+batches, each in its own transaction.
+
+Those pages are separate queries, so the export runs inside snapshot(),
+one REPEATABLE READ transaction. Every page then sees the database as it
+was at the first read, and no row points at one added after its table
+was read. MySQL would otherwise read each page at Django's default READ
+COMMITTED.
+
+Primary keys are kept, so the target database must be empty or hold an
+earlier load of the same graph. A row already there with the same key,
+foreign keys and unique fields is skipped (``ignore_conflicts``), so an
+interrupted import can simply be run again. Anything else aborts the
+import with ValueError before the batch is written: a key taken by a
+different row (another user's id), or unique values (a username) held
+under another key. Users load first, so such a collision stops the
+import before any of their rows go in. After each batch the rows are
+counted, since MySQL's INSERT IGNORE also drops rows whose foreign keys
+point nowhere. A thread's ``last_message``
+points forward to a message, so it is left out of the export and
+recomputed once the messages are in.
+
+Exports contain password hashes; treat the files like a database dump.
+
+import_lines() is meant to run inside loading(), which mutes model
+signals and keeps the exported timestamps. Both patch process-wide
+state, so only the import_graph command uses it.
+"""
+import json
+import time
+from datetime import datetime
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import signals
+
+from chat.inbox import record_last_message
+from chat.models import ChatThread, Message, ThreadReadMarker
+
+from . import caching
+from .models import Comment, Follow, Like, Post, Profile
+from .synthetic import explicit_timestamps
+
+# in load order
+MODELS = [User, Profile, Follow, Post, Like, Comment, ChatThread, Message, ThreadReadMarker]
+# fields left out of the export, recomputed by the import
+EXCLUDED = {ChatThread: ["last_message"]}
+LABELS = {model._meta.label_lower: model for model in MODELS}
+
+# every model signal; nothing should react to rows being loaded
+MODEL_SIGNALS = [
+    signals.pre_init, signals.post_init, signals.pre_save, signals.post_save,
+    signals.pre_delete, signals.post_delete, signals.m2m_changed,
+]
+
+
+@contextmanager
+def muted(*signal_list):
+    """Disconnect every receiver of the given signals inside the block."""
+    saved = []
+    for signal in signal_list:
+        with signal.lock:
+            saved.append((signal, signal.receivers))
+            signal.receivers = []
+            signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            with signal.lock:
+                signal.receivers = receivers
+                signal.sender_receivers_cache.clear()
+
+
+class Encoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds; feed cursors need them exact
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class Progress:
+    """Row counts and rates per model, logged every ``every`` rows."""
+
+    def __init__(self, log, every=100000):
+        self.log = log
+        self.every = every
+        self.counts = {}
+
+    def start(self, label):
+        self.label = label
+        self.rows = self.reported = 0
+        self.started = time.monotonic()
+
+    def add(self, rows):
+        self.rows += rows
+        if self.rows - self.reported >= self.every:
+            self.report()
+
+    def report(self, final=False):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.log(f"{self.label}: {self.rows} rows{' (done)' if final else ''}, {self.rows / elapsed:,.0f}/s")
+        self.reported = self.rows
+
+    def finish(self):
+        self.report(final=True)
+        self.counts[self.label] = self.rows
+
+
+def fields_of(model):
+    excluded = EXCLUDED.get(model, [])
+    return [field.attname for field in model._meta.concrete_fields if field.name not in excluded]
+
+
+def querysets(prefix=None):
+    """``[(model, queryset)]`` in load order; with ``prefix``, only users named ``<prefix>...`` and rows among them."""
+    if not prefix:
+        return [(model, model.objects.all()) for model in MODELS]
+    users = User.objects.filter(username__startswith=prefix)
+    threads = ChatThread.objects.filter(user1__in=users, user2__in=users)
+    scoped = {
+        User: users,
+        Profile: Profile.objects.filter(user__in=users),
+        Follow: Follow.objects.filter(follower__in=users, following__in=users),
+        Post: Post.objects.filter(author__in=users),
+        Like: Like.objects.filter(user__in=users, post__author__in=users),
+        Comment: Comment.objects.filter(user__in=users, post__author__in=users),
+        ChatThread: threads,
+        Message: Message.objects.filter(thread__in=threads),
+        ThreadReadMarker: ThreadReadMarker.objects.filter(thread__in=threads),
+    }
+    return [(model, scoped[model]) for model in MODELS]
+
+
+@contextmanager
+def snapshot():
+    """A read-only REPEATABLE READ transaction, for export_lines() to page through."""
+    with transaction.atomic():
+        if connection.vendor in ("mysql", "postgresql"):
+            # must come before the transaction's first query; SQLite transactions are serializable already
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        yield
+
+
+def export_lines(prefix=None, chunk_size=2000, progress=None):
+    """Yield the graph as NDJSON lines, ``chunk_size`` rows per query; run it inside snapshot()."""
+    encoder = Encoder(separators=(",", ":"))
+    for model, queryset in querysets(prefix):
+        label = model._meta.label_lower
+        pk = model._meta.pk.attname
+        if progress:
+            progress.start(label)
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(page.order_by("pk").values(*fields_of(model))[:chunk_size])
+            for row in rows:
+                yield encoder.encode({"model": label, "fields": row}) + "\n"
+            if progress:
+                progress.add(len(rows))
+            if len(rows) < chunk_size:
+                break
+            last_pk = rows[-1][pk]
+        if progress:
+            progress.finish()
+
+
+def _parse(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            model = LABELS[record["model"]]
+            yield model, record["fields"]
+        except (ValueError, KeyError, TypeError) as error:
+            raise ValueError(f"Line {number}: not a graph record ({error!r})") from None
+
+
+def _batches(records, batch_size):
+    """Consecutive records of one model, ``batch_size`` at a time, as ``(model, [fields])``."""
+    batch, current = [], None
+    for model, fields in records:
+        if batch and (model is not current or len(batch) >= batch_size):
+            yield current, batch
+            batch = []
+        current = model
+        batch.append(fields)
+    if batch:
+        yield current, batch
+
+
+def _timestamp_fields():
+    return [
+        (model, field.name)
+        for model in MODELS
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+
+
+def relink_threads(batch_size=1000):
+    """Point threads without a ``last_message`` at their newest message."""
+    last_pk = 0
+    while ids := list(
+        ChatThread.objects.filter(pk__gt=last_pk, last_message__isnull=True)
+        .order_by("pk").values_list("pk", flat=True)[:batch_size]
+    ):
+        record_last_message(ids)
+        last_pk = ids[-1]
+
+
+@contextmanager
+def loading():
+    """Mute model signals and keep exported timestamps, for the whole process."""
+    with muted(*MODEL_SIGNALS), explicit_timestamps(*_timestamp_fields()):
+        yield
+
+
+def _unique_sets(model):
+    opts = model._meta
+    sets = [(field.attname,) for field in opts.concrete_fields if field.unique and not field.primary_key]
+    return sets + [tuple(opts.get_field(name).attname for name in names) for names in opts.unique_together]
+
+
+def _key_fields(model):
+    """The exported fields that say which row a record is: foreign keys and unique fields."""
+    names = {field.attname for field in model._meta.concrete_fields if field.is_relation}
+    for fields in _unique_sets(model):
+        names.update(fields)
+    return [name for name in fields_of(model) if name in names]
+
+
+def check_conflicts(model, batch):
+    """Raise ValueError if a record would be skipped in favour of a different existing row."""
+    label = model._meta.label_lower
+    pk = model._meta.pk.attname
+    by_pk = {record[pk]: record for record in batch}
+
+    key_fields = _key_fields(model)
+    for row in model.objects.filter(pk__in=by_pk).values(pk, *key_fields):
+        record = by_pk[row[pk]]
+        if any(record.get(name) != row[name] for name in key_fields):
+            raise ValueError(f"{label} {row[pk]} already exists and is a different row")
+
+    for fields in _unique_sets(model):
+        wanted = {tuple(record.get(name) for name in fields): record[pk] for record in batch}
+        # each field IN its values, then the exact combinations in Python
+        candidates = model.objects.filter(**{
+            f"{name}__in": {values[i] for values in wanted} for i, name in enumerate(fields)
+        })
+        for found_pk, *values in candidates.values_list(pk, *fields):
+            file_pk = wanted.get(tuple(values))
+            if file_pk is not None and file_pk != found_pk:
+                raise ValueError(
+                    f"{label} {file_pk}: {dict(zip(fields, values))} already belongs to {label} {found_pk}"
+                )
+
+
+def import_lines(lines, batch_size=1000, progress=None):
+    """
+    Load NDJSON lines written by export_lines(). Returns ``{label: rows
+    read}``; rows that already existed are counted but not written.
+    """
+    progress = progress or Progress(lambda message: None)
+    label = None
+    for model, batch in _batches(_parse(lines), batch_size):
+        if model._meta.label_lower != label:
+            if label is not None:
+                progress.finish()
+            label = model._meta.label_lower
+            progress.start(label)
+        check_conflicts(model, batch)
+        pks = {fields[model._meta.pk.attname] for fields in batch}
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    [model(**fields) for fields in batch], batch_size=batch_size, ignore_conflicts=True,
+                )
+                missing = len(pks) - model.objects.filter(pk__in=pks).count()
+                if missing:
+                    raise ValueError(f"{label}: {missing} rows were not written (do they refer to missing rows?)")
+        except IntegrityError as error:
+            # deferred foreign keys (SQLite, PostgreSQL) fail at commit instead
+            raise ValueError(f"{label}: {error}") from None
+        progress.add(len(batch))
+    if label is not None:
+        progress.finish()
+
+    relink_threads(batch_size)
+
+    # explicit keys leave PostgreSQL sequences behind; no-op elsewhere
+    statements = connection.ops.sequence_reset_sql(no_style(), MODELS)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    # nothing was bumped on the way in
+    caching.bump_all()
+    return progress.counts
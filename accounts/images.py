@@ -0,0 +1,171 @@
+"""
+Image pipeline for avatars and post images.
+
+What gets served are fixed-size variants (thumbnail, feed, full). Each
+one is auto-oriented from EXIF, re-encoded without any metadata, and
+written as WebP plus a JPEG fallback, and as AVIF too when Pillow has
+the codec. Once they exist, the upload itself, which may carry GPS and
+camera EXIF, is replaced by a full-size copy without metadata under
+``originals/``; that copy is the source for regenerating variants.
+Variant filenames carry a hash of their content, so they can be cached
+forever and identical outputs are stored once.
+
+The variant map is kept in ``Profile.avatar_variants`` and
+``Post.image_variants``, and rendered as a ``<picture>`` with ``srcset``
+by the ``responsive_image`` template tag.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from . import caching
+from .models import Post, Profile
+
+logger = logging.getLogger(__name__)
+
+# name -> (bounding box in px, crop to a square)
+AVATAR_VARIANTS = {"thumbnail": (96, True), "feed": (256, True), "full": (512, True)}
+POST_VARIANTS = {"thumbnail": (320, False), "feed": (960, False), "full": (1920, False)}
+# where metadata-free copies of the uploads go
+ORIGINALS = "originals"
+
+# format -> (file extension, Pillow save options), best first
+ENCODINGS = {
+    "avif": ("avif", {"quality": 60}),
+    "webp": ("webp", {"quality": 80, "method": 6}),
+    "jpeg": ("jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def available_formats():
+    return [fmt for fmt in ENCODINGS if fmt == "jpeg" or features.check(fmt)]
+
+
+def _flatten(image):
+    """RGB copy of ``image``; transparency is composited onto white."""
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _resize(image, size, crop):
+    if crop:
+        side = min(size, *image.size)
+        return ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return resized
+
+
+def _store(image, fmt, folder, name):
+    extension, options = ENCODINGS[fmt]
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **options)
+    data = buffer.getvalue()
+
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    path = f"variants/{folder}/{digest}.{name}.{extension}"
+    if not default_storage.exists(path):
+        # another worker may have taken the name meanwhile; the storage
+        # then picks a free one
+        path = default_storage.save(path, ContentFile(data))
+    return path
+
+
+def _open(field_file):
+    """The upload, auto-oriented and flattened to RGB, or None if it is not a readable image."""
+    try:
+        field_file.open("rb")
+        with Image.open(field_file) as source:
+            return _flatten(ImageOps.exif_transpose(source))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("Could not process image %s", field_file.name, exc_info=True)
+        return None
+    finally:
+        field_file.close()
+
+
+def _strip_original(field_file, image, folder):
+    """Store ``image`` as a metadata-free copy of the upload; returns its name."""
+    if field_file.name.startswith(f"{ORIGINALS}/"):
+        return field_file.name  # already replaced
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    stem = field_file.name.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    return default_storage.save(f"{ORIGINALS}/{folder}/{stem}.jpg", ContentFile(buffer.getvalue()))
+
+
+def generate_variants(field_file, specs, folder, image=None):
+    """
+    Build every variant in ``specs`` for an uploaded image. Returns
+    ``{name: {"width", "height", <format>: storage path, ...}}``, or an
+    empty dict if the file cannot be read as an image.
+    """
+    if image is None:
+        image = _open(field_file)
+    if image is None:
+        return {}
+
+    formats = available_formats()
+    variants = {}
+    for name, (size, crop) in specs.items():
+        resized = _resize(image, size, crop)
+        variant = {"width": resized.width, "height": resized.height}
+        for fmt in formats:
+            variant[fmt] = _store(resized, fmt, folder, name)
+        variants[name] = variant
+    return variants
+
+
+def _process(field_file, specs, folder):
+    """``(variants, name)``: the upload's variants and the name of its stripped replacement."""
+    image = _open(field_file) if field_file else None
+    if image is None:
+        return {}, field_file.name
+    return generate_variants(field_file, specs, folder, image), _strip_original(field_file, image, folder)
+
+
+def _replace(queryset, field, old_name, variants, name):
+    """
+    Point ``field`` at ``name`` and ``<field>_variants`` at ``variants``
+    on the row in ``queryset``, as long as it still holds ``old_name``,
+    the upload that was processed. Returns whether it did.
+
+    If the upload was replaced in the meantime (an edit, or a newer job
+    for the same row) the row is left to the newer upload's own job, and
+    only the copy made here is thrown away. Variants are shared by
+    content, so they stay.
+    """
+    updated = queryset.filter(**{field: old_name}).update(**{f"{field}_variants": variants, field: name})
+    stale = old_name if updated else name
+    if stale and old_name != name:
+        default_storage.delete(stale)
+    return bool(updated)
+
+
+def process_post_image(post):
+    old_name = post.image.name
+    variants, name = _process(post.image, POST_VARIANTS, "posts")
+    if _replace(Post.objects.filter(pk=post.pk), "image", old_name, variants, name):
+        caching.bump_post(post.pk)
+        post.image_variants = variants
+        post.image.name = name
+    return variants
+
+
+def process_avatar(profile):
+    old_name = profile.avatar.name
+    variants, name = _process(profile.avatar, AVATAR_VARIANTS, "avatars")
+    # update() rather than save(): a re-save would re-run the profile receivers
+    if _replace(Profile.objects.filter(pk=profile.pk), "avatar", old_name, variants, name):
+        caching.bump_profile(profile.user_id)
+        profile.avatar_variants = variants
+        profile.avatar.name = name
+    return variants
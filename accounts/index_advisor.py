@@ -0,0 +1,124 @@
+"""
+EXPLAIN the SQL a benchmark run captured and flag the plans that do not
+use an index the way they should.
+
+accounts.benchmark stores each page's distinct statements under "sql".
+Each SELECT is explained on the current database, and the plan is
+checked for:
+- full table scans: ``SCAN t`` on SQLite, ``type=ALL`` on MySQL,
+  ``Seq Scan`` on PostgreSQL;
+- sorts that no index satisfies: ``USE TEMP B-TREE FOR ORDER BY``,
+  ``Using filesort`` or a ``Sort`` node.
+
+A scan of a tiny table is cheap, so run this against seeded data
+(seed_synthetic). Otherwise the planner may rightly ignore the indexes.
+"""
+import re
+
+from django.db import connection
+
+_SELECT = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+class UnsupportedDatabase(ValueError):
+    pass
+
+
+class SQLitePlans:
+    explain_prefix = "EXPLAIN QUERY PLAN "
+    _scan = re.compile(r"^SCAN (?!CONSTANT ROW)(\w+)\b(?! USING)")
+
+    def lines(self, rows):
+        return [row[-1] for row in rows]
+
+    def issues(self, lines):
+        found = []
+        for line in lines:
+            scan = self._scan.match(line.strip())
+            if scan:
+                found.append(f"full scan of {scan.group(1)}")
+            if "TEMP B-TREE FOR ORDER BY" in line or "TEMP B-TREE FOR RIGHT PART OF ORDER BY" in line:
+                found.append("sort without an index")
+        return found
+
+
+class MySQLPlans:
+    explain_prefix = "EXPLAIN "
+
+    def lines(self, rows):
+        # id, select_type, table, partitions, type, possible_keys, key, key_len, ref, rows, filtered, Extra
+        return [
+            f"{row[2]}: type={row[4]} key={row[6]} rows={row[9]} {row[11] or ''}".strip()
+            for row in rows
+        ]
+
+    def issues(self, lines):
+        found = []
+        for line in lines:
+            table = line.split(":", 1)[0]
+            if " type=ALL " in line:
+                found.append(f"full scan of {table}")
+            if "Using filesort" in line:
+                found.append(f"filesort on {table}")
+        return found
+
+
+class PostgreSQLPlans:
+    explain_prefix = "EXPLAIN "
+    _seq_scan = re.compile(r"Seq Scan on (\w+)")
+
+    def lines(self, rows):
+        return [row[0] for row in rows]
+
+    def issues(self, lines):
+        found = []
+        for line in lines:
+            scan = self._seq_scan.search(line)
+            if scan:
+                found.append(f"full scan of {scan.group(1)}")
+            if re.match(r"\s*(->\s*)?(Incremental )?Sort\b", line):
+                found.append("sort without an index")
+        return found
+
+
+PLANS = {
+    "sqlite": SQLitePlans,
+    "mysql": MySQLPlans,
+    "postgresql": PostgreSQLPlans,
+}
+
+
+def get_plans():
+    try:
+        return PLANS[connection.vendor]()
+    except KeyError:
+        raise UnsupportedDatabase(f"No EXPLAIN support for {connection.vendor}") from None
+
+
+def explain(sql, plans=None):
+    """The plan of ``sql`` as text lines."""
+    plans = plans or get_plans()
+    with connection.cursor() as cursor:
+        cursor.execute(plans.explain_prefix + sql)
+        return plans.lines(cursor.fetchall())
+
+
+def advise(results, ignore=()):
+    """
+    ``{scenario: [(sql, issues, plan)]}`` for the statements in a benchmark
+    result whose plans have issues. Issues naming a table in ``ignore``
+    are dropped.
+    """
+    plans = get_plans()
+    report = {}
+    for name, scenario in results["scenarios"].items():
+        flagged = []
+        for sql in scenario.get("sql", []):
+            if not _SELECT.match(sql):
+                continue
+            plan = explain(sql, plans)
+            issues = [issue for issue in dict.fromkeys(plans.issues(plan)) if issue.split()[-1] not in ignore]
+            if issues:
+                flagged.append((sql, issues, plan))
+        report[name] = flagged
+    return report
@@ -0,0 +1,32 @@
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+
+from accounts.images import process_avatar, process_post_image
+from accounts.models import Post, Profile
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for existing avatars and post images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Regenerate variants that already exist.")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)
+        profiles = Profile.objects.exclude(avatar="").exclude(avatar__isnull=True)
+        if not options["force"]:
+            posts = posts.filter(image_variants={})
+            profiles = profiles.filter(avatar_variants={})
+
+        done = failed = 0
+        for obj, process in chain(
+            ((post, process_post_image) for post in posts.iterator()),
+            ((profile, process_avatar) for profile in profiles.iterator()),
+        ):
+            if process(obj):
+                done += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} images ({failed} unreadable)."))
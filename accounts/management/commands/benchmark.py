@@ -0,0 +1,66 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from accounts import benchmark
+
+
+class Command(BaseCommand):
+    help = "Measure query count, latency and peak memory of the main pages (see accounts/benchmark.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--cold", action="store_true", help="Clear the cache before every request.")
+        parser.add_argument("--user", help="Username to browse as (default: picked from the data).")
+        parser.add_argument("--only", action="append", help="Run only this scenario (repeatable).")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Baseline JSON file to compare the results with.")
+        parser.add_argument("--threshold", type=float, default=10.0, help="Allowed slowdown in percent.")
+        parser.add_argument(
+            "--fail-on-regression", action="store_true",
+            help="Exit non-zero if --compare finds a regression.",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            viewer = User.objects.filter(username=options["user"]).first()
+            if viewer is None:
+                raise CommandError(f"No user named {options['user']!r}.")
+        else:
+            viewer = benchmark.default_viewer()
+            if viewer is None:
+                raise CommandError("No users to browse as; run seed_synthetic first.")
+
+        # the test client talks to "testserver"; budgets should be reported, not raised
+        with override_settings(ALLOWED_HOSTS=["testserver"], QUERY_BUDGET_RAISE=False):
+            results = benchmark.run(
+                viewer, iterations=options["iterations"], warmup=options["warmup"],
+                cold=options["cold"], only=options["only"],
+            )
+
+        self.stdout.write(f"{'scenario':<18}{'status':>7}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>11}")
+        for name, result in results["scenarios"].items():
+            self.stdout.write(
+                f"{name:<18}{result['status']:>7}{result['queries']:>9}"
+                f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['peak_kib']:>11.1f}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"]) as baseline_file:
+                baseline = json.load(baseline_file)
+            rows = benchmark.compare(baseline, results, threshold=options["threshold"])
+            regressions = [row for row in rows if row[5]]
+            self.stdout.write(f"\nAgainst {options['compare']} ({baseline.get('commit') or 'unknown commit'}):")
+            for name, metric, old, new, change, regressed in rows:
+                style = self.style.ERROR if regressed else self.style.SUCCESS
+                self.stdout.write(style(f"  {name:<18}{metric:<10}{old:>10}{new:>10}{change:>+9.1f}%"))
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} metrics regressed.")
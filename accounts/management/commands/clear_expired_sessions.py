@@ -0,0 +1,35 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in batches, without one long table lock like clearsessions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to pause between batches.")
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not issubclass(store, DatabaseSessionStore):
+            # cache and signed-cookie sessions expire on their own
+            self.stdout.write(f"{settings.SESSION_ENGINE} keeps no session rows; nothing to clear.")
+            return
+
+        sessions = store.get_model_class().objects
+        now = timezone.now()
+        deleted = 0
+        while keys := list(
+            sessions.filter(expire_date__lt=now).values_list("session_key", flat=True)[:options["batch_size"]]
+        ):
+            deleted += sessions.filter(session_key__in=keys).delete()[0]
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{deleted} deleted")
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions."))
@@ -0,0 +1,37 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand
+
+from accounts.graph_io import Progress, export_lines, snapshot
+
+
+def open_output(path):
+    if path == "-":
+        return sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+class Command(BaseCommand):
+    help = "Stream the social graph (users to chat messages) to an NDJSON file (see accounts/graph_io.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="File to write; '.gz' compresses, '-' writes to stdout.")
+        parser.add_argument("--prefix", help="Only users whose username starts with this, and rows among them.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per query.")
+        parser.add_argument("--progress-every", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        # progress goes to stderr, so the data can go to stdout
+        progress = Progress(self.stderr.write, every=options["progress_every"])
+        output = open_output(options["output"])
+        try:
+            with snapshot():
+                output.writelines(export_lines(options["prefix"], options["chunk_size"], progress))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(f"Exported {sum(progress.counts.values())} rows."))
@@ -0,0 +1,54 @@
+import gzip
+import sys
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.graph_io import Progress, import_lines, loading
+
+
+def open_input(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load an NDJSON graph written by export_graph into an empty database. Rows from an earlier run "
+        "of the same file are skipped; keys or usernames taken by other rows abort the import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="File to read; '.gz' is decompressed, '-' reads stdin.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk insert and transaction.")
+        parser.add_argument("--progress-every", type=int, default=100000)
+        parser.add_argument(
+            "--skip-derived", action="store_true",
+            help="Do not reconcile counters or rebuild the search index and home timelines afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        progress = Progress(self.stdout.write, every=options["progress_every"])
+        started = time.monotonic()
+        source = open_input(options["input"])
+        try:
+            with loading():
+                counts = import_lines(source, batch_size=options["batch_size"], progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        if not options["skip_derived"]:
+            call_command("reconcile_counters", stdout=self.stdout)
+            call_command("rebuild_search_index", stdout=self.stdout)
+            call_command("rebuild_timelines", stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {sum(counts.values())} rows in {time.monotonic() - started:.1f}s."
+        ))
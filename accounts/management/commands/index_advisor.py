@@ -0,0 +1,71 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from accounts import benchmark, index_advisor
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the SQL of a benchmark run and report full scans and unindexed sorts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--input", help="Benchmark JSON (benchmark --output) to read instead of running one.")
+        parser.add_argument("--user", help="Username to browse as when running the pages (default: picked from the data).")
+        parser.add_argument("--only", action="append", help="Check only this scenario (repeatable).")
+        parser.add_argument(
+            "--ignore", action="append", default=[],
+            help="Table whose scans are expected, e.g. a small lookup table (repeatable).",
+        )
+        parser.add_argument("--fail-on-issue", action="store_true", help="Exit non-zero if any plan has an issue.")
+
+    def handle(self, *args, **options):
+        # before running any pages
+        try:
+            index_advisor.get_plans()
+        except index_advisor.UnsupportedDatabase as error:
+            raise CommandError(str(error))
+
+        if options["input"]:
+            with open(options["input"]) as input_file:
+                results = json.load(input_file)
+            if options["only"]:
+                results["scenarios"] = {
+                    name: scenario for name, scenario in results["scenarios"].items() if name in options["only"]
+                }
+        else:
+            results = self.capture(options)
+
+        report = index_advisor.advise(results, ignore=set(options["ignore"]))
+
+        flagged = 0
+        for name, statements in report.items():
+            if not statements:
+                self.stdout.write(self.style.SUCCESS(f"{name}: ok"))
+                continue
+            self.stdout.write(self.style.WARNING(f"{name}: {len(statements)} statements"))
+            for sql, issues, plan in statements:
+                flagged += 1
+                self.stdout.write(f"  {', '.join(issues)}")
+                self.stdout.write(f"    {sql[:200]}")
+                if options["verbosity"] > 1:
+                    for line in plan:
+                        self.stdout.write(f"      {line}")
+
+        if flagged and options["fail_on_issue"]:
+            raise CommandError(f"{flagged} statements have plan issues.")
+
+    def capture(self, options):
+        if options["user"]:
+            viewer = User.objects.filter(username=options["user"]).first()
+            if viewer is None:
+                raise CommandError(f"No user named {options['user']!r}.")
+        else:
+            viewer = benchmark.default_viewer()
+            if viewer is None:
+                raise CommandError("No users to browse as; run seed_synthetic first.")
+
+        # one cold request per page, so cache misses show the queries behind them
+        with override_settings(ALLOWED_HOSTS=["testserver"], QUERY_BUDGET_RAISE=False):
+            return benchmark.run(viewer, iterations=1, warmup=0, cold=True, only=options["only"])
@@ -0,0 +1,70 @@
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = ("max_queries", "avg_queries", "max_db_ms", "avg_db_ms", "requests", "violations", "n_plus_one")
+
+
+class Command(BaseCommand):
+    help = "Summarize the per-view query log written by QueryBudgetMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default=settings.QUERY_REPORT_FILE, help="Report file to read.")
+        parser.add_argument("--sort", choices=SORT_KEYS, default="max_queries")
+        parser.add_argument("--clear", action="store_true", help="Truncate the report file afterwards.")
+        parser.add_argument(
+            "--fail-on-violation", action="store_true",
+            help="Exit non-zero if any view exceeded its budget or looked like an N+1.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if not path or not os.path.exists(path):
+            raise CommandError("No query report found; set QUERY_REPORT_FILE and exercise the site first.")
+
+        views = defaultdict(lambda: {
+            "requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0, "max_db_ms": 0.0,
+            "violations": 0, "n_plus_one": 0, "budget": None, "shapes": defaultdict(int),
+        })
+        with open(path) as report:
+            for line in report:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                view = views[entry["view"]]
+                view["requests"] += 1
+                view["queries"] += entry["queries"]
+                view["max_queries"] = max(view["max_queries"], entry["queries"])
+                view["db_ms"] += entry["db_ms"]
+                view["max_db_ms"] = max(view["max_db_ms"], entry["db_ms"])
+                view["violations"] += entry["over_budget"]
+                view["n_plus_one"] += bool(entry["repeated"])
+                view["budget"] = entry["budget"]
+                for repeat in entry["repeated"]:
+                    view["shapes"][repeat["shape"]] = max(view["shapes"][repeat["shape"]], repeat["count"])
+
+        for view in views.values():
+            view["avg_queries"] = view["queries"] / view["requests"]
+            view["avg_db_ms"] = view["db_ms"] / view["requests"]
+
+        rows = sorted(views.items(), key=lambda item: item[1][options["sort"]], reverse=True)
+        self.stdout.write(
+            f"{'view':40} {'reqs':>6} {'avg q':>7} {'max q':>6} {'budget':>6} {'avg ms':>8} {'max ms':>8} {'over':>5} {'n+1':>5}"
+        )
+        for name, view in rows:
+            self.stdout.write(
+                f"{name[:40]:40} {view['requests']:>6} {view['avg_queries']:>7.1f} {view['max_queries']:>6} "
+                f"{view['budget'] or '-':>6} {view['avg_db_ms']:>8.2f} {view['max_db_ms']:>8.2f} "
+                f"{view['violations']:>5} {view['n_plus_one']:>5}"
+            )
+            for shape, count in sorted(view["shapes"].items(), key=lambda item: -item[1]):
+                self.stdout.write(self.style.WARNING(f"    {count}x {shape[:150]}"))
+
+        if options["clear"]:
+            open(path, "w").close()
+
+        if options["fail_on_violation"] and any(v["violations"] or v["n_plus_one"] for v in views.values()):
+            raise CommandError("Query budget violations or N+1 patterns found.")
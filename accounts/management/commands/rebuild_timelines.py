@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from accounts.timeline import celebrity_ids, rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's materialized home timeline from Follow edges."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this username's timeline.")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("id")
+        if options["user"]:
+            users = users.filter(username=options["user"])
+
+        celebrities = celebrity_ids()
+        rebuilt = entries = 0
+        for user in users.iterator():
+            entries += rebuild_timeline(user, celebrities)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rebuilt} timelines ({entries} entries, {len(celebrities)} authors read on demand)."
+        ))
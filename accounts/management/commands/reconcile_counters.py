@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from accounts.counters import post_counts, profile_counts, reconcile
+from accounts.models import Post, Profile
+
+
+class Command(BaseCommand):
+    help = "Repair drift in the denormalized like/comment/follower/post counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it.")
+
+    def handle(self, *args, **options):
+        for model, counts in ((Post, post_counts()), (Profile, profile_counts())):
+            fixed = self.reconcile_model(model, counts, options["batch_size"], options["dry_run"])
+            verb = "would fix" if options["dry_run"] else "fixed"
+            self.stdout.write(f"{model.__name__}: {verb} {fixed} rows")
+
+        self.stdout.write(self.style.SUCCESS("Counters reconciled."))
+
+    def reconcile_model(self, model, counts, batch_size, dry_run):
+        # walk primary-key ranges so each batch is a bounded index range scan
+        fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size]
+            )
+            if not batch:
+                return fixed
+            fixed += reconcile(
+                model.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]), counts, dry_run=dry_run
+            )
+            last_pk = batch[-1]
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.synthetic import DEFAULT_PREFIX, TIMESTAMP_FIELDS, GraphSeeder, clear, explicit_timestamps
+
+
+class Command(BaseCommand):
+    help = "Generate a power-law social graph of synthetic users for load tests and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--follows", type=float, default=20, help="Mean accounts followed per user.")
+        parser.add_argument("--posts", type=float, default=5, help="Mean posts per user.")
+        parser.add_argument("--likes", type=float, default=8, help="Mean likes per post.")
+        parser.add_argument("--comments", type=float, default=2, help="Mean comments per post.")
+        parser.add_argument("--threads", type=float, default=2, help="Mean chat threads started per user.")
+        parser.add_argument("--messages", type=float, default=20, help="Mean messages per chat thread.")
+        parser.add_argument("--alpha", type=float, default=1.1, help="Power-law exponent of popularity.")
+        parser.add_argument("--seed", type=int, help="Random seed, for a reproducible graph.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--prefix", default=DEFAULT_PREFIX, help="Username prefix of the generated users (named <prefix>~<n>).",
+        )
+        parser.add_argument("--clear", action="store_true", help="Delete earlier users with this prefix first.")
+        parser.add_argument(
+            "--skip-derived", action="store_true",
+            help="Do not rebuild the search index and home timelines afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            try:
+                self.stdout.write(f"Deleted {clear(options['prefix'])} rows.")
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        seeder = GraphSeeder(
+            users=options["users"], follows=options["follows"], posts=options["posts"],
+            likes=options["likes"], comments=options["comments"], threads=options["threads"],
+            messages=options["messages"], alpha=options["alpha"], seed=options["seed"],
+            batch_size=options["batch_size"], prefix=options["prefix"], log=self.stdout.write,
+        )
+        started = time.monotonic()
+        try:
+            # backdated timestamps; patches the model fields, so only here
+            with explicit_timestamps(*TIMESTAMP_FIELDS):
+                seeder.seed()
+        except ValueError as exc:
+            raise CommandError(f"{exc} (use --clear)")
+
+        if not options["skip_derived"]:
+            call_command("rebuild_search_index", stdout=self.stdout)
+            call_command("rebuild_timelines", stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['users']} users in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,140 @@
+"""
+Per-request SQL accounting.
+
+QueryBudgetMiddleware counts the queries and DB time of every request
+through ``connection.execute_wrapper``, fingerprints query shapes to spot
+N+1 loops, and checks the count against the per-URL-name QUERY_BUDGETS.
+Violations are logged, or raised when QUERY_BUDGET_RAISE is on (tests).
+With QUERY_REPORT_FILE set, one JSON line per request is appended there
+for the ``query_report`` management command to summarize.
+
+The middleware is sync and async capable. Under ASGI, the ORM runs on
+the request's thread-sensitive worker thread, whose connections are not
+the event loop's, so the wrappers are installed and removed there.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Reduce a statement to its shape: literals and IN-lists collapsed."""
+    shape = _STRING.sub("?", sql)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """An execute_wrapper that tallies count, time and shape of each query."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def budget_for(view_name):
+    budget = settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+    return budget or None
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        with ExitStack() as stack:
+            self.watch(stack, stats)
+            response = self.get_response(request)
+        return self.check(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            await sync_to_async(self.watch)(stack, stats)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        return self.check(request, response, stats)
+
+    def watch(self, stack, stats):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+
+    def check(self, request, response, stats):
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        repeated = stats.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        budget = budget_for(view_name)
+        over_budget = budget is not None and stats.count > budget
+
+        if settings.QUERY_REPORT_FILE:
+            self.record(request, view_name, stats, repeated, budget, over_budget)
+
+        if repeated:
+            logger.warning(
+                "Possible N+1 in %s: %s",
+                view_name or request.path,
+                "; ".join(f"{n}x {shape[:120]}" for shape, n in repeated),
+            )
+        if over_budget:
+            message = f"{view_name} ran {stats.count} queries (budget {budget})"
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+    def record(self, request, view_name, stats, repeated, budget, over_budget):
+        line = {
+            "view": view_name or request.path,
+            "method": request.method,
+            "path": request.path,
+            "queries": stats.count,
+            "db_ms": round(stats.duration * 1000, 3),
+            "budget": budget,
+            "over_budget": over_budget,
+            "repeated": [{"shape": shape, "count": n} for shape, n in repeated],
+        }
+        with open(settings.QUERY_REPORT_FILE, "a") as report:
+            report.write(json.dumps(line) + "\n")
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:54
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(model, outer, ref="pk"):
+    counts = (
+        model.objects.filter(**{outer: OuterRef(ref)})
+        .order_by()
+        .values(outer)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model("accounts", "Post")
+    Profile = apps.get_model("accounts", "Profile")
+    Like = apps.get_model("accounts", "Like")
+    Comment = apps.get_model("accounts", "Comment")
+    Follow = apps.get_model("accounts", "Follow")
+
+    Post.objects.update(
+        like_count=_count(Like, "post"),
+        comment_count=_count(Comment, "post"),
+    )
+    Profile.objects.update(
+        follower_count=_count(Follow, "following", ref="user_id"),
+        following_count=_count(Follow, "follower", ref="user_id"),
+        post_count=_count(Post, "author", ref="user_id"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
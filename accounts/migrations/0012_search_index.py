@@ -0,0 +1,72 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Vendor-specific full-text indexes over accounts_searchdocument; see accounts.search.
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "mysql":
+        schema_editor.execute(
+            "CREATE FULLTEXT INDEX accounts_searchdocument_ft "
+            "ON accounts_searchdocument (username, instrument, location, bio)"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE accounts_searchdocument_fts USING fts5("
+            "username, instrument, location, bio, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # weight username and instrument hits above location and bio hits
+        schema_editor.execute(
+            "INSERT INTO accounts_searchdocument_fts (accounts_searchdocument_fts, rank) "
+            "VALUES ('rank', 'bm25(10.0, 5.0, 2.0, 1.0)')"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "mysql":
+        schema_editor.execute("DROP INDEX accounts_searchdocument_ft ON accounts_searchdocument")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE accounts_searchdocument_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Facet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('instrument', 'Instrument'), ('location', 'Location')], max_length=20)),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100)),
+                ('profile_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-profile_count', 'name'],
+                'unique_together': {('kind', 'slug')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('instrument', models.CharField(blank=True, max_length=100)),
+                ('location', models.CharField(blank=True, max_length=100)),
+                ('bio', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('instrument_facet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.facet')),
+                ('location_facet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.facet')),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='accounts.profile')),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
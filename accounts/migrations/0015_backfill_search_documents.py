@@ -0,0 +1,67 @@
+from itertools import islice
+
+from django.db import migrations
+from django.db.models import Count
+from django.utils.text import slugify
+
+FTS_TABLE = "accounts_searchdocument_fts"
+
+
+# 0012 created empty search tables; index the profiles that already existed,
+# as accounts.search.rebuild_index() would, so search works right after deploy.
+def backfill_search_documents(apps, schema_editor):
+    Profile = apps.get_model("accounts", "Profile")
+    SearchDocument = apps.get_model("accounts", "SearchDocument")
+    Facet = apps.get_model("accounts", "Facet")
+    connection = schema_editor.connection
+    facets = {}
+
+    def facet_for(kind, name):
+        name = name.strip()
+        slug = slugify(name)[:100]
+        if not slug:
+            return None
+        if (kind, slug) not in facets:
+            facets[kind, slug], _ = Facet.objects.get_or_create(kind=kind, slug=slug, defaults={"name": name})
+        return facets[kind, slug]
+
+    profiles = (
+        Profile.objects.filter(search_document__isnull=True)
+        .select_related("user").order_by("id").iterator(chunk_size=500)
+    )
+    while batch := list(islice(profiles, 500)):
+        documents = SearchDocument.objects.bulk_create([
+            SearchDocument(
+                profile=profile,
+                username=profile.user.username,
+                instrument=profile.instrument,
+                location=profile.location,
+                bio=profile.bio,
+                instrument_facet=facet_for("instrument", profile.instrument),
+                location_facet=facet_for("location", profile.location),
+            )
+            for profile in batch
+        ])
+        # MySQL maintains its FULLTEXT index itself; SQLite's FTS5 mirror is filled by hand
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, username, instrument, location, bio) VALUES (%s, %s, %s, %s, %s)",
+                    [[d.id, d.username, d.instrument, d.location, d.bio] for d in documents],
+                )
+
+    for field in ("instrument_facet", "location_facet"):
+        totals = SearchDocument.objects.filter(**{f"{field}__isnull": False}).values(field).annotate(total=Count("id"))
+        for row in totals:
+            Facet.objects.filter(id=row[field]).update(profile_count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth.models import User
 
 
@@ -9,6 +11,13 @@ class Profile(models.Model):
     bio = models.TextField(blank=True)
   
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True) 
+    # Resized WebP/JPEG renditions of the avatar, built by accounts.images
+    avatar_variants = models.JSONField(default=dict, blank=True)
+
+    # Denormalized counters, kept in step by accounts.counters
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
@@ -20,6 +29,10 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ("follower", "following")
+        # the unique index leads with follower; fan-out lists an author's followers
+        indexes = [
+            models.Index(fields=["following", "follower"], name="follow_following_idx"),
+        ]
 
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
@@ -43,6 +56,19 @@ class Post(models.Model):
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
     image = models.ImageField(upload_to='post_images/', blank=True, null=True) 
+    # Resized WebP/JPEG renditions of the image, built by accounts.images
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    # Denormalized counters, kept in step by accounts.counters
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # newest first with the id as tie-breaker, as the feed cursors and profile lists sort
+        indexes = [
+            models.Index(fields=["author", "-created_at", "-id"], name="post_author_recent_idx"),
+            models.Index(fields=["-created_at", "-id"], name="post_recent_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.username if self.author else 'Deleted User'}"
@@ -55,16 +81,132 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ('post', 'user')
+        # "which of these posts has the viewer liked" filters by user first
+        indexes = [
+            models.Index(fields=['user', 'post'], name='like_user_post_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} liked {self.post.title}"
 
+class CommentQuerySet(models.QuerySet):
+    def latest_per_post(self, post_ids, limit):
+        """
+        The ``limit`` newest comments of each post, in one windowed query,
+        with authors and their profiles joined. Each comment also carries
+        ``post_total``, its post's full comment count.
+        """
+        return (
+            self.filter(post_id__in=post_ids)
+            .select_related("user__profile")
+            .annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=[F("post_id")],
+                    order_by=[F("created_at").desc(), F("id").desc()],
+                ),
+                post_total=Window(Count("id"), partition_by=[F("post_id")]),
+            )
+            .filter(row_number__lte=limit)
+            .order_by("post_id", "row_number")
+        )
+
+    def _group(self, posts, comments, limit):
+        comments_by_post = {post.id: [] for post in posts}
+        for comment in comments:
+            comments_by_post[comment.post_id].append(comment)
+        for post in posts:
+            found = comments_by_post[post.id]
+            if limit <= 0:
+                # nothing was fetched; the denormalized counter stands in
+                post.comment_total = post.comment_count
+            else:
+                post.comment_total = found[0].post_total if found else 0
+        return comments_by_post
+
+    def previews(self, posts, limit):
+        """``{post id: [latest comments]}``; also sets ``comment_total`` on each post."""
+        posts = list(posts)
+        comments = self.latest_per_post([post.id for post in posts], limit) if posts and limit > 0 else []
+        return self._group(posts, comments, limit)
+
+    async def apreviews(self, posts, limit):
+        posts = list(posts)
+        comments = [
+            comment async for comment in self.latest_per_post([post.id for post in posts], limit)
+        ] if posts and limit > 0 else []
+        return self._group(posts, comments, limit)
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        # latest comments per post (feed window query, post cards)
+        indexes = [
+            models.Index(fields=["post", "-created_at", "-id"], name="comment_post_recent_idx"),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user.username} on {self.post.title}"
 
+
+
+class TimelineEntry(models.Model):
+    # Materialized home timeline: one row per (reader, post) pushed at write time.
+    # created_at mirrors the post's so a page is a single range scan on the index.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-post"], name="timeline_user_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.user_id}'s timeline"
+
+
+class Facet(models.Model):
+    # Normalized instrument/location values used as search filters.
+    INSTRUMENT = "instrument"
+    LOCATION = "location"
+    KIND_CHOICES = [
+        (INSTRUMENT, "Instrument"),
+        (LOCATION, "Location"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100)
+    profile_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("kind", "slug")
+        ordering = ["-profile_count", "name"]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+
+
+class SearchDocument(models.Model):
+    # Flattened copy of a profile's searchable text, kept in step by accounts.search.
+    # Carries a FULLTEXT index on MySQL and is mirrored into an FTS5 table on SQLite.
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name="search_document")
+    username = models.CharField(max_length=150)
+    instrument = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=100, blank=True)
+    bio = models.TextField(blank=True)
+    instrument_facet = models.ForeignKey(Facet, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    location_facet = models.ForeignKey(Facet, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.username}"
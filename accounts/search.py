@@ -0,0 +1,296 @@
+"""
+Musician search.
+
+Every Profile has a SearchDocument holding its username, instrument,
+location and bio, plus links to normalized instrument/location Facets.
+Queries are answered by the database's full-text engine: a FULLTEXT
+index on MySQL, or an FTS5 mirror table on SQLite for dev and tests.
+Other databases fall back to ``icontains``. Results are ranked by
+relevance and paginated.
+
+Documents are updated incrementally from the Profile/User ``post_save``
+receivers in accounts.signals. ``rebuild_search_index`` does bulk loads.
+"""
+import re
+from itertools import islice
+
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
+
+from .models import Facet, Profile, SearchDocument
+
+SEARCH_PAGE_SIZE = 20
+FACET_LIMIT = 20
+
+FTS_TABLE = "accounts_searchdocument_fts"
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(query):
+    return _TOKEN.findall(query.lower())
+
+
+# backends
+
+class MySQLFullText:
+    match = "MATCH (username, instrument, location, bio) AGAINST (%s IN BOOLEAN MODE)"
+    # (min token size, stopwords) of the server's InnoDB parser, read once per process
+    _parser = None
+
+    @classmethod
+    def parser(cls):
+        if cls._parser is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT @@innodb_ft_min_token_size, @@innodb_ft_enable_stopword, @@innodb_ft_server_stopword_table"
+                )
+                min_size, use_stopwords, table = cursor.fetchone()
+                stopwords = frozenset()
+                if use_stopwords:
+                    if table:
+                        # "database/table", with a single ``value`` column
+                        schema, name = map(connection.ops.quote_name, table.split("/", 1))
+                        cursor.execute(f"SELECT value FROM {schema}.{name}")
+                    else:
+                        cursor.execute("SELECT value FROM INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD")
+                    stopwords = frozenset(value.lower() for value, in cursor.fetchall())
+            cls._parser = (min_size, stopwords)
+        return cls._parser
+
+    def rank(self, documents, terms):
+        # a required term the parser never indexes (a stopword, or shorter
+        # than innodb_ft_min_token_size) would make the whole query match nothing
+        min_size, stopwords = self.parser()
+        indexed = [term for term in terms if len(term) >= min_size and term not in stopwords]
+        if not indexed:
+            return ContainsFallback().rank(documents, terms)
+        query = " ".join(f"+{term}*" for term in indexed)
+        return (
+            documents.filter(RawSQL(self.match, [query], output_field=BooleanField()))
+            .annotate(relevance=RawSQL(self.match, [query], output_field=FloatField()))
+            .order_by("-relevance", "id")
+        )
+
+    def index(self, documents):
+        pass
+
+    def remove(self, document_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SQLiteFTS5:
+    def rank(self, documents, terms):
+        # join the FTS table once, so MATCH runs once per query, not per row
+        query = " ".join(f'"{term}"*' for term in terms)
+        return documents.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {SearchDocument._meta.db_table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[query],
+            select={"relevance": f"-bm25({FTS_TABLE})"},
+        ).order_by("-relevance", "id")
+
+    def index(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                [[document.id] for document in documents],
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, username, instrument, location, bio) VALUES (%s, %s, %s, %s, %s)",
+                [
+                    [document.id, document.username, document.instrument, document.location, document.bio]
+                    for document in documents
+                ],
+            )
+
+    def remove(self, document_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [document_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+
+class ContainsFallback:
+    def rank(self, documents, terms):
+        for term in terms:
+            documents = documents.filter(
+                Q(username__icontains=term) | Q(instrument__icontains=term)
+                | Q(location__icontains=term) | Q(bio__icontains=term)
+            )
+        return documents.order_by("username", "id")
+
+    def index(self, documents):
+        pass
+
+    def remove(self, document_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+BACKENDS = {
+    "mysql": MySQLFullText,
+    "sqlite": SQLiteFTS5,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, ContainsFallback)()
+
+
+# indexing
+
+def facet_for(kind, name):
+    name = name.strip()
+    slug = slugify(name)[:100]
+    if not slug:
+        return None
+    facet, _ = Facet.objects.get_or_create(kind=kind, slug=slug, defaults={"name": name})
+    return facet
+
+
+def _fill(document, profile, instrument, location):
+    document.username = profile.user.username
+    document.instrument = profile.instrument
+    document.location = profile.location
+    document.bio = profile.bio
+    document.instrument_facet = instrument
+    document.location_facet = location
+    return document
+
+
+def _move_facet(old_id, new):
+    """Move one profile from facet ``old_id`` to ``new``; returns the ids whose counts changed."""
+    new_id = new.id if new else None
+    if old_id == new_id:
+        return []
+    if old_id:
+        Facet.objects.filter(id=old_id, profile_count__gt=0).update(profile_count=F("profile_count") - 1)
+    if new_id:
+        Facet.objects.filter(id=new_id).update(profile_count=F("profile_count") + 1)
+    return [pk for pk in (old_id, new_id) if pk]
+
+
+def index_profile(profile):
+    """Create or refresh ``profile``'s SearchDocument and full-text entry.
+
+    Returns the document and the ids of the facets whose counts changed.
+    """
+    instrument = facet_for(Facet.INSTRUMENT, profile.instrument)
+    location = facet_for(Facet.LOCATION, profile.location)
+
+    document = SearchDocument.objects.filter(profile=profile).first() or SearchDocument(profile=profile)
+    moved = _move_facet(document.instrument_facet_id, instrument) + _move_facet(document.location_facet_id, location)
+    _fill(document, profile, instrument, location).save()
+
+    get_backend().index([document])
+    return document, moved
+
+
+def remove_document(document):
+    """Drop ``document`` from the full-text index; returns the ids of the facets whose counts changed."""
+    moved = _move_facet(document.instrument_facet_id, None) + _move_facet(document.location_facet_id, None)
+    get_backend().remove(document.id)
+    return moved
+
+
+def _facet_total(field):
+    totals = (
+        SearchDocument.objects.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(totals, output_field=IntegerField()), Value(0))
+
+
+def recount_facets():
+    Facet.objects.filter(kind=Facet.INSTRUMENT).update(profile_count=_facet_total("instrument_facet"))
+    Facet.objects.filter(kind=Facet.LOCATION).update(profile_count=_facet_total("location_facet"))
+
+
+@transaction.atomic
+def rebuild_index(batch_size=500):
+    """Re-index every profile from scratch in ``batch_size`` bulk inserts.
+
+    Runs in one transaction, so searches keep seeing the old index until
+    the new one is complete.
+    """
+    backend = get_backend()
+    backend.clear()
+    SearchDocument.objects.all().delete()
+
+    facet_cache = {}
+
+    def cached_facet(kind, name):
+        key = (kind, slugify(name.strip()))
+        if key not in facet_cache:
+            facet_cache[key] = facet_for(kind, name)
+        return facet_cache[key]
+
+    indexed = 0
+    profiles = Profile.objects.select_related("user").order_by("id").iterator(chunk_size=batch_size)
+    while batch := list(islice(profiles, batch_size)):
+        documents = SearchDocument.objects.bulk_create([
+            _fill(
+                SearchDocument(profile=profile),
+                profile,
+                cached_facet(Facet.INSTRUMENT, profile.instrument),
+                cached_facet(Facet.LOCATION, profile.location),
+            )
+            for profile in batch
+        ])
+        backend.index(documents)
+        indexed += len(documents)
+
+    recount_facets()
+    return indexed
+
+
+# querying
+
+def _facets(kind, limit):
+    return Facet.objects.filter(kind=kind, profile_count__gt=0)[:limit]
+
+
+def facets(kind, limit=FACET_LIMIT):
+    return list(_facets(kind, limit))
+
+
+async def afacets(kind, limit=FACET_LIMIT):
+    return [facet async for facet in _facets(kind, limit)]
+
+
+def matching_documents(query="", instrument=None, location=None):
+    """SearchDocuments matching ``query`` and the facet slugs, best first."""
+    documents = SearchDocument.objects.select_related("profile", "profile__user")
+    if instrument:
+        documents = documents.filter(instrument_facet__kind=Facet.INSTRUMENT, instrument_facet__slug=instrument)
+    if location:
+        documents = documents.filter(location_facet__kind=Facet.LOCATION, location_facet__slug=location)
+
+    terms = tokenize(query)
+    if terms:
+        documents = get_backend().rank(documents, terms)
+    else:
+        documents = documents.order_by("username", "id")
+    return documents
+
+
+def search_profiles(query="", instrument=None, location=None, page=1, per_page=SEARCH_PAGE_SIZE):
+    """Return a Paginator page of Profiles matching ``query`` and the facet slugs."""
+    documents = matching_documents(query, instrument, location)
+    results = Paginator(documents, per_page).get_page(page)
+    results.object_list = [document.profile for document in results.object_list]
+    return results
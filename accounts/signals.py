@@ -1,18 +1,68 @@
 # accounts/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile 
+from .models import Comment, Follow, Like, Post, Profile, SearchDocument
+from . import caching, search
+from .autocomplete import autocomplete
+
+# Profiles are created with the user by SignUpForm.save(); user saves do
+# not write to the profile.
+
+
+# Search index and autocomplete
+
+def _reindex(profile):
+    document, moved_facet_ids = search.index_profile(profile)
+    autocomplete.profile_indexed(profile, moved_facet_ids)
+
+@receiver(post_save, sender=Profile)
+def index_profile(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reindex(instance)
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
+def index_user(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # a login only touches last_login, which is not searchable; a new user
+    # has no profile yet, and is indexed when it is created
+    if raw or created or update_fields == frozenset(["last_login"]):
+        return
+    profile = Profile.objects.filter(user=instance).first()
+    if profile:
+        _reindex(profile)
+
+@receiver(pre_delete, sender=Profile)
+def unindex_profile(sender, instance, **kwargs):
+    document = SearchDocument.objects.filter(profile=instance).first()
+    # kept on the instance until the delete has gone through
+    instance.moved_facet_ids = search.remove_document(document) if document else []
+
+@receiver(post_delete, sender=Profile)
+def unindex_autocomplete(sender, instance, **kwargs):
+    autocomplete.profile_removed(instance, getattr(instance, "moved_facet_ids", []))
+
+
+# Cache versions (see caching.py)
 
-# This is a robust way to ensure the profile is always saved/created
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    try:
-        instance.profile.save()
-    except Profile.DoesNotExist:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+def bump_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields != frozenset(["last_login"]):
+        caching.bump_profile(instance.pk)
+
+@receiver([post_save, post_delete], sender=Profile)
+def bump_profile(sender, instance, **kwargs):
+    caching.bump_profile(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Post)
+def bump_post(sender, instance, **kwargs):
+    caching.bump_post(instance.pk, author_id=instance.author_id)
+
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Comment)
+def bump_liked_or_commented_post(sender, instance, **kwargs):
+    caching.bump_post(instance.post_id)
+
+@receiver([post_save, post_delete], sender=Follow)
+def bump_follow(sender, instance, **kwargs):
+    caching.bump_profile(instance.follower_id)
+    caching.bump_profile(instance.following_id)
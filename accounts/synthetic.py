@@ -0,0 +1,290 @@
+"""
+Synthetic social graph for load tests and benchmarks.
+
+Popularity follows a power law. A user's chance of being followed,
+liked or commented on is 1 / rank ** alpha, where the ranks are a random
+permutation of the users. The number of accounts a user follows, posts,
+likes, comments and chats with is drawn from a Pareto distribution
+around the requested mean. A handful of accounts get most of the
+attention, and most accounts get little, as on a real site.
+
+Rows go in with ``bulk_create`` in batches, so model signals do not run.
+seed() reconciles the denormalized counters and chat thread pointers
+itself. The search index and home timelines are left to their rebuild
+commands.
+
+Generated usernames are ``<prefix>~<n>``. Signup usernames cannot
+contain "~" (Django's username validator), so clear() cannot match a
+real account such as "synthia". The users get unusable passwords; the
+benchmarks log in with ``force_login``.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from chat.inbox import record_last_message
+from chat.models import ChatThread, Message
+
+from . import caching
+from .counters import post_counts, profile_counts, reconcile
+from .models import Comment, Follow, Like, Post, Profile
+
+# Pareto shape: 2 gives a mean of twice the minimum and a long tail
+PARETO_SHAPE = 2.0
+# How far back the generated activity is spread
+HISTORY_DAYS = 90
+# not allowed in signup usernames, so it marks generated accounts
+SEPARATOR = "~"
+DEFAULT_PREFIX = "synth"
+
+INSTRUMENTS = [
+    "Guitar", "Bass", "Drums", "Piano", "Vocals", "Violin", "Cello", "Saxophone",
+    "Trumpet", "Flute", "Clarinet", "Synth", "Ukulele", "Harp", "Trombone", "Mandolin",
+]
+LOCATIONS = [
+    "London", "Berlin", "New York", "Chicago", "Mumbai", "Bangalore", "Kochi", "Tokyo",
+    "Paris", "Lisbon", "Toronto", "Sydney", "Austin", "Nashville", "Dublin", "Seoul",
+]
+WORDS = (
+    "jam session gig band looking for drummer bassist rehearsal tonight studio record "
+    "album tour cover original song chords groove tempo practice lesson teacher student "
+    "open mic venue sound check setlist encore acoustic electric vinyl mix master"
+).split()
+
+
+# the auto_now_add timestamps seed() spreads over HISTORY_DAYS
+# (Message.timestamp is a plain default and needs no patching)
+TIMESTAMP_FIELDS = [
+    (Follow, "created_at"), (Post, "created_at"), (Like, "created_at"),
+    (Comment, "created_at"),
+]
+
+
+def synthetic_users(prefix=DEFAULT_PREFIX):
+    """The users seed() generated with ``prefix``."""
+    return User.objects.filter(username__startswith=f"{prefix}{SEPARATOR}")
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """
+    Let bulk_create keep the given ``(model, field name)`` timestamps as set.
+
+    This switches off auto_now/auto_now_add on the field itself, for every
+    thread in the process, so only management commands use it, around
+    their whole run. Without it, seeded or imported rows are stamped now.
+    """
+    saved = []
+    for model, name in fields:
+        field = model._meta.get_field(name)
+        saved.append((field, field.auto_now, field.auto_now_add))
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class GraphSeeder:
+
+    def __init__(self, users=1000, follows=20, posts=5, likes=8, comments=2, threads=2, messages=20,
+                 alpha=1.1, seed=None, batch_size=1000, prefix=DEFAULT_PREFIX, log=None):
+        self.size = users
+        self.means = {
+            "follows": follows, "posts": posts, "likes": likes,
+            "comments": comments, "threads": threads, "messages": messages,
+        }
+        self.alpha = alpha
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.counts = {}
+
+    # sampling
+
+    def draw(self, kind):
+        """A Pareto-distributed count with the configured mean for ``kind``."""
+        mean = self.means[kind]
+        if mean <= 0:
+            return 0
+        return int(mean * (PARETO_SHAPE - 1) / PARETO_SHAPE * self.rng.paretovariate(PARETO_SHAPE))
+
+    def pick(self, k):
+        """``k`` user ids, weighted by popularity (with repeats)."""
+        return self.rng.choices(self.user_ids, cum_weights=self.cum_weights, k=k)
+
+    def moment(self, after=None):
+        start = after or self.now - timedelta(days=HISTORY_DAYS)
+        return start + (self.now - start) * self.rng.random()
+
+    def text(self, low, high):
+        return " ".join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    # writing
+
+    def bulk(self, model, rows, **kwargs):
+        rows = iter(rows)
+        written = 0
+        while batch := list(islice(rows, self.batch_size)):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            written += len(batch)
+        self.counts[model._meta.verbose_name_plural] = written
+        self.log(f"{model.__name__}: {written}")
+        return written
+
+    def seed(self):
+        if synthetic_users(self.prefix).exists():
+            raise ValueError(f"Users prefixed {self.prefix!r} already exist; clear them first")
+
+        self.seed_users()
+        self.seed_follows()
+        self.seed_posts()
+        self.seed_likes()
+        self.seed_comments()
+        self.seed_chat()
+
+        users = synthetic_users(self.prefix)
+        reconcile(Profile.objects.filter(user__in=users), profile_counts())
+        reconcile(Post.objects.filter(author__in=users), post_counts())
+        # nothing was bumped on the way in
+        caching.bump_all()
+        return self.counts
+
+    def seed_users(self):
+        password = make_password(None)
+        self.bulk(User, (
+            User(
+                username=f"{self.prefix}{SEPARATOR}{n:07d}",
+                email=f"{self.prefix}{SEPARATOR}{n:07d}@example.com",
+                password=password,
+                date_joined=self.moment(),
+            )
+            for n in range(self.size)
+        ))
+        # re-read rather than trust bulk_create: MySQL does not return ids
+        self.user_ids = list(
+            synthetic_users(self.prefix).order_by("id").values_list("id", flat=True)
+        )
+        ranks = list(range(1, len(self.user_ids) + 1))
+        self.rng.shuffle(ranks)
+        self.weights = dict(zip(self.user_ids, (1 / rank ** self.alpha for rank in ranks)))
+        self.cum_weights = list(accumulate(self.weights.values()))
+
+        self.bulk(Profile, (
+            Profile(
+                user_id=user_id,
+                instrument=self.rng.choice(INSTRUMENTS),
+                location=self.rng.choice(LOCATIONS),
+                bio=self.text(5, 25),
+            )
+            for user_id in self.user_ids
+        ))
+
+    def seed_follows(self):
+        self.following = {}
+
+        def rows():
+            for user_id in self.user_ids:
+                targets = set(self.pick(self.draw("follows"))) - {user_id}
+                self.following[user_id] = list(targets)
+                for target in targets:
+                    yield Follow(follower_id=user_id, following_id=target, created_at=self.moment())
+
+        self.bulk(Follow, rows())
+
+    def seed_posts(self):
+        self.bulk(Post, (
+            Post(
+                author_id=user_id,
+                title=self.text(2, 6).capitalize(),
+                description=self.text(10, 60),
+                category=self.rng.choice(Post.CATEGORY_CHOICES)[0],
+                created_at=self.moment(),
+            )
+            for user_id in self.user_ids
+            for _ in range(self.draw("posts"))
+        ))
+        self.posts = list(
+            Post.objects.filter(author__in=synthetic_users(self.prefix)).values_list("id", "author_id", "created_at")
+        )
+        # a post draws attention in proportion to its author's popularity
+        self.post_weights = list(accumulate(self.weights[author_id] for _, author_id, _ in self.posts))
+
+    def _reactions(self, kind):
+        if not self.posts:
+            return
+        total = sum(self.draw(kind) for _ in self.posts)
+        chosen = self.rng.choices(self.posts, cum_weights=self.post_weights, k=total)
+        for (post_id, _, created_at), user_id in zip(chosen, self.rng.choices(self.user_ids, k=total)):
+            yield post_id, user_id, self.moment(after=created_at)
+
+    def seed_likes(self):
+        seen = set()
+
+        def rows():
+            for post_id, user_id, when in self._reactions("likes"):
+                if (post_id, user_id) not in seen:
+                    seen.add((post_id, user_id))
+                    yield Like(post_id=post_id, user_id=user_id, created_at=when)
+
+        self.bulk(Like, rows())
+
+    def seed_comments(self):
+        self.bulk(Comment, (
+            Comment(post_id=post_id, user_id=user_id, text=self.text(3, 30), created_at=when)
+            for post_id, user_id, when in self._reactions("comments")
+        ))
+
+    def seed_chat(self):
+        pairs = set()
+        for user_id in self.user_ids:
+            # people mostly message accounts they follow
+            partners = self.following.get(user_id) or self.pick(1)
+            for partner in self.rng.sample(partners, min(len(partners), self.draw("threads"))):
+                if partner != user_id:
+                    pairs.add((min(user_id, partner), max(user_id, partner)))
+
+        self.bulk(ChatThread, (ChatThread(user1_id=a, user2_id=b) for a, b in sorted(pairs)))
+        threads = list(
+            ChatThread.objects.filter(user1__in=synthetic_users(self.prefix)).values_list("id", "user1_id", "user2_id")
+        )
+
+        def rows():
+            for thread_id, user1_id, user2_id in threads:
+                when = self.moment()
+                for _ in range(self.draw("messages")):
+                    when = self.moment(after=when)
+                    yield Message(
+                        thread_id=thread_id,
+                        sender_id=self.rng.choice((user1_id, user2_id)),
+                        content=self.text(1, 20),
+                        timestamp=when,
+                    )
+
+        self.bulk(Message, rows())
+        thread_ids = [thread_id for thread_id, _, _ in threads]
+        for start in range(0, len(thread_ids), self.batch_size):
+            record_last_message(thread_ids[start:start + self.batch_size], self.now)
+
+
+def clear(prefix=DEFAULT_PREFIX):
+    """Delete the users seed() generated with ``prefix`` and everything they wrote."""
+    users = synthetic_users(prefix)
+    # someone set a password, so it is in use; leave it to an admin
+    if users.exclude(password__startswith=UNUSABLE_PASSWORD_PREFIX).exists():
+        raise ValueError(f"Some users prefixed {prefix!r} have a usable password; not deleting them")
+    # posts outlive their author (SET_NULL), so they go first
+    Post.objects.filter(author__in=users).delete()
+    deleted, _ = users.delete()
+    caching.bump_all()
+    return deleted
@@ -0,0 +1,78 @@
+"""
+Background jobs for the accounts app (see jobs/queue.py).
+
+Work that does not have to finish before the response goes back is
+queued from the views and runs in a ``runworkers`` process. Each handler
+re-reads its rows by id, and returns quietly if they were deleted in the
+meantime.
+"""
+from django.contrib.auth.forms import PasswordResetForm
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from jobs.queue import job
+
+from . import images, timeline
+from .models import Post, Profile
+
+# Higher runs first: an email the user is waiting on beats feed freshness,
+# which beats resized images (the original is served until they exist)
+PRIORITY_EMAIL = 20
+PRIORITY_FAN_OUT = 10
+PRIORITY_IMAGES = 0
+
+
+@job("accounts.process_post_image")
+def process_post_image(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None and post.image:
+        images.process_post_image(post)
+
+
+@job("accounts.process_avatar")
+def process_avatar(profile_id):
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is not None:
+        images.process_avatar(profile)
+
+
+@job("accounts.fan_out_post")
+def fan_out_post(post_id):
+    post = Post.objects.select_related("author").filter(pk=post_id).first()
+    if post is not None:
+        timeline.fan_out_post(post)
+
+
+@job("accounts.backfill_followers")
+def backfill_followers(author_id):
+    timeline.backfill_followers(author_id)
+
+
+@job("accounts.send_email")
+def send_email(subject, body, to, from_email=None, html_body=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html_body:
+        message.attach_alternative(html_body, "text/html")
+    message.send()
+
+
+@job("accounts.send_password_reset")
+def send_password_reset(user_id, subject_template_name, email_template_name, context,
+                        from_email=None, html_email_template_name=None):
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.has_usable_password():
+        return
+    to_email = getattr(user, User.get_email_field_name())
+    context = {
+        **context,
+        "email": to_email,
+        "user": user,
+        "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+        "token": default_token_generator.make_token(user),
+    }
+    PasswordResetForm().send_mail(
+        subject_template_name, email_template_name, context, from_email, to_email, html_email_template_name,
+    )
@@ -1,5 +1,9 @@
 from django import template
-from accounts.models import Follow
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.html import format_html, linebreaks
+from django.utils.safestring import mark_safe
+from accounts.follow_state import follow_state_for
 
 register = template.Library()
 
@@ -9,7 +13,71 @@ def get_item(dictionary, key):
 
 @register.filter
 def is_following(user, target_user):
-    """Return True if the user follows the target_user."""
-    if not user.is_authenticated:
-        return False
-    return Follow.objects.filter(follower=user, following=target_user).exists()
\ No newline at end of file
+    """Return True if the user follows the target_user.
+
+    Answered from the request's FollowState, so a view that primed it with
+    the page's users costs no query per call.
+    """
+    return follow_state_for(user).is_following(target_user)
+
+@register.simple_tag
+def responsive_image(variants, alt="", sizes="100vw", default="feed", fallback="", css_class=""):
+    """Render a <picture> with a srcset per format from an image variant map.
+
+    ``variants`` is ``Post.image_variants`` or ``Profile.avatar_variants``;
+    ``fallback`` is used as a plain <img> when no variants exist yet.
+    """
+    if not variants:
+        if not fallback:
+            return ""
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', fallback, alt, css_class)
+
+    widths = sorted(variants.values(), key=lambda variant: variant["width"])
+    sources = []
+    for fmt in ("avif", "webp"):
+        if fmt in widths[0]:
+            sources.append(format_html(
+                '<source type="image/{}" srcset="{}" sizes="{}">',
+                fmt, _srcset(widths, fmt), sizes,
+            ))
+
+    main = variants.get(default) or widths[-1]
+    img = format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+        default_storage.url(main["jpeg"]), _srcset(widths, "jpeg"), sizes,
+        main["width"], main["height"], alt, css_class,
+    )
+    return format_html("<picture>{}{}</picture>", mark_safe("".join(sources)), img)
+
+
+def _srcset(variants, fmt):
+    return ", ".join(f"{default_storage.url(variant[fmt])} {variant['width']}w" for variant in variants)
+
+
+@register.simple_tag
+def render_comment(comment):
+    """Render one comment as an <li>.
+
+    The like/comment endpoints return this same markup to JS clients, so
+    a comment added in place looks like one rendered with the page. Only
+    processed avatar variants are shown: until they exist the upload may
+    still carry EXIF (GPS included), so there is no avatar.
+    """
+    user = comment.user
+    profile = getattr(user, "profile", None)
+    avatar = ""
+    if profile is not None:
+        avatar = responsive_image(
+            profile.avatar_variants, alt=user.username, sizes="48px", default="thumbnail",
+            css_class="comment-avatar",
+        )
+    return format_html(
+        '<li class="comment" id="comment-{}">{}'
+        '<a class="comment-user" href="{}">{}</a>'
+        '<div class="comment-text">{}</div>'
+        '<time datetime="{}">{}</time></li>',
+        comment.id, avatar,
+        reverse("accounts:profile_with_username", args=[user.username]), user.username,
+        mark_safe(linebreaks(comment.text, autoescape=True)),
+        comment.created_at.isoformat(), comment.created_at.strftime("%b %d, %Y %H:%M"),
+    )
@@ -1,3 +1,656 @@
-from django.test import TestCase
+import asyncio
+import pickle
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from chat.inbox import record_last_message
+from chat.models import ChatThread, Message
+from resonate import db
+from resonate.cache import StatsLocMemCache, StatsRedisCache
+
+from . import caching, conditional, counters, images, index_advisor, search, timeline
+from .autocomplete import Autocomplete, autocomplete
+from .feed import decode_cursor, get_comment_page, get_feed_page, serialize_page
+from .graph_io import MODELS, export_lines, fields_of, import_lines, loading, snapshot
+from .models import Comment, Facet, Follow, Like, Post, Profile, SearchDocument, TimelineEntry
+from .templatetags.custom_filters import render_comment
+
+
+def make_user(username, **profile):
+    user = User.objects.create_user(username)
+    Profile.objects.create(user=user, **profile)
+    return user
+
+
+def make_post(author, title="post"):
+    return Post.objects.create(author=author, title=title, description="text", category="Band")
+
+
+# replica routing
+
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = db.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request):
+        """Run ``request`` through ReplicaMiddleware; returns the response and where reads went."""
+        seen = {}
+
+        def get_response(request):
+            seen["post"] = self.router.db_for_read(Post)
+            seen["user"] = self.router.db_for_read(User)
+            with db.primary():
+                seen["post_in_primary"] = self.router.db_for_read(Post)
+            return HttpResponse()
+
+        with mock.patch.dict(settings.DATABASES, {db.REPLICA: {}}):
+            response = db.ReplicaMiddleware(get_response)(request)
+        return response, seen
+
+    def test_listed_read_goes_to_replica(self):
+        response, seen = self.route(self.factory.get(reverse("accounts:feed")))
+        self.assertEqual(seen, {"post": db.REPLICA, "user": "default", "post_in_primary": "default"})
+        self.assertNotIn(db.PIN_COOKIE, response.cookies)
+
+    def test_write_pins_browser_to_primary(self):
+        response, seen = self.route(self.factory.post(reverse("accounts:feed")))
+        self.assertEqual(seen["post"], "default")
+        self.assertIn(db.PIN_COOKIE, response.cookies)
+
+        request = self.factory.get(reverse("accounts:feed"))
+        request.COOKIES[db.PIN_COOKIE] = "1"
+        _, seen = self.route(request)
+        self.assertEqual(seen["post"], "default")
+
+    def test_async_requests_route_without_adaptation(self):
+        seen = {}
+
+        async def get_response(request):
+            seen["post"] = await sync_to_async(self.router.db_for_read)(Post)
+            return HttpResponse()
+
+        with mock.patch.dict(settings.DATABASES, {db.REPLICA: {}}):
+            middleware = db.ReplicaMiddleware(get_response)
+            self.assertTrue(iscoroutinefunction(middleware))
+            response = asyncio.run(middleware(self.factory.post(reverse("accounts:feed"))))
+            self.assertEqual(seen["post"], "default")
+            self.assertIn(db.PIN_COOKIE, response.cookies)
+
+            asyncio.run(middleware(self.factory.get(reverse("accounts:feed"))))
+            self.assertEqual(seen["post"], db.REPLICA)
+        self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_unlisted_view_and_writes_use_primary(self):
+        _, seen = self.route(self.factory.get(reverse("accounts:post_create")))
+        self.assertEqual(seen["post"], "default")
+        self.assertEqual(self.router.db_for_read(Post), "default")
+        self.assertEqual(self.router.db_for_write(Post), "default")
+
+
+# denormalized counters
+
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.author = make_user("author")
+        self.fan = make_user("fan")
+        self.post = make_post(self.author)
+
+    def test_set_liked_is_idempotent(self):
+        self.assertEqual(counters.set_liked(self.post.id, self.fan.id, True), 1)
+        self.assertEqual(counters.set_liked(self.post.id, self.fan.id, True), 1)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+
+        self.assertEqual(counters.set_liked(self.post.id, self.fan.id, False), 0)
+        self.assertEqual(counters.set_liked(self.post.id, self.fan.id, False), 0)
+        self.assertFalse(Like.objects.filter(post=self.post).exists())
+
+    def test_set_liked_missing_post(self):
+        self.assertIsNone(counters.set_liked(self.post.id + 1000, self.fan.id, True))
+        self.assertFalse(Like.objects.exists())
+
+    def test_repeated_unfollow_moves_counters_once(self):
+        other = make_user("other")
+        Follow.objects.create(follower=other, following=self.author)
+        counters.user_followed(other.id, self.author.id)
+        self.client.force_login(self.fan)
+        url = reverse("accounts:follow_toggle", args=[self.author.username])
+
+        self.client.post(url)  # follow
+        self.client.post(url)  # unfollow
+        # a double submit: the second request saw the follow before the first deleted it
+        with mock.patch.object(QuerySet, "exists", return_value=True):
+            response = self.client.post(url)
+
+        self.assertEqual(response.json()["follower_count"], 1)
+        self.assertEqual(Profile.objects.get(user=self.author).follower_count, 1)
+        self.assertEqual(Profile.objects.get(user=self.fan).following_count, 0)
+        follow_counts = {name: counters.profile_counts()[name] for name in ("follower_count", "following_count")}
+        self.assertEqual(counters.reconcile(Profile.objects.all(), follow_counts, dry_run=True), 0)
+
+
+# keyset cursors
+
+class CursorTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("reader")
+        self.posts = [make_post(self.user, f"post {n}") for n in range(5)]
+        # ties on created_at are broken by id
+        Post.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def test_feed_pages_cover_every_post_once(self):
+        seen, cursor = [], None
+        while True:
+            page = get_feed_page(self.user, cursor, page_size=2)
+            seen += [post.id for post in page.posts]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, sorted((post.id for post in self.posts), reverse=True))
+
+    def test_malformed_cursor_starts_over(self):
+        self.assertIsNone(decode_cursor("not a cursor"))
+        page = get_feed_page(self.user, "not a cursor", page_size=2)
+        self.assertEqual([post.id for post in page.posts], [self.posts[4].id, self.posts[3].id])
+
+    def test_comment_pages(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(post=post, user=self.user, text=str(n)) for n in range(3)]
+        first, cursor = get_comment_page(post.id, page_size=2)
+        rest, end = get_comment_page(post.id, cursor, page_size=2)
+        self.assertEqual([c.id for c in first + rest], [c.id for c in reversed(comments)])
+        self.assertIsNone(end)
+
+
+# comment previews
+
+class PreviewTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("reader")
+        self.post = make_post(self.user)
+        self.comments = [Comment.objects.create(post=self.post, user=self.user, text=str(n)) for n in range(5)]
+        Post.objects.filter(pk=self.post.pk).update(comment_count=5)
+
+    def test_preview_leaves_the_thread_alone(self):
+        with self.assertNumQueries(2):
+            page = get_feed_page(self.user, comments_per_post=3)
+        post, = page.posts
+        newest = list(reversed(self.comments))[:3]
+        self.assertEqual(page.comments_by_post[post.id], newest)
+        self.assertEqual(post.preview_comments, newest[::-1])
+        # the relation is the whole thread, not the preview
+        self.assertEqual(post.comments.count(), 5)
+        self.assertEqual(len(post.comments.all()), 5)
+        self.assertEqual(serialize_page(page)["posts"][0]["comment_count"], 5)
+
+        rest, end = get_comment_page(post.id, post.comments_cursor)
+        self.assertEqual(rest, self.comments[1::-1])
+        self.assertIsNone(end)
+
+    def test_full_preview_has_no_cursor(self):
+        post, = get_feed_page(self.user, comments_per_post=5).posts
+        self.assertEqual(post.preview_comments, self.comments)
+        self.assertIsNone(post.comments_cursor)
+
+
+# home timeline
+
+@override_settings(TIMELINE_MAX_ENTRIES=3, TIMELINE_TRIM_SLACK=1, TIMELINE_FANOUT_LIMIT=10)
+class TimelineTests(TestCase):
+
+    def setUp(self):
+        self.author = make_user("author")
+        self.reader = make_user("reader")
+        Follow.objects.create(follower=self.reader, following=self.author)
+
+    def entries(self, user):
+        return list(
+            TimelineEntry.objects.filter(user=user).order_by("-created_at", "-post_id").values_list("post_id", flat=True)
+        )
+
+    def publish(self, count):
+        posts = [make_post(self.author, f"post {n}") for n in range(count)]
+        for post in posts:
+            self.assertEqual(timeline.fan_out_post(post), 2)
+        return posts
+
+    def test_fan_out_reaches_author_and_followers(self):
+        post, = self.publish(1)
+        self.assertEqual(self.entries(self.author), [post.id])
+        self.assertEqual(self.entries(self.reader), [post.id])
+        page = timeline.get_home_page(self.reader)
+        self.assertEqual([p.id for p in page.posts], [post.id])
+
+    def test_trims_once_past_the_slack(self):
+        posts = self.publish(4)
+        # one over the maximum is within the slack
+        self.assertEqual(len(self.entries(self.reader)), 4)
+
+        posts += self.publish(1)
+        newest = [post.id for post in reversed(posts)][:3]
+        self.assertEqual(self.entries(self.reader), newest)
+        self.assertEqual(self.entries(self.author), newest)
+
+    def test_celebrities_are_merged_at_read_time(self):
+        Profile.objects.filter(user=self.author).update(follower_count=10)
+        post = make_post(self.author)
+        self.assertEqual(timeline.fan_out_post(post), 1)
+        self.assertEqual(self.entries(self.reader), [])
+        self.assertEqual([p.id for p in timeline.get_home_page(self.reader).posts], [post.id])
+
+    def test_rebuild_and_purge(self):
+        posts = self.publish(2)
+        TimelineEntry.objects.filter(user=self.reader).delete()
+        self.assertEqual(timeline.rebuild_timeline(self.reader), 2)
+        self.assertEqual(self.entries(self.reader), [post.id for post in reversed(posts)])
+
+        timeline.purge(self.reader, self.author)
+        self.assertEqual(self.entries(self.reader), [])
+
+
+# musician search
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.ana = make_user("ana", instrument="Bass guitar", location="Lisbon", bio="funk and soul")
+        self.bo = make_user("bo", instrument="Guitar", location="Porto", bio="jazz standards")
+        self.cy = make_user("cy", instrument="Drums", location="Lisbon", bio="guitar collector, plays drums")
+
+    def usernames(self, query="", **facets):
+        return [profile.user.username for profile in search.search_profiles(query, **facets).object_list]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.usernames("guit")[:2], ["bo", "ana"])
+        self.assertEqual(set(self.usernames("guitar")), {"ana", "bo", "cy"})
+        self.assertEqual(self.usernames("jazz stand"), ["bo"])
+        self.assertEqual(self.usernames("nothing"), [])
+
+    def test_facets_follow_profile_edits(self):
+        self.assertEqual(self.usernames(location="lisbon"), ["ana", "cy"])
+        lisbon = Facet.objects.get(kind=Facet.LOCATION, slug="lisbon")
+        self.assertEqual(lisbon.profile_count, 2)
+
+        profile = Profile.objects.get(user=self.cy)
+        profile.location = "Porto"
+        profile.save()
+        lisbon.refresh_from_db()
+        self.assertEqual(lisbon.profile_count, 1)
+        self.assertEqual(self.usernames(location="porto"), ["bo", "cy"])
+        self.assertEqual(self.usernames("drums", location="porto"), ["cy"])
+
+    def test_renamed_user_is_reindexed(self):
+        self.bo.username = "bobby"
+        self.bo.save()
+        self.assertEqual(self.usernames("bobby"), ["bobby"])
+
+    def test_deleted_profile_leaves_the_index(self):
+        Profile.objects.get(user=self.bo).delete()
+        self.assertEqual(self.usernames("jazz"), [])
+        self.assertEqual(Facet.objects.get(kind=Facet.LOCATION, slug="porto").profile_count, 0)
+
+    def test_rebuild_index(self):
+        SearchDocument.objects.update(bio="")
+        self.assertEqual(search.rebuild_index(batch_size=2), 3)
+        self.assertEqual(self.usernames("jazz"), ["bo"])
+        self.assertEqual(Facet.objects.get(kind=Facet.LOCATION, slug="lisbon").profile_count, 2)
+
+
+# autocomplete
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        self.ana = make_user("ana", instrument="Bass", location="Lisbon")
+        self.bo = make_user("bo", instrument="Banjo", location="Lisbon", follower_count=5)
+        autocomplete.rebuild()
+
+    def suggest(self, prefix, kind):
+        return autocomplete.suggest(prefix, [kind])[kind]
+
+    def test_ranked_suggestions(self):
+        self.assertEqual(self.suggest("b", "username"), ["bo"])
+        self.assertEqual(self.suggest("BA", "instrument"), ["Banjo", "Bass"])
+        self.assertEqual(self.suggest("l", "location"), ["Lisbon"])
+
+    def test_profile_edits_move_facets(self):
+        profile = Profile.objects.get(user=self.ana)
+        profile.instrument = "Banjo"
+        profile.save()
+        # Bass has no profiles left
+        self.assertEqual(self.suggest("ba", "instrument"), ["Banjo"])
+
+        self.ana.username = "anabela"
+        self.ana.save()
+        self.assertEqual(self.suggest("ana", "username"), ["anabela"])
+
+    def test_deleted_profile_is_dropped(self):
+        self.bo.delete()
+        self.assertEqual(self.suggest("b", "username"), [])
+        self.assertEqual(self.suggest("ba", "instrument"), ["Bass"])
+        self.assertEqual(self.suggest("l", "location"), ["Lisbon"])
+
+    def test_first_request_does_not_build(self):
+        fresh = Autocomplete()
+        with mock.patch.object(Autocomplete, "_refresh") as refresh, self.assertNumQueries(0):
+            self.assertEqual(fresh.suggest("a", ["username"]), {"username": []})
+        refresh.assert_called_once()
+
+
+# image processing
+
+def jpeg_with_gps(size=(600, 400)):
+    exif = Image.Exif()
+    exif[0x8825] = {2: (38.0, 43.0, 0.0)}  # GPSInfo: latitude
+    buffer = BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format="JPEG", exif=exif)
+    return ContentFile(buffer.getvalue(), name="photo.jpg")
+
+
+class ImageTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = make_user("painter")
+        self.profile = Profile.objects.get(user=self.user)
+        self.profile.avatar.save("photo.jpg", jpeg_with_gps(), save=False)
+        Profile.objects.filter(pk=self.profile.pk).update(avatar=self.profile.avatar.name)
+
+    def test_avatar_variants_replace_the_upload(self):
+        upload = self.profile.avatar.name
+        variants = images.process_avatar(self.profile)
+
+        self.assertEqual(set(variants), set(images.AVATAR_VARIANTS))
+        self.assertEqual((variants["thumbnail"]["width"], variants["thumbnail"]["height"]), (96, 96))
+        for variant in variants.values():
+            with default_storage.open(variant["jpeg"]) as f, Image.open(f) as image:
+                self.assertFalse(image.getexif())
+
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual(profile.avatar_variants, variants)
+        self.assertTrue(profile.avatar.name.startswith(f"{images.ORIGINALS}/"))
+        with profile.avatar.open() as f, Image.open(f) as image:
+            self.assertFalse(image.getexif())
+        self.assertFalse(default_storage.exists(upload))
+
+    def test_post_image_variants_keep_the_aspect_ratio(self):
+        post = make_post(self.user)
+        post.image.save("photo.jpg", jpeg_with_gps((3000, 1500)))
+        variants = images.process_post_image(post)
+        self.assertEqual((variants["feed"]["width"], variants["feed"]["height"]), (960, 480))
+        self.assertEqual(Post.objects.get(pk=post.pk).image_variants, variants)
+
+    def test_a_replaced_upload_is_left_to_its_own_job(self):
+        stale = Profile.objects.get(pk=self.profile.pk)
+        # the user uploads again before the first job runs
+        self.profile.avatar.save("newer.jpg", jpeg_with_gps(), save=False)
+        Profile.objects.filter(pk=self.profile.pk).update(avatar=self.profile.avatar.name)
+
+        images.process_avatar(stale)
+
+        profile = Profile.objects.get(pk=self.profile.pk)
+        self.assertEqual(profile.avatar.name, self.profile.avatar.name)
+        self.assertEqual(profile.avatar_variants, {})
+        self.assertTrue(default_storage.exists(profile.avatar.name))
+        # the stripped copy the stale job made is gone
+        self.assertEqual(default_storage.listdir(f"{images.ORIGINALS}/avatars")[1], [])
+
+    def test_comment_html_never_shows_the_raw_upload(self):
+        comment = Comment.objects.create(post=make_post(self.user), user=self.user, text="hi")
+        comment = Comment.objects.select_related("user__profile").get(pk=comment.pk)
+        self.assertNotIn("<img", render_comment(comment))
+
+        images.process_avatar(comment.user.profile)
+        html = render_comment(comment)
+        self.assertIn(comment.user.profile.avatar_variants["thumbnail"]["jpeg"], html)
+        self.assertNotIn(comment.user.profile.avatar.name, html)
+
+
+# versioned cache
+
+class CacheInvalidationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_user("author", instrument="Bass")
+        self.fan = make_user("fan")
+        self.post = make_post(self.author)
+
+    def test_profile_posts_served_from_cache_until_a_write(self):
+        caching.profile_posts(self.author.id)
+        with self.assertNumQueries(0):
+            posts, _ = caching.profile_posts(self.author.id)
+        self.assertEqual(posts[0].like_count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.set_liked(self.post.id, self.fan.id, True)
+            Comment.objects.create(post=self.post, user=self.fan, text="hi")
+        posts, comments_by_post = caching.profile_posts(self.author.id)
+        self.assertEqual(posts[0].like_count, 1)
+        self.assertEqual([c.text for c in comments_by_post[self.post.id]], ["hi"])
+
+    def test_profile_header_after_edit(self):
+        self.assertEqual(caching.profile_header(self.author.id).instrument, "Bass")
+        profile = Profile.objects.get(user=self.author)
+        profile.instrument = "Drums"
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(caching.profile_header(self.author.id).instrument, "Drums")
+
+    def test_versions_move_on_commit(self):
+        ref = (caching.POST, self.post.id)
+        before = caching.versions([ref])
+        with self.captureOnCommitCallbacks() as callbacks:
+            counters.set_liked(self.post.id, self.fan.id, True)
+            # a reader before the commit still sees the old version, so
+            # whatever it builds from the old rows is not stored as current
+            self.assertEqual(caching.versions([ref]), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(caching.versions([ref]), before)
+
+    # the cache itself stays locmem; within one process it behaves as a shared one
+    @override_settings(CACHE_BACKEND="redis", PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+    def test_session_user_after_password_change(self):
+        before = caching.session_user(self.fan.id).get_session_auth_hash()
+        self.fan.set_password("changed")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fan.save()
+        self.assertNotEqual(caching.session_user(self.fan.id).get_session_auth_hash(), before)
+
+    @override_settings(CACHE_BACKEND="redis", PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+    def test_session_user_keeps_the_password_hash_out_of_the_cache(self):
+        self.fan.set_password("secret")
+        self.fan.save()
+        caching.session_user(self.fan.id)
+        stored = cache.get(f"session:profile:{self.fan.id}")
+        self.assertIsNotNone(stored)
+        self.assertNotIn(self.fan.password.encode(), pickle.dumps(stored))
+
+        with self.assertNumQueries(0):
+            user = caching.session_user(self.fan.id)
+            self.assertEqual(user.get_session_auth_hash(), self.fan.get_session_auth_hash())
+            self.assertEqual((user.username, user.profile.user), ("fan", user))
+        # the password loads when something asks for it, and a save leaves it alone
+        self.assertTrue(user.check_password("secret"))
+        user.first_name = "Fan"
+        user.save()
+        self.fan.refresh_from_db()
+        self.assertEqual((self.fan.first_name, self.fan.check_password("secret")), ("Fan", True))
+
+    def test_session_user_uncached_without_shared_cache(self):
+        caching.session_user(self.fan.id)
+        with self.assertNumQueries(1):
+            caching.session_user(self.fan.id)
+
+
+
+class CacheStatsTests(TestCase):
+
+    def test_get_many_counts_each_key_once(self):
+        local = StatsLocMemCache("stats-tests", {})
+        local.reset_stats()
+        local.set("a", 1)
+        local.get_many(["a", "b"])
+        self.assertEqual(local.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+        shared = StatsRedisCache("redis://stats-tests", {})
+        shared.reset_stats()
+        with mock.patch("django.core.cache.backends.redis.RedisCache.get_many", return_value={"a": 1}):
+            shared.get_many(["a", "b", "c"])
+        self.assertEqual(shared.stats()["hits"], 1)
+        self.assertEqual(shared.stats()["misses"], 2)
+
+# conditional GET
+
+@override_settings(CACHE_BACKEND="redis")
+class ETagTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = make_user("author")
+        self.commenter = make_user("commenter")
+        self.post = make_post(self.author)
+        Comment.objects.create(post=self.post, user=self.commenter, text="nice")
+        self.factory = RequestFactory()
+
+    def etags(self, method="get"):
+        request = getattr(self.factory, method)("/")
+        request.user = self.author
+        return (
+            conditional.feed_etag(request),
+            conditional.profile_etag(request),
+            conditional.post_etag(request, self.post.id),
+        )
+
+    def edit(self, instance, **fields):
+        for name, value in fields.items():
+            setattr(instance, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    def test_stable_until_something_shown_changes(self):
+        before = self.etags()
+        self.assertNotIn(None, before)
+        self.assertEqual(self.etags(), before)
+
+        self.edit(self.post, title="renamed")
+        after = self.etags()
+        for old, new in zip(before, after):
+            self.assertNotEqual(old, new)
+
+    def test_commenter_profile_changes_every_page(self):
+        before = self.etags()
+        self.edit(Profile.objects.get(user=self.commenter), avatar_variants={"thumbnail": {"width": 96}})
+        for old, new in zip(before, self.etags()):
+            self.assertNotEqual(old, new)
+
+    def test_unrelated_profile_changes_nothing(self):
+        before = self.etags()
+        self.edit(Profile.objects.get(user=make_user("stranger")), bio="hi")
+        self.assertEqual(self.etags(), before)
+
+    def test_none_for_writes_or_a_local_cache(self):
+        self.assertEqual(self.etags("post"), (None, None, None))
+        with override_settings(CACHE_BACKEND="locmem"):
+            self.assertEqual(self.etags(), (None, None, None))
+
+
+# index advisor
+
+class IndexAdvisorTests(TestCase):
+
+    def test_flags_scans_and_unindexed_sorts(self):
+        indexed = "SELECT id FROM accounts_post WHERE id = 1"
+        unindexed = "SELECT id FROM accounts_post WHERE title = 'x' ORDER BY length(title)"
+        report = index_advisor.advise(
+            {"scenarios": {"feed": {"sql": [indexed, unindexed, "UPDATE accounts_post SET title = 'x'"]}}},
+        )
+        (sql, issues, plan), = report["feed"]
+        self.assertEqual(sql, unindexed)
+        self.assertEqual(issues, ["full scan of accounts_post", "sort without an index"])
+
+        report = index_advisor.advise({"scenarios": {"feed": {"sql": [unindexed]}}}, ignore={"accounts_post"})
+        self.assertEqual(report["feed"][0][1], ["sort without an index"])
+
+    def test_unsupported_database(self):
+        with mock.patch.object(connection, "vendor", "oracle"):
+            with self.assertRaises(index_advisor.UnsupportedDatabase):
+                index_advisor.get_plans()
+            with self.assertRaisesMessage(CommandError, "No EXPLAIN support for oracle"):
+                call_command("index_advisor", input="unused.json")
+
+
+# graph export/import
+
+class GraphRoundTripTests(TestCase):
+
+    def setUp(self):
+        alice, bob = make_user("alice", instrument="Piano"), make_user("bob")
+        Follow.objects.create(follower=bob, following=alice)
+        post = make_post(alice)
+        Like.objects.create(post=post, user=bob)
+        Comment.objects.create(post=post, user=bob, text="nice")
+        thread = ChatThread.objects.create(user1=alice, user2=bob)
+        Message.objects.create(thread=thread, sender=bob, content="hello")
+        Message.objects.create(thread=thread, sender=alice, content="hi")
+        record_last_message([thread.id])
+
+    def snapshot(self):
+        return {model: list(model.objects.order_by("pk").values(*fields_of(model))) for model in MODELS}
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        with snapshot():
+            lines = list(export_lines())
+
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        with loading():
+            import_lines(lines)
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(ChatThread.objects.get().last_message, Message.objects.latest("id"))
+
+        # running it again changes nothing
+        with loading():
+            import_lines(lines)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_export_pages_by_primary_key(self):
+        lines = list(export_lines())
+        # a query per row, and one more to find each table's end
+        with self.assertNumQueries(len(lines) + len(MODELS)):
+            self.assertEqual(list(export_lines(chunk_size=1)), lines)
+
+    def test_collision_aborts(self):
+        lines = list(export_lines())
+        User.objects.filter(username="bob").update(username="robert")
+        with self.assertRaisesMessage(ValueError, "is a different row"):
+            import_lines(lines)
@@ -0,0 +1,217 @@
+"""
+Home timeline: fan-out-on-write over Follow edges.
+
+Creating a post pushes its id into the author's and every follower's
+TimelineEntry rows, capped at TIMELINE_MAX_ENTRIES per reader, so reading
+the home feed is a single range scan on ``(user, created_at, post)``.
+
+Authors with TIMELINE_FANOUT_LIMIT or more followers are not fanned out;
+their recent posts are merged into the page at read time instead. When an
+author drops back under the limit, their recent posts are copied into
+their followers' timelines (backfill_followers), since they are no longer
+merged in.
+
+Fan-out trims a reader's timeline back to TIMELINE_MAX_ENTRIES once it
+holds more than TIMELINE_TRIM_SLACK entries over that, not after every
+post, so a timeline can briefly hold that many extra entries. Reads take
+a page from the top and never see them.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .counters import follower_count
+from .feed import (
+    FEED_COMMENTS_PER_POST, FEED_PAGE_SIZE,
+    after_cursor, annotated_posts, build_page, clamp_page_size,
+)
+from .models import Follow, Post, Profile, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _insert(user_ids, posts):
+    """Write ``posts`` (``(id, created_at)`` pairs) into each user's timeline."""
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at)
+            for user_id in user_ids
+            for post_id, created_at in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim_timelines(user_ids):
+    """Drop everything past the newest TIMELINE_MAX_ENTRIES for each user."""
+    overflow = list(
+        TimelineEntry.objects.filter(user_id__in=user_ids)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("user_id")],
+                order_by=[F("created_at").desc(), F("post_id").desc()],
+            )
+        )
+        .filter(rank__gt=settings.TIMELINE_MAX_ENTRIES)
+        .values_list("id", flat=True)
+    )
+    if overflow:
+        TimelineEntry.objects.filter(id__in=overflow).delete()
+
+
+def overfull(user_ids):
+    """The users among ``user_ids`` holding more than TIMELINE_TRIM_SLACK entries past the maximum."""
+    return list(
+        TimelineEntry.objects.filter(user_id__in=user_ids)
+        .values("user_id")
+        .annotate(entries=Count("id"))
+        .filter(entries__gt=settings.TIMELINE_MAX_ENTRIES + settings.TIMELINE_TRIM_SLACK)
+        .values_list("user_id", flat=True)
+    )
+
+
+# celebrities (fan-out-on-read)
+
+def is_celebrity(user):
+    return follower_count(user) >= settings.TIMELINE_FANOUT_LIMIT
+
+
+def celebrity_ids():
+    return set(
+        Profile.objects.filter(follower_count__gte=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list("user_id", flat=True)
+    )
+
+
+def celebrity_ids_followed_by(user):
+    return list(
+        Follow.objects.filter(
+            follower=user,
+            following__profile__follower_count__gte=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list("following_id", flat=True)
+    )
+
+
+# writes
+
+def fan_out_post(post):
+    """Push ``post`` into its author's timeline and their followers'.
+
+    Returns the number of timelines written to.
+    """
+    if post.author_id is None:
+        return 0
+
+    readers = [post.author_id]
+    if not is_celebrity(post.author):
+        followers = Follow.objects.filter(following_id=post.author_id).values_list("follower_id", flat=True)
+        readers = readers + list(followers)
+
+    # each post adds one entry per reader; trimming after every one would
+    # rank every reader's whole timeline each time, so only the readers
+    # that have run past the slack are ranked
+    for chunk in _chunks(readers, BATCH_SIZE):
+        _insert(chunk, [(post.id, post.created_at)])
+        trim = overfull(chunk)
+        if trim:
+            trim_timelines(trim)
+    return len(readers)
+
+
+def _recent_posts(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at")[:settings.TIMELINE_BACKFILL_POSTS]
+    )
+
+
+def backfill(reader, author):
+    """Copy ``author``'s recent posts into ``reader``'s timeline after a follow."""
+    if is_celebrity(author):
+        return
+    _insert([reader.id], _recent_posts(author.id))
+    trim_timelines([reader.id])
+
+
+def backfill_followers(author_id):
+    """Copy ``author``'s recent posts into every follower's timeline, once
+    they have dropped under TIMELINE_FANOUT_LIMIT and are no longer merged
+    in at read time. Returns the number of timelines written to."""
+    posts = _recent_posts(author_id)
+    followers = Follow.objects.filter(following_id=author_id).order_by("follower_id").values_list("follower_id", flat=True)
+    written = 0
+    for chunk in _chunks(followers.iterator(), BATCH_SIZE):
+        _insert(chunk, posts)
+        trim_timelines(chunk)
+        written += len(chunk)
+    return written
+
+
+def left_celebrities(follower_count, delta):
+    """Whether a follow change of ``delta`` that left ``follower_count``
+    took the author under TIMELINE_FANOUT_LIMIT."""
+    return delta < 0 and follower_count < settings.TIMELINE_FANOUT_LIMIT <= follower_count - delta
+
+
+def purge(reader, author):
+    """Remove ``author``'s posts from ``reader``'s timeline after an unfollow."""
+    TimelineEntry.objects.filter(user=reader, post__author=author).delete()
+
+
+def rebuild_timeline(user, celebrities=frozenset()):
+    """Rebuild one user's timeline from their own and followed authors' posts.
+
+    Runs in one transaction, so readers see the old timeline until the new
+    one is complete, never an empty one.
+    """
+    authors = Follow.objects.filter(follower=user).exclude(following_id__in=celebrities).values("following_id")
+    posts = list(
+        Post.objects.filter(Q(author=user) | Q(author_id__in=authors))
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at")[:settings.TIMELINE_MAX_ENTRIES]
+    )
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user=user).delete()
+        _insert([user.id], posts)
+    return len(posts)
+
+
+# reads
+
+def get_home_page(viewer, cursor=None, page_size=FEED_PAGE_SIZE, comments_per_post=FEED_COMMENTS_PER_POST):
+    page_size = clamp_page_size(page_size)
+
+    entries = after_cursor(
+        TimelineEntry.objects.filter(user=viewer).order_by("-created_at", "-post_id"),
+        cursor,
+        pk_field="post_id",
+    )
+    keys = list(entries.values_list("created_at", "post_id")[:page_size + 1])
+
+    celebrities = celebrity_ids_followed_by(viewer)
+    if celebrities:
+        pulled = after_cursor(
+            Post.objects.filter(author_id__in=celebrities).order_by("-created_at", "-id"),
+            cursor,
+        )
+        pulled = pulled.values_list("created_at", "id")[:page_size + 1]
+        keys = sorted(set(keys) | set(pulled), reverse=True)[:page_size + 1]
+
+    posts = annotated_posts(viewer).in_bulk([post_id for _, post_id in keys])
+    return build_page(
+        [posts[post_id] for _, post_id in keys if post_id in posts],
+        page_size,
+        comments_per_post,
+    )
@@ -1,15 +1,23 @@
 from django.urls import path, include, reverse_lazy
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, views
+from .forms import QueuedPasswordResetForm
 from django.conf import settings 
 from django.conf.urls.static import static 
 
+# read-heavy pages served by the async views when ASYNC_VIEWS is on
+pages = async_views if settings.ASYNC_VIEWS else views
+
 app_name = "accounts"
 
 urlpatterns = [
     path('', views.home_view, name='home'),
-    path('feed/', views.feed, name='feed'),
-    path("view_post/<int:post_id>/", views.view_post, name="view_post"),
+    path('feed/', pages.feed, name='feed'),
+    path('feed/api/', views.feed_api, name='feed_api'),
+    path('feed/following/', views.home_feed, name='home_feed'),
+    path('feed/following/api/', views.home_feed_api, name='home_feed_api'),
+    path("view_post/<int:post_id>/", pages.view_post, name="view_post"),
+    path("view_post/<int:post_id>/comments/", views.post_comments, name="post_comments"),
 
     # User Auth
     path("signup/", views.signup_view, name="signup"),
@@ -17,8 +25,8 @@ urlpatterns = [
     path("logout/", views.logout_view, name="logout"),
 
     # Profile Mgt
-    path('profile/', views.profile_view, name='profile'),
-    path('profile/<str:username>/', views.profile_view, name='profile_with_username'),
+    path('profile/', pages.profile_view, name='profile'),
+    path('profile/<str:username>/', pages.profile_view, name='profile_with_username'),
     path('edit_profile/', views.edit_profile, name='edit_profile'),
  
     # Password Change
@@ -36,6 +44,7 @@ urlpatterns = [
         'password-reset/', 
         auth_views.PasswordResetView.as_view(
             template_name='accounts/password_reset.html',
+            form_class=QueuedPasswordResetForm,
             success_url=reverse_lazy('accounts:password_reset_done'),
             email_template_name='accounts/password_reset_email.html' 
         ), 
@@ -69,7 +78,8 @@ urlpatterns = [
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
 
     # Search
-    path("search/", views.search_musicians, name="search_musicians"),
+    path("search/", pages.search_musicians, name="search_musicians"),
+    path("search/autocomplete/", views.search_autocomplete, name="search_autocomplete"),
     
     # Musician Detail
     path("musician/<int:user_id>/", views.musician_detail, name="musician_detail"),
@@ -2,12 +2,23 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout as auth_logout
 from django.contrib.auth.decorators import login_required
 from .forms import SignUpForm, ProfileForm, PostForm, CommentForm, EditProfileForm
-from .models import Profile, Follow, Post, Like, Comment
-from django.db.models import Q, Prefetch
+from .models import Profile, Follow, Post, Like, Comment, Facet
+from .feed import (
+    COMMENTS_PAGE_SIZE, FEED_PAGE_SIZE, POST_COMMENTS_PREVIEW, get_comment_page, get_feed_page, attach_previews,
+    serialize_comment, serialize_page,
+)
+from .follow_state import follow_state_for
+from .templatetags.custom_filters import render_comment
+from .autocomplete import KINDS as AUTOCOMPLETE_KINDS, TOP_K, autocomplete
+from . import caching, conditional, counters, search, timeline
+from .tasks import PRIORITY_FAN_OUT, PRIORITY_IMAGES
+from jobs.queue import enqueue
 from django.contrib.auth.models import User
 from django.http import HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.views.decorators.http import condition
 
 def home_view(request):
     return render(request, 'accounts/home.html')
@@ -19,8 +30,7 @@ def signup_view(request):
         form = SignUpForm(request.POST)
         if form.is_valid():
             user = form.save()
-            Profile.objects.create(user=user)
-            login(request, user)
+            login(request, user, backend="accounts.backends.CachedModelBackend")
             return redirect("accounts:profile")
     else:
         form = SignUpForm()
@@ -49,21 +59,25 @@ def logout_view(request):
 #profile
 
 @login_required
+@condition(etag_func=conditional.profile_etag)
 def profile_view(request, username=None):
+    # header and posts come from the versioned cache (see caching.py)
     if username:
-        profile_user = get_object_or_404(Profile, user__username=username).user
+        profile = caching.profile_by_username(username)
+        if profile is None:
+            # users made outside signup (createsuperuser, the admin) have none yet
+            profile, created = Profile.objects.get_or_create(user=get_object_or_404(User, username=username))
     else:
-        profile_user = request.user
-
-    profile, created = Profile.objects.get_or_create(user=profile_user)
-    posts = Post.objects.filter(author=profile_user).order_by('-created_at')
-    follower_count = Follow.objects.filter(following=profile_user).count()
-    following_count = Follow.objects.filter(follower=profile_user).count()
+        profile = caching.profile_header(request.user.id)
+        if profile is None:
+            profile, created = Profile.objects.get_or_create(user=request.user)
+    profile_user = profile.user
+    posts, comments_by_post = caching.profile_posts(profile_user.id)
 
 
     is_following = False
     if request.user.is_authenticated and request.user != profile_user:
-        is_following = Follow.objects.filter(follower=request.user, following=profile_user).exists()
+        is_following = follow_state_for(request.user).is_following(profile_user)
 
 
     if request.method == "POST" and "comment" in request.POST:
@@ -72,19 +86,15 @@ def profile_view(request, username=None):
         if post_id and comment_text:
             post = get_object_or_404(Post, id=post_id)
             Comment.objects.create(user=request.user, post=post, text=comment_text)
+            counters.post_commented(post.id)
             if username:
                 return redirect("accounts:profile_with_username", username=username)
             else:
                 return redirect("accounts:profile")
 
     liked_posts = set(
-        Like.objects.filter(user=request.user, post__in=posts).values_list("post_id", flat=True)
-    )
-
-    comments_by_post = {
-        post.id: Comment.objects.filter(post=post).order_by('-created_at')
-        for post in posts
-    }
+        Like.objects.filter(user=request.user, post_id__in=[post.id for post in posts]).values_list("post_id", flat=True)
+    ) if posts else set()
 
     form = ProfileForm(instance=profile) if request.user == profile_user else None
 
@@ -92,9 +102,9 @@ def profile_view(request, username=None):
         "profile_user": profile_user,
         "profile": profile,
         "posts": posts,
-        "follower_count": follower_count,
-        "following_count": following_count,
-        "total_posts": posts.count(),
+        "follower_count": profile.follower_count,
+        "following_count": profile.following_count,
+        "total_posts": profile.post_count,
         "liked_posts": liked_posts,
         "comments_by_post": comments_by_post,
         "form": form,
@@ -110,7 +120,9 @@ def edit_profile(request):
     if request.method == "POST":
         form = ProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            form.save()
+            profile = form.save()
+            if "avatar" in form.changed_data:
+                enqueue("accounts.process_avatar", {"profile_id": profile.id}, priority=PRIORITY_IMAGES)
             return redirect('accounts:profile_with_username', username=request.user.username)
     else:
         form = ProfileForm(instance=profile)
@@ -144,14 +156,29 @@ def follow_toggle(request, username):
     follow_instance = Follow.objects.filter(follower=follower, following=target_user)
     is_following = follow_instance.exists()
 
+    # a double submit races itself; only the request that changed a row
+    # moves the counters
     if is_following:
-        follow_instance.delete()
+        deleted, _ = follow_instance.delete()
+        if deleted:
+            new_follower_count = counters.user_followed(follower.id, target_user.id, -1)
+            timeline.purge(follower, target_user)
+            if timeline.left_celebrities(new_follower_count, -1):
+                enqueue("accounts.backfill_followers", {"author_id": target_user.id}, priority=PRIORITY_FAN_OUT)
+        else:
+            new_follower_count = counters.follower_count(target_user)
         new_status = False
     else:
-        Follow.objects.create(follower=follower, following=target_user)
+        try:
+            with transaction.atomic():
+                Follow.objects.create(follower=follower, following=target_user)
+        except IntegrityError:
+            new_follower_count = counters.follower_count(target_user)
+        else:
+            new_follower_count = counters.user_followed(follower.id, target_user.id)
+            timeline.backfill(follower, target_user)
         new_status = True
-        
-    new_follower_count = Follow.objects.filter(following=target_user).count()
+    follow_state_for(follower).set(target_user, new_status)
         
     return JsonResponse({
         'status': 'success',
@@ -170,6 +197,10 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            if post.image:
+                enqueue("accounts.process_post_image", {"post_id": post.id}, priority=PRIORITY_IMAGES)
+            counters.post_published(request.user.id)
+            enqueue("accounts.fan_out_post", {"post_id": post.id}, priority=PRIORITY_FAN_OUT)
             return redirect("accounts:profile")
     else:
         form = PostForm()
@@ -184,7 +215,9 @@ def delete_post(request, post_id):
         return redirect('accounts:profile')
 
     if request.method == 'POST':
-        post.delete()
+        _, deleted = post.delete()
+        if deleted.get(Post._meta.label):
+            counters.post_published(request.user.id, -1)
         messages.success(request, "Post deleted successfully!")
         return redirect('accounts:profile')
 
@@ -194,44 +227,90 @@ def delete_post(request, post_id):
 #feed
 
 @login_required
+@condition(etag_func=conditional.feed_etag)
 def feed(request):
-    posts = Post.objects.select_related(
-        'author', 
-        'author__profile' 
-    ).prefetch_related(
-        'likes', 
-        'comments' 
-    ).order_by('-created_at')
+    page = get_feed_page(request.user, request.GET.get("cursor"))
 
-    for post in posts:
-        post.is_liked_by_user = post.likes.filter(user=request.user).exists()
-        
-    comments_by_post = {post.id: Comment.objects.filter(post=post).order_by('-created_at') for post in posts} 
+    return render(request, "accounts/feed.html", {
+        "posts": page.posts,
+        "comments_by_post": page.comments_by_post,
+        "next_cursor": page.next_cursor,
+        "has_next": page.has_next,
+    })
 
-    if request.method == "POST" and "comment" in request.POST:
-        pass
+
+@login_required
+def feed_api(request):
+    try:
+        page_size = int(request.GET.get("limit", FEED_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    page = get_feed_page(request.user, request.GET.get("cursor"), page_size=page_size)
+    return JsonResponse(serialize_page(page))
+
+
+@login_required
+def home_feed(request):
+    page = timeline.get_home_page(request.user, request.GET.get("cursor"))
 
     return render(request, "accounts/feed.html", {
-        "posts": posts,
-        "comments_by_post": comments_by_post,
+        "posts": page.posts,
+        "comments_by_post": page.comments_by_post,
+        "next_cursor": page.next_cursor,
+        "has_next": page.has_next,
+        "is_home_feed": True,
     })
 
+
+@login_required
+def home_feed_api(request):
+    try:
+        page_size = int(request.GET.get("limit", FEED_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    page = timeline.get_home_page(request.user, request.GET.get("cursor"), page_size=page_size)
+    return JsonResponse(serialize_page(page))
+
 #like & comment
 
+def _wants_json(request):
+    # fetch() callers ask for JSON; plain links and forms keep the redirects
+    return (
+        request.headers.get("x-requested-with") == "XMLHttpRequest"
+        or request.get_preferred_type(["text/html", "application/json"]) == "application/json"
+    )
+
+
 @login_required
 def like_toggle(request, post_id):
+    if _wants_json(request):
+        if request.method != 'POST':
+            return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+        # an explicit "liked" makes retries safe; without it, toggle
+        liked = request.POST.get("liked")
+        if liked is None:
+            liked = not Like.objects.filter(post_id=post_id, user=request.user).exists()
+        else:
+            liked = liked.lower() in ("1", "true", "on")
+
+        like_count = counters.set_liked(post_id, request.user.id, liked)
+        if like_count is None:
+            return JsonResponse({'error': 'Post not found'}, status=404)
+        return JsonResponse({'liked': liked, 'like_count': like_count})
+
     post = get_object_or_404(Post, id=post_id)
-    
-    like, created = Like.objects.get_or_create(post=post, user=request.user)
-    
-    if not created:
-        like.delete()
-        
+    liked = not Like.objects.filter(post=post, user=request.user).exists()
+    counters.set_liked(post.id, request.user.id, liked)
+
     return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/feed/')) 
 
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
+    wants_json = _wants_json(request)
     if request.method == "POST":
         form = CommentForm(request.POST)
         if form.is_valid():
@@ -239,9 +318,21 @@ def add_comment(request, post_id):
             comment.user = request.user
             comment.post = post
             comment.save()
+            comment_count = counters.post_commented(post.id)
+
+            if wants_json:
+                return JsonResponse({
+                    'comment': serialize_comment(comment),
+                    'html': render_comment(comment),
+                    'comment_count': comment_count,
+                }, status=201)
             
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', reverse('accounts:feed')))
-            
+        if wants_json:
+            return JsonResponse({'errors': form.errors}, status=400)
+
+    if wants_json:
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
     return redirect('accounts:view_post', post_id=post.id)
 
 
@@ -253,7 +344,9 @@ def delete_comment(request, comment_id):
         return redirect('accounts:feed')
 
     if request.method == 'POST':
-        comment.delete()
+        deleted, _ = comment.delete()
+        if deleted:
+            counters.post_commented(comment.post_id, -1)
         messages.success(request, "Comment deleted successfully!")
         return redirect('accounts:feed')
 
@@ -263,15 +356,22 @@ def delete_comment(request, comment_id):
 #musician detail
 
 @login_required
+@condition(etag_func=conditional.musician_detail_etag)
 def musician_detail(request, user_id):
-    musician = get_object_or_404(User, id=user_id)
-    profile, _ = Profile.objects.get_or_create(user=musician)
-    posts = Post.objects.filter(author=musician).order_by('-created_at')
-
+    profile = caching.profile_header(user_id)
+    if profile is None:
+        musician = get_object_or_404(User, id=user_id)
+        profile, _ = Profile.objects.get_or_create(user=musician)
+    musician = profile.user
+    posts, comments_by_post = caching.profile_posts(musician.id)
+
+    liked = set(
+        Like.objects.filter(user=request.user, post_id__in=[post.id for post in posts]).values_list("post_id", flat=True)
+    ) if posts else set()
     for post in posts:
-        post.has_liked = post.likes.filter(user=request.user).exists()
+        post.has_liked = post.id in liked
 
-    is_following = Follow.objects.filter(follower=request.user, following=musician).exists()
+    is_following = follow_state_for(request.user).is_following(musician)
 
    
     if request.method == "POST":
@@ -281,18 +381,17 @@ def musician_detail(request, user_id):
             if text.strip():
                 post = get_object_or_404(Post, id=post_id)
                 Comment.objects.create(post=post, user=request.user, text=text)
+                counters.post_commented(post.id)
         return redirect("accounts:musician_detail", user_id=musician.id)
 
-    comments_by_post = {post.id: Comment.objects.filter(post=post).order_by("-created_at") for post in posts}
-
     return render(request, "accounts/musician_detail.html", {
         "musician": musician,
         "profile": profile,
         "posts": posts,
         "is_following": is_following,
-        "total_posts": posts.count(),
-        "follower_count": Follow.objects.filter(following=musician).count(),
-        "following_count": Follow.objects.filter(follower=musician).count(),
+        "total_posts": profile.post_count,
+        "follower_count": profile.follower_count,
+        "following_count": profile.following_count,
         "comments_by_post": comments_by_post,
     })
 
@@ -301,28 +400,38 @@ def musician_detail(request, user_id):
 
 def search_musicians(request):
     query = request.GET.get("q", "")
-    if query:
-        results = Profile.objects.filter(
-            Q(user__username__icontains=query) |
-            Q(bio__icontains=query) |
-            Q(instrument__icontains=query)
-        )
-    else:
-        results = Profile.objects.all()
-    
-    return render(request, "accounts/search.html", {"query": query, "results": results})
+    instrument = request.GET.get("instrument", "")
+    location = request.GET.get("location", "")
+
+    page = search.search_profiles(query, instrument=instrument, location=location, page=request.GET.get("page"))
+    follow_state_for(request.user).prime(profile.user_id for profile in page.object_list)
+
+    return render(request, "accounts/search.html", {
+        "query": query,
+        "results": page.object_list,
+        "page_obj": page,
+        "instrument": instrument,
+        "location": location,
+        "instrument_facets": search.facets(Facet.INSTRUMENT),
+        "location_facets": search.facets(Facet.LOCATION),
+    })
+
+def search_autocomplete(request):
+    prefix = request.GET.get("q", "").strip()
+    kinds = [kind for kind in request.GET.getlist("kind") if kind in AUTOCOMPLETE_KINDS] or AUTOCOMPLETE_KINDS
+    try:
+        limit = max(1, min(int(request.GET.get("limit", TOP_K)), TOP_K))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    if not prefix:
+        return JsonResponse({"q": prefix, "results": {kind: [] for kind in kinds}})
+    return JsonResponse({"q": prefix, "results": autocomplete.suggest(prefix, kinds, limit)})
 
 @login_required
+@condition(etag_func=conditional.post_etag)
 def view_post(request, post_id):
-    post = get_object_or_404(
-        Post.objects.select_related('author').prefetch_related( 
-            Prefetch(
-                'comments', 
-                queryset=Comment.objects.select_related('user__profile') 
-            )
-        ), 
-        id=post_id
-    )
+    post = get_object_or_404(Post.objects.select_related('author__profile'), id=post_id)
 
     is_liked_by_user = post.likes.filter(user=request.user).exists()
     comment_form = CommentForm()
@@ -335,14 +444,40 @@ def view_post(request, post_id):
                 comment.user = request.user 
                 comment.post = post
                 comment.save()
+                counters.post_commented(post.id)
                 messages.success(request, "Comment added successfully!")
                 return redirect('accounts:view_post', post_id=post.id)
             else:
                 comment_form = form
 
+    # the newest comments; older ones are paged in from post_comments
+    comments_by_post = Comment.objects.previews([post], POST_COMMENTS_PREVIEW)
+    attach_previews([post], comments_by_post)
+    comments = comments_by_post[post.id]
+
     context = {
         "post": post,
+        "comments": comments,
+        "comment_total": post.comment_total,
+        "comments_cursor": post.comments_cursor,
         "is_liked_by_user": is_liked_by_user, 
         "comment_form": comment_form,
     }
-    return render(request, "accounts/view_post.html", context)
\ No newline at end of file
+    return render(request, "accounts/view_post.html", context)
+
+
+@login_required
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('id', 'comment_count'), id=post_id)
+    try:
+        page_size = int(request.GET.get("limit", COMMENTS_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    comments, next_cursor = get_comment_page(post.id, request.GET.get("cursor"), page_size=page_size)
+    return JsonResponse({
+        "comments": [serialize_comment(comment) for comment in comments],
+        "comment_count": post.comment_count,
+        "next_cursor": next_cursor,
+        "has_next": next_cursor is not None,
+    })
@@ -0,0 +1,27 @@
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+
+from accounts.async_views import login_required_async
+
+from .inbox import decorate, inbox_threads, trim_page
+from .views import INBOX_PAGE_SIZE
+
+
+# =========================================================
+# INBOX VIEW (ASGI-native; see accounts/async_views.py)
+# =========================================================
+@login_required_async
+async def inbox_view(request):
+    """Lists all chat threads the current user is a part of."""
+
+    # One query, as in chat/views.py
+    threads = inbox_threads(request.user, request.GET.get('cursor'))[:INBOX_PAGE_SIZE + 1]
+    threads, next_cursor = trim_page([thread async for thread in threads], INBOX_PAGE_SIZE)
+
+    context = {
+        'threads': decorate(threads, request.user),
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None,
+        'page_title': 'Message Inbox'
+    }
+    return await sync_to_async(render)(request, 'chat/inbox.html', context)
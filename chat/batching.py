@@ -0,0 +1,163 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .inbox import record_last_message
+from .models import ChatThread, Message
+
+logger = logging.getLogger(__name__)
+
+
+class Pending:
+    __slots__ = ("thread_id", "sender_id", "content", "reply_channel", "received_at", "attempts")
+
+    def __init__(self, thread_id, sender_id, content, reply_channel=None, received_at=None):
+        self.thread_id = thread_id
+        self.sender_id = sender_id
+        self.content = content
+        self.reply_channel = reply_channel
+        self.received_at = received_at or timezone.now()
+        self.attempts = 0
+
+
+class MessageBatcher:
+    """
+    Coalesces messages received over WebSocket into ``bulk_create`` batches.
+
+    Messages are buffered per process and written together once
+    CHAT_FLUSH_INTERVAL seconds have passed since the first one arrived,
+    or as soon as CHAT_BATCH_SIZE are waiting. Each batch is one INSERT
+    plus one UPDATE of ``ChatThread.updated`` and the last-message pointer
+    for the threads it touched.
+
+    Messages are broadcast before they are written, and stored with the
+    time they were received, the one the broadcast carried. A batch whose
+    write fails goes back to the front of the buffer and is retried, up
+    to CHAT_WRITE_ATTEMPTS times; messages that still fail, or that would
+    push the buffer past CHAT_PENDING_MAX, are dropped with an error log
+    and their senders get a ``chat.failed`` event. Flushes run one at a
+    time, so a retried batch is always written before the messages that
+    arrived after it, and gets the lower ids.
+
+    Consumers flush on disconnect, and ``lifespan`` flushes on server
+    shutdown (ASGI servers that send lifespan events, e.g. uvicorn).
+
+    Once a batch is stored, each thread's room gets a ``chat.stored``
+    event with its newest message id, so the participants connected to
+    it, who have had every message delivered live, move their read
+    markers forward.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self._timer = None
+        self._flushing = asyncio.Lock()
+
+    async def add(self, thread_id, sender_id, content, reply_channel=None, received_at=None):
+        self.pending.append(Pending(thread_id, sender_id, content, reply_channel, received_at))
+
+        if len(self.pending) >= settings.CHAT_BATCH_SIZE:
+            await self.flush()
+        else:
+            self._schedule(settings.CHAT_FLUSH_INTERVAL)
+
+    def _schedule(self, delay):
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._flush_later(delay))
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        async with self._flushing:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                stored = await database_sync_to_async(self.write)(batch)
+            except Exception:
+                logger.exception("Failed to persist %d chat messages", len(batch))
+                await self.requeue(batch)
+                return
+
+        layer = get_channel_layer()
+        for thread_id, last_message_id in stored.items():
+            await layer.group_send(room_group(thread_id), {
+                'type': 'chat.stored',
+                'last_message_id': last_message_id,
+            })
+
+    async def requeue(self, batch):
+        for entry in batch:
+            entry.attempts += 1
+        retry = [entry for entry in batch if entry.attempts < settings.CHAT_WRITE_ATTEMPTS]
+        failed = [entry for entry in batch if entry.attempts >= settings.CHAT_WRITE_ATTEMPTS]
+
+        # older messages go first, and the buffer stays bounded
+        self.pending = retry + self.pending
+        overflow = len(self.pending) - settings.CHAT_PENDING_MAX
+        if overflow > 0:
+            failed += self.pending[:overflow]
+            self.pending = self.pending[overflow:]
+
+        if self.pending:
+            # back off while the database is failing
+            attempts = max((entry.attempts for entry in retry), default=0)
+            self._schedule(settings.CHAT_FLUSH_INTERVAL * 2 ** attempts)
+        if failed:
+            logger.error("Dropped %d chat messages that could not be saved", len(failed))
+            await self.notify_failed(failed)
+
+    @staticmethod
+    async def notify_failed(entries):
+        layer = get_channel_layer()
+        for entry in entries:
+            if entry.reply_channel:
+                await layer.send(entry.reply_channel, {
+                    'type': 'chat.failed',
+                    'message': entry.content,
+                })
+
+    @staticmethod
+    def write(batch):
+        """Store ``batch``; returns ``{thread id: newest message id}``."""
+        thread_ids = {entry.thread_id for entry in batch}
+        with transaction.atomic():
+            Message.objects.bulk_create([
+                Message(
+                    thread_id=entry.thread_id, sender_id=entry.sender_id, content=entry.content,
+                    timestamp=entry.received_at,
+                )
+                for entry in batch
+            ])
+            record_last_message(thread_ids, timezone.now())
+            # bulk_create does not return ids on MySQL, so read them back
+            return dict(ChatThread.objects.filter(id__in=thread_ids).values_list('id', 'last_message_id'))
+
+
+def room_group(thread_id):
+    """The channel layer group of a thread's connected participants."""
+    return f'chat_{thread_id}'
+
+
+# One buffer per process, shared by every consumer it serves
+batcher = MessageBatcher()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan app: write whatever is still buffered before the server exits."""
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await batcher.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
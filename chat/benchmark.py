@@ -0,0 +1,196 @@
+"""
+WebSocket load harness for ChatConsumer.
+
+Simulated clients are Channels ``WebsocketCommunicator`` instances
+talking to the real consumer over the in-memory channel layer, with
+``scope["user"]`` set directly instead of going through the session and
+origin middleware. Rooms are existing chat threads, with several
+connections per participant, like open tabs.
+
+run() connects every client, has each one send a burst of messages, and
+waits until every client in the room has received every message. It
+reports:
+- send and delivery rates;
+- end-to-end fan-out latency, timed from a timestamp carried in the
+  message;
+- memory per connection, from tracemalloc over the connect phase;
+- group memberships still left in the layer after every client has
+  disconnected.
+
+soak() repeats connect/send/disconnect cycles for a while and samples
+group memberships and traced memory after each one. Both should come
+back to where they started.
+"""
+import asyncio
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from accounts.benchmark import percentile
+
+from .batching import batcher
+from .routing import websocket_urlpatterns
+
+# Benchmark messages start with this, so they can be found and removed
+MARKER = "bench:"
+
+
+def memberships(layer):
+    """Channels currently in any group of the in-memory layer."""
+    return sum(len(channels) for channels in layer.groups.values())
+
+
+class SimulatedClient:
+
+    def __init__(self, application, thread, user):
+        self.thread_id = thread.id
+        self.communicator = WebsocketCommunicator(application, f"/ws/chat/{thread.id}/")
+        self.communicator.scope["user"] = user
+        self.latencies = []
+
+    async def connect(self, timeout):
+        # participant checks queue up on the single database thread
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        return connected
+
+    async def send(self, count, interval=0):
+        for _ in range(count):
+            await self.communicator.send_to(
+                text_data=json.dumps({"message": f"{MARKER}{time.perf_counter_ns()}"})
+            )
+            await asyncio.sleep(interval)
+
+    async def receive(self, expected, timeout):
+        """Collect up to ``expected`` messages; stop early if none arrives for ``timeout`` seconds."""
+        while len(self.latencies) < expected:
+            try:
+                frame = json.loads(await self.communicator.receive_from(timeout=timeout))
+            except asyncio.TimeoutError:
+                return
+            sent = int(frame["message"][len(MARKER):])
+            self.latencies.append((time.perf_counter_ns() - sent) / 1e6)
+
+    async def disconnect(self, timeout):
+        await self.communicator.disconnect(timeout=timeout)
+
+
+async def _in_batches(coroutines, size):
+    results = []
+    for start in range(0, len(coroutines), size):
+        results += await asyncio.gather(*coroutines[start:start + size])
+    return results
+
+
+async def open_clients(application, threads, per_room, batch_size, timeout):
+    clients = [
+        SimulatedClient(application, thread, (thread.user1, thread.user2)[n % 2])
+        for thread in threads
+        for n in range(per_room)
+    ]
+    connected = await _in_batches([client.connect(timeout) for client in clients], batch_size)
+    return [client for client, ok in zip(clients, connected) if ok]
+
+
+async def close_clients(clients, batch_size, timeout):
+    await _in_batches([client.disconnect(timeout) for client in clients], batch_size)
+    # write whatever the consumers left buffered
+    await batcher.flush()
+
+
+async def run(threads, per_room=10, messages=10, interval=0, timeout=5, batch_size=200):
+    application = URLRouter(websocket_urlpatterns)
+    layer = get_channel_layer()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    clients = await open_clients(application, threads, per_room, batch_size, timeout)
+    connect_seconds = time.perf_counter() - started
+    gc.collect()
+    connected_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    senders_per_room = {}
+    for client in clients:
+        senders_per_room[client.thread_id] = senders_per_room.get(client.thread_id, 0) + 1
+    expected = sum(senders_per_room[client.thread_id] * messages for client in clients)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(client.receive(senders_per_room[client.thread_id] * messages, timeout) for client in clients),
+        *(client.send(messages, interval) for client in clients),
+    )
+    elapsed = time.perf_counter() - started
+
+    await close_clients(clients, batch_size, timeout)
+    latencies = [latency for client in clients for latency in client.latencies]
+    delivered = len(latencies)
+    sent = len(clients) * messages
+    return {
+        "rooms": len(threads),
+        "connections": len(clients),
+        "rejected": len(threads) * per_room - len(clients),
+        "connect_seconds": round(connect_seconds, 3),
+        "bytes_per_connection": round(connected_bytes / len(clients)) if clients else None,
+        "sent": sent,
+        "expected_deliveries": expected,
+        "delivered": delivered,
+        "dropped": expected - delivered,
+        "elapsed_seconds": round(elapsed, 3),
+        "sent_per_second": round(sent / elapsed, 1),
+        "delivered_per_second": round(delivered / elapsed, 1),
+        "latency_ms": {
+            pct: round(percentile(latencies, pct), 2) if latencies else None for pct in (50, 95, 99)
+        },
+        "leaked_memberships": memberships(layer),
+    }
+
+
+async def soak(threads, duration, per_room=4, rooms_per_cycle=50, messages=2, timeout=2, batch_size=200):
+    application = URLRouter(websocket_urlpatterns)
+    layer = get_channel_layer()
+    rng = random.Random()
+    samples = []
+
+    tracemalloc.start()
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            rooms = rng.sample(threads, min(rooms_per_cycle, len(threads)))
+            clients = await open_clients(application, rooms, per_room, batch_size, timeout)
+            await asyncio.gather(
+                *(client.receive(per_room * messages, timeout) for client in clients),
+                *(client.send(messages) for client in clients),
+            )
+            await close_clients(clients, batch_size, timeout)
+            del clients
+            gc.collect()
+            samples.append({
+                "memberships": memberships(layer),
+                "queued_channels": len(layer.channels),
+                "traced_kib": round(tracemalloc.get_traced_memory()[0] / 1024, 1),
+            })
+    finally:
+        tracemalloc.stop()
+
+    if not samples:
+        return {"cycles": 0}
+    # the first cycle warms caches and imports; growth is measured after it
+    first, last = samples[0], samples[-1]
+    growth = last["traced_kib"] - first["traced_kib"]
+    return {
+        "cycles": len(samples),
+        "max_memberships": max(sample["memberships"] for sample in samples),
+        "final_memberships": last["memberships"],
+        "final_queued_channels": last["queued_channels"],
+        "memory_growth_kib": round(growth, 1),
+        "growth_per_cycle_kib": round(growth / max(1, len(samples) - 1), 2),
+        "samples": samples,
+    }
@@ -1,12 +1,27 @@
 import json
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .batching import batcher, room_group
+from .inbox import mark_read
+from .models import ChatThread
 
 class ChatConsumer(AsyncWebsocketConsumer):
     # Runs when the WebSocket is first connected
     async def connect(self):
         # The room_name is captured from the URL (the chat thread ID)
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        self.room_group_name = f'chat_{self.room_name}'
+        self.room_group_name = room_group(self.room_name)
+        self.user = self.scope.get('user')
+
+        # Only authenticated participants of this thread may join it
+        if not self.room_name.isdigit() or not await self.is_participant():
+            await self.close()
+            return
+        self.thread_id = int(self.room_name)
 
         # Join room group (adds this consumer to the group for broadcasting)
         await self.channel_layer.group_add(
@@ -16,33 +31,72 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+    @database_sync_to_async
+    def is_participant(self):
+        if self.user is None or not self.user.is_authenticated:
+            return False
+        return ChatThread.objects.filter(
+            Q(user1=self.user) | Q(user2=self.user),
+            id=int(self.room_name),
+        ).exists()
+
     # Runs when the WebSocket is closed
     async def disconnect(self, close_code):
+        if not hasattr(self, 'thread_id'):
+            return  # rejected in connect(), never joined the group
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        # Don't leave this client's last messages waiting on the timer
+        await batcher.flush()
 
     # Receive message from WebSocket (from the user's browser)
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-        
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data)['message'].strip()
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return  # malformed frame, ignore it
+        if not message or len(message) > settings.CHAT_MESSAGE_MAX_LENGTH:
+            return
+
+        # Queue the message for the next batched write, stamped with the
+        # time the broadcast carries
+        received_at = timezone.now()
+        await batcher.add(self.thread_id, self.user.id, message, self.channel_name, received_at)
+
         # Send message to room group (broadcast to everyone in the chat thread)
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat.message', # This is a custom method name below
-                'message': message
+                'message': message,
+                'sender': self.user.username,
+                'timestamp': received_at.isoformat(),
             }
         )
 
     # Receive message from room group (broadcast handler)
     async def chat_message(self, event):
-        message = event['message']
-
         # Send message back to the WebSocket (to the user's browser)
         await self.send(text_data=json.dumps({
-            'message': message
-        }))
\ No newline at end of file
+            'message': event['message'],
+            'sender': event['sender'],
+            'timestamp': event['timestamp'],
+        }))
+
+    # A batch of this thread's messages was saved; everything up to it has
+    # been delivered here, so this participant has read it
+    async def chat_stored(self, event):
+        await database_sync_to_async(mark_read)(
+            ChatThread(id=self.thread_id), self.user, event['last_message_id']
+        )
+
+    # The batcher gave up on saving one of this client's messages
+    async def chat_failed(self, event):
+        await self.send(text_data=json.dumps({
+            'error': 'not_saved',
+            'message': event['message'],
+        }))
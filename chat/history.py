@@ -0,0 +1,51 @@
+"""
+Cursor-paginated chat history.
+
+Messages are read newest-first off the (thread, timestamp, id) index and
+handed back oldest-first, one page of the last N at a time, so opening a
+long-running thread costs the same as opening a new one.
+"""
+from accounts.feed import after_cursor, encode_cursor
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def clamp_limit(limit):
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+
+def history_page(thread, before=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Returns ``(messages, older_cursor)``: up to ``limit`` messages sent
+    before the ``before`` cursor (or the latest ones), oldest first, and
+    the cursor for the page before them (None at the start of the thread).
+    """
+    messages = thread.messages.select_related('sender').order_by('-timestamp', '-id')
+    batch = list(after_cursor(messages, before, field='timestamp')[:limit + 1])
+
+    older_cursor = None
+    if len(batch) > limit:
+        batch = batch[:limit]
+        older_cursor = encode_cursor(batch[-1].timestamp, batch[-1].id)
+
+    batch.reverse()
+    return batch, older_cursor
+
+
+def messages_since(thread, after_id, limit=HISTORY_MAX_PAGE_SIZE):
+    """Messages newer than ``after_id`` (the last one the client has), oldest first."""
+    return list(
+        thread.messages.select_related('sender')
+        .filter(id__gt=after_id)
+        .order_by('id')[:limit]
+    )
+
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'sender': message.sender.username,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+    }
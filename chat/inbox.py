@@ -0,0 +1,107 @@
+"""
+Inbox engine.
+
+Lists a user's threads with the other participant (and their profile
+avatar), a preview of the last message and the number of unread
+messages, all in one query. It relies on the denormalized
+``ChatThread.last_message`` pointer and per-participant ThreadReadMarker
+rows. Pages are keyset cursors over ``(last_message_at, id)``, like the
+feeds, so there is no COUNT query; threads without messages come last.
+"""
+from datetime import datetime, timezone
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.text import Truncator
+
+from accounts.feed import decode_cursor, encode_cursor
+
+from .models import ChatThread, Message, ThreadReadMarker
+
+SNIPPET_LENGTH = 80
+# stands in for the NULL last_message_at of threads without messages
+_NO_MESSAGES = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _after(threads, cursor):
+    position = decode_cursor(cursor)
+    if position is None:
+        return threads
+    last_message_at, pk = position
+    if last_message_at == _NO_MESSAGES:
+        return threads.filter(last_message_at__isnull=True, id__lt=pk)
+    return threads.filter(
+        Q(last_message_at__lt=last_message_at)
+        | Q(last_message_at=last_message_at, id__lt=pk)
+        | Q(last_message_at__isnull=True)
+    )
+
+
+def inbox_threads(user, cursor=None):
+    """Threads for ``user`` after ``cursor``, most recently active first, annotated for display."""
+    read_upto = ThreadReadMarker.objects.filter(
+        thread=OuterRef(OuterRef('pk')), user=user
+    ).values('last_read_message_id')[:1]
+    unread = (
+        Message.objects.filter(thread=OuterRef('pk'), id__gt=Coalesce(Subquery(read_upto), Value(0)))
+        .exclude(sender=user)
+        .order_by()
+        .values('thread')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    threads = (
+        ChatThread.objects.filter(Q(user1=user) | Q(user2=user))
+        .select_related('user1__profile', 'user2__profile', 'last_message__sender')
+        .annotate(unread_count=Coalesce(Subquery(unread), Value(0)))
+        .order_by(F('last_message_at').desc(nulls_last=True), '-id')
+    )
+    return _after(threads, cursor)
+
+
+def trim_page(threads, page_size):
+    """Cut up to ``page_size + 1`` threads to a page and the cursor for the next one."""
+    threads = list(threads)
+    if len(threads) > page_size:
+        threads = threads[:page_size]
+        last = threads[-1]
+        return threads, encode_cursor(last.last_message_at or _NO_MESSAGES, last.id)
+    return threads, None
+
+
+def decorate(threads, user):
+    """Attach ``other_user`` and ``snippet`` to each thread for the template."""
+    for thread in threads:
+        thread.other_user = thread.user2 if thread.user1_id == user.id else thread.user1
+        thread.snippet = (
+            Truncator(thread.last_message.content).chars(SNIPPET_LENGTH)
+            if thread.last_message else ''
+        )
+    return threads
+
+
+def mark_read(thread, user, message_id):
+    """Move ``user``'s read marker in ``thread`` forward to ``message_id``."""
+    moved = ThreadReadMarker.objects.filter(
+        thread=thread, user=user, last_read_message_id__lt=message_id
+    ).update(last_read_message_id=message_id)
+    if not moved:
+        ThreadReadMarker.objects.get_or_create(
+            thread=thread, user=user, defaults={'last_read_message_id': message_id}
+        )
+
+
+def record_last_message(thread_ids, updated=None):
+    """Point each thread at its newest message after a batch of writes.
+
+    ``updated`` also moves the threads' ``updated`` time; without it the
+    time is left as it is (an import keeps the exported one).
+    """
+    latest = Message.objects.filter(thread=OuterRef('pk')).order_by('-timestamp', '-id')
+    fields = {
+        'last_message': Subquery(latest.values('id')[:1]),
+        'last_message_at': Subquery(latest.values('timestamp')[:1]),
+    }
+    if updated is not None:
+        fields['updated'] = updated
+    ChatThread.objects.filter(id__in=thread_ids).update(**fields)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.test.utils import override_settings
+
+from accounts.synthetic import DEFAULT_PREFIX, synthetic_users
+from chat import benchmark
+from chat.models import ChatThread, Message, ThreadReadMarker
+
+
+class Command(BaseCommand):
+    help = "Load-test the chat WebSocket consumer over the in-memory channel layer (see chat/benchmark.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=100, help="Chat threads to use as rooms.")
+        parser.add_argument("--clients-per-room", type=int, default=10)
+        parser.add_argument("--messages", type=int, default=10, help="Messages sent by each client.")
+        parser.add_argument("--interval", type=float, default=0, help="Seconds between a client's messages.")
+        parser.add_argument("--timeout", type=float, default=5, help="Give up on a client after this idle time.")
+        parser.add_argument("--capacity", type=int, default=1000, help="Channel layer queue size per channel.")
+        parser.add_argument("--batch-size", type=int, default=200, help="Connections opened at once.")
+        parser.add_argument("--soak", type=float, metavar="SECONDS", help="Run connect/disconnect churn instead.")
+        parser.add_argument(
+            "--leak-threshold-kib", type=float, default=16,
+            help="Soak: traced memory growth per cycle treated as a leak.",
+        )
+        parser.add_argument("--fail-on-leak", action="store_true")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--keep-messages", action="store_true",
+            help="Keep the benchmark messages, and the read markers they moved.",
+        )
+        parser.add_argument(
+            "--prefix", default=DEFAULT_PREFIX, help="Use threads between users seed_synthetic made with this prefix.",
+        )
+
+    def handle(self, *args, **options):
+        # only threads between synthetic users, so real inboxes are never touched
+        users = synthetic_users(options["prefix"])
+        threads = list(
+            ChatThread.objects.filter(user1__in=users, user2__in=users)
+            .select_related("user1", "user2").order_by("-last_message_at")[:options["rooms"]]
+        )
+        if not threads:
+            raise CommandError("No chat threads to use as rooms; run seed_synthetic first.")
+        # every message the run writes gets a higher id
+        last_id_before = Message.objects.aggregate(last=Max("id"))["last"] or 0
+        # stored batches move the connected participants' read markers
+        markers = list(ThreadReadMarker.objects.filter(thread__in=threads))
+
+        layers = {
+            "default": {
+                "BACKEND": "channels.layers.InMemoryChannelLayer",
+                "CONFIG": {"capacity": options["capacity"]},
+            },
+        }
+        try:
+            with override_settings(CHANNEL_LAYERS=layers):
+                if options["soak"]:
+                    results = asyncio.run(benchmark.soak(
+                        threads, options["soak"], per_room=options["clients_per_room"],
+                        timeout=options["timeout"], batch_size=options["batch_size"],
+                    ))
+                else:
+                    results = asyncio.run(benchmark.run(
+                        threads, per_room=options["clients_per_room"], messages=options["messages"],
+                        interval=options["interval"], timeout=options["timeout"],
+                        batch_size=options["batch_size"],
+                    ))
+        finally:
+            if not options["keep_messages"]:
+                self.restore(threads, last_id_before, markers)
+
+        summary = {key: value for key, value in results.items() if key != "samples"}
+        self.stdout.write(json.dumps(summary, indent=2))
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+        leaked = results.get("final_memberships", results.get("leaked_memberships", 0))
+        if options["soak"] and results.get("growth_per_cycle_kib", 0) > options["leak_threshold_kib"]:
+            leaked = leaked or "memory"
+        if leaked:
+            message = f"Possible leak: {leaked} group memberships left after disconnect."
+            if leaked == "memory":
+                message = f"Possible leak: memory grew {results['growth_per_cycle_kib']} KiB per cycle."
+            if options["fail_on_leak"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No leaks detected."))
+
+    def restore(self, threads, last_id_before, markers):
+        """Undo the run: its messages, and the threads and read markers as they were loaded before it."""
+        Message.objects.filter(
+            thread__in=threads, id__gt=last_id_before, content__startswith=benchmark.MARKER,
+        ).delete()
+        ChatThread.objects.bulk_update(threads, ["last_message", "last_message_at", "updated"])
+        ThreadReadMarker.objects.filter(thread__in=threads).exclude(pk__in=[marker.pk for marker in markers]).delete()
+        ThreadReadMarker.objects.bulk_update(markers, ["last_read_message_id", "updated"])
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_last_message(apps, schema_editor):
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+    latest = Message.objects.filter(thread=OuterRef('pk')).order_by('-timestamp', '-id')
+    ChatThread.objects.update(
+        last_message=Subquery(latest.values('id')[:1]),
+        last_message_at=Subquery(latest.values('timestamp')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadReadMarker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chatthread',
+            index=models.Index(fields=['user1', '-last_message_at'], name='chat_thread_user1_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatthread',
+            index=models.Index(fields=['user2', '-last_message_at'], name='chat_thread_user2_inbox_idx'),
+        ),
+        migrations.AddField(
+            model_name='threadreadmarker',
+            name='thread',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_markers', to='chat.chatthread'),
+        ),
+        migrations.AddField(
+            model_name='threadreadmarker',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_markers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='threadreadmarker',
+            unique_together={('thread', 'user')},
+        ),
+        migrations.RunPython(fill_last_message, migrations.RunPython.noop),
+    ]
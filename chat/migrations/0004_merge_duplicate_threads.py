@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def merge_duplicate_threads(apps, schema_editor):
+    """
+    Put every thread's participants in (low id, high id) order. Where both
+    A-B and B-A threads exist, move the reversed thread's messages and read
+    markers into the canonical one and delete it.
+    """
+    ChatThread = apps.get_model('chat', 'ChatThread')
+    Message = apps.get_model('chat', 'Message')
+    ThreadReadMarker = apps.get_model('chat', 'ThreadReadMarker')
+
+    for thread in list(ChatThread.objects.filter(user1_id__gt=F('user2_id'))):
+        keeper = ChatThread.objects.filter(user1_id=thread.user2_id, user2_id=thread.user1_id).first()
+        if keeper is None:
+            ChatThread.objects.filter(pk=thread.pk).update(
+                user1_id=thread.user2_id, user2_id=thread.user1_id
+            )
+            continue
+
+        Message.objects.filter(thread=thread).update(thread=keeper)
+        for marker in ThreadReadMarker.objects.filter(thread=thread):
+            kept = ThreadReadMarker.objects.filter(thread=keeper, user_id=marker.user_id).first()
+            if kept is None:
+                ThreadReadMarker.objects.filter(pk=marker.pk).update(thread=keeper)
+            elif marker.last_read_message_id > kept.last_read_message_id:
+                ThreadReadMarker.objects.filter(pk=kept.pk).update(
+                    last_read_message_id=marker.last_read_message_id
+                )
+
+        latest = Message.objects.filter(thread=keeper).order_by('-timestamp', '-id').first()
+        ChatThread.objects.filter(pk=keeper.pk).update(
+            updated=max(keeper.updated, thread.updated),
+            timestamp=min(keeper.timestamp, thread.timestamp),
+            last_message=latest,
+            last_message_at=latest.timestamp if latest else None,
+        )
+        ChatThread.objects.filter(pk=thread.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_threads, migrations.RunPython.noop),
+    ]
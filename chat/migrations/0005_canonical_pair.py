@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_merge_duplicate_threads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='chatthread',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='chatthread',
+            constraint=models.UniqueConstraint(fields=('user1', 'user2'), name='chat_thread_unique_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatthread',
+            constraint=models.CheckConstraint(condition=models.Q(('user1__lte', models.F('user2'))), name='chat_thread_canonical_pair'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models import F, Q
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 # Get the custom User model defined in your Django project (likely in 'accounts' or similar)
 User = get_user_model() 
@@ -8,10 +10,24 @@ User = get_user_model()
 # ------------------------------------------------------------------
 # 1. ChatThread Model (Represents a conversation between two users)
 # ------------------------------------------------------------------
+class ChatThreadManager(models.Manager):
+    def get_or_create_between(self, user_a, user_b):
+        """
+        Returns ``(thread, created)`` for the conversation between two users.
+
+        The pair is put in canonical (lower id, higher id) order, so this is
+        a single unique-index lookup; get_or_create falls back to fetching
+        the row if a concurrent request inserted it first (IntegrityError).
+        """
+        low, high = sorted((user_a, user_b), key=lambda user: user.pk)
+        return self.get_or_create(user1=low, user2=high)
+
+
 class ChatThread(models.Model):
     """Represents a private conversation between two users."""
     
-    # The users involved in this specific thread.
+    # The users involved in this specific thread, always stored with
+    # user1 having the lower id (see save() and the constraints below).
     # The related_name is important for filtering threads per user.
     user1 = models.ForeignKey(
         User, 
@@ -29,12 +45,40 @@ class ChatThread(models.Model):
     # Timestamp when the thread was first created
     timestamp = models.DateTimeField(auto_now_add=True) 
 
+    # Denormalized pointer to the newest message, so the inbox can show a
+    # preview and sort by activity without touching the Message table
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ChatThreadManager()
+
     class Meta:
         # Ensures that a thread between two users (e.g., A and B) 
-        # is unique, regardless of the order (A, B) or (B, A).
-        unique_together = ('user1', 'user2')
+        # is unique, regardless of the order (A, B) or (B, A):
+        # the pair is stored canonically ordered and indexed once.
+        constraints = [
+            models.UniqueConstraint(fields=['user1', 'user2'], name='chat_thread_unique_pair'),
+            models.CheckConstraint(condition=Q(user1__lte=F('user2')), name='chat_thread_canonical_pair'),
+        ]
         # Order by the latest activity
         ordering = ['-updated'] 
+        # Each participant's inbox is read newest-first
+        indexes = [
+            models.Index(fields=['user1', '-last_message_at'], name='chat_thread_user1_inbox_idx'),
+            models.Index(fields=['user2', '-last_message_at'], name='chat_thread_user2_inbox_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the participant pair in canonical (low id, high id) order
+        if self.user1_id and self.user2_id and self.user1_id > self.user2_id:
+            self.user1_id, self.user2_id = self.user2_id, self.user1_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Thread between {self.user1.username} and {self.user2.username}"
@@ -60,12 +104,44 @@ class Message(models.Model):
     )
     # The actual content of the message
     content = models.TextField()
-    # When the message was created
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # When the message was received; the chat batcher sets it explicitly,
+    # since it writes messages some time after they arrive
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         # Messages should always be retrieved in chronological order
         ordering = ['timestamp']
+        # History is paged newest-first per thread (see chat/history.py)
+        indexes = [
+            models.Index(fields=['thread', 'timestamp', 'id'], name='chat_message_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"Message by {self.sender.username} in Thread {self.thread.id}"
+
+
+# ------------------------------------------------------------------
+# 3. ThreadReadMarker Model (How far each participant has read)
+# ------------------------------------------------------------------
+class ThreadReadMarker(models.Model):
+    """Remembers the newest message a participant has seen in a thread."""
+
+    thread = models.ForeignKey(
+        ChatThread,
+        on_delete=models.CASCADE,
+        related_name='read_markers'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='chat_read_markers'
+    )
+    # Plain id rather than a ForeignKey: unread = messages with a higher id
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('thread', 'user')
 
     def __str__(self):
-        return f"Message by {self.sender.username} in Thread {self.thread.id}"
\ No newline at end of file
+        return f"{self.user} read thread {self.thread_id} up to {self.last_read_message_id}"
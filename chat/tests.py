@@ -1,3 +1,166 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.db.models import Max
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .batching import MessageBatcher, Pending
+from .benchmark import MARKER
+from .management.commands.chat_benchmark import Command as ChatBenchmark
+from .inbox import inbox_threads, mark_read, record_last_message, trim_page
+from .models import ChatThread, Message, ThreadReadMarker
+
+
+class BatcherWriteTests(TestCase):
+
+    def test_messages_keep_the_time_they_were_received(self):
+        alice, bob = User.objects.create_user("alice"), User.objects.create_user("bob")
+        thread = ChatThread.objects.create(user1=alice, user2=bob)
+        received_at = timezone.now() - timedelta(minutes=5)
+
+        stored = MessageBatcher.write([
+            Pending(thread.id, alice.id, "hello", received_at=received_at),
+            Pending(thread.id, bob.id, "hi", received_at=received_at + timedelta(seconds=1)),
+        ])
+
+        first, last = Message.objects.order_by("id")
+        self.assertEqual(first.timestamp, received_at)
+        self.assertEqual(stored, {thread.id: last.id})
+        thread.refresh_from_db()
+        self.assertEqual((thread.last_message_id, thread.last_message_at), (last.id, last.timestamp))
+
+
+@override_settings(CHAT_BATCH_SIZE=100, CHAT_WRITE_ATTEMPTS=3)
+class BatcherOrderTests(SimpleTestCase):
+
+    def test_retried_messages_are_written_before_newer_ones(self):
+        written = []
+
+        def write(batch):
+            written.append([entry.content for entry in batch])
+            if len(written) == 1:
+                raise DatabaseError("database is down")
+            return {}
+
+        def in_turn(func):
+            # yield to the event loop like a real thread hop would
+            async def run(*args):
+                await asyncio.sleep(0)
+                return func(*args)
+            return run
+
+        async def scenario():
+            batcher = MessageBatcher()
+            await batcher.add(1, 1, "first")
+            failing = asyncio.ensure_future(batcher.flush())
+            await asyncio.sleep(0)
+            # arrives while the first write is failing
+            await batcher.add(1, 1, "second")
+            await batcher.flush()
+            await failing
+
+        with mock.patch("chat.batching.database_sync_to_async", in_turn), \
+                mock.patch.object(MessageBatcher, "write", staticmethod(write)), \
+                self.assertLogs("chat.batching", "ERROR"):
+            asyncio.run(scenario())
+        self.assertEqual(written, [["first"], ["first", "second"]])
+
+
+class InboxTests(TestCase):
+
+    def setUp(self):
+        self.me = User.objects.create_user("me")
+        self.threads = []
+        for n in range(5):
+            other = User.objects.create_user(f"other{n}")
+            thread = ChatThread.objects.create(user1=self.me, user2=other)
+            # the last two threads have no messages yet
+            if n < 3:
+                Message.objects.create(thread=thread, sender=other, content=f"hi {n}")
+            self.threads.append(thread)
+        record_last_message([thread.id for thread in self.threads])
+
+    def walk(self, page_size):
+        seen, cursor = [], None
+        while True:
+            page, cursor = trim_page(inbox_threads(self.me, cursor)[:page_size + 1], page_size)
+            seen += page
+            if cursor is None:
+                return seen
+
+    def test_pages_cover_every_thread_once(self):
+        seen = self.walk(page_size=2)
+        # most recently active first, then threads without messages, newest first
+        expected = [self.threads[n].id for n in (2, 1, 0, 4, 3)]
+        self.assertEqual([thread.id for thread in seen], expected)
+
+    def test_unread_counts_follow_read_marker(self):
+        thread = self.threads[0]
+        self.assertEqual(inbox_threads(self.me).get(id=thread.id).unread_count, 1)
+        mark_read(thread, self.me, thread.messages.get().id)
+        self.assertEqual(inbox_threads(self.me).get(id=thread.id).unread_count, 0)
+
+
+class ThreadViewTests(TestCase):
+
+    def setUp(self):
+        self.me, self.other = User.objects.create_user("me"), User.objects.create_user("other")
+        self.thread = ChatThread.objects.create(user1=self.me, user2=self.other)
+        self.client.force_login(self.me)
+
+    def send(self, content):
+        return self.client.post(reverse("thread", args=[self.thread.id]), {"content": content})
+
+    def test_send_moves_pointer_and_read_marker(self):
+        response = self.send("hello")
+        self.assertRedirects(response, reverse("thread", args=[self.thread.id]))
+        message = Message.objects.get()
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.last_message, message)
+        self.assertEqual(
+            ThreadReadMarker.objects.get(thread=self.thread, user=self.me).last_read_message_id, message.id,
+        )
+
+    def test_send_never_moves_pointer_back(self):
+        # a message a chat batch stored, received after this request's
+        later = Message.objects.create(
+            thread=self.thread, sender=self.other, content="later", timestamp=timezone.now() + timedelta(seconds=5),
+        )
+        record_last_message([self.thread.id])
+        self.send("hello")
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.last_message, later)
+
+
+class BenchmarkCleanupTests(TestCase):
+
+    def test_restore_undoes_the_run(self):
+        alice, bob = User.objects.create_user("synth~0000001"), User.objects.create_user("synth~0000002")
+        thread = ChatThread.objects.create(user1=alice, user2=bob)
+        hello = Message.objects.create(thread=thread, sender=alice, content="hello")
+        record_last_message([thread.id])
+        mark_read(thread, alice, hello.id)
+
+        threads = list(ChatThread.objects.filter(id=thread.id))
+        last_id_before = Message.objects.aggregate(last=Max("id"))["last"]
+        markers = list(ThreadReadMarker.objects.filter(thread=thread))
+
+        # what a run leaves behind
+        bench = MessageBatcher.write([Pending(thread.id, bob.id, f"{MARKER}1")])[thread.id]
+        mark_read(thread, alice, bench)
+        mark_read(thread, bob, bench)
+
+        ChatBenchmark().restore(threads, last_id_before, markers)
+
+        self.assertEqual(list(Message.objects.all()), [hello])
+        thread.refresh_from_db()
+        self.assertEqual((thread.last_message, thread.updated), (hello, threads[0].updated))
+        self.assertEqual(
+            list(ThreadReadMarker.objects.values_list("user__username", "last_read_message_id")),
+            [("synth~0000001", hello.id)],
+        )
@@ -1,12 +1,20 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# the inbox is served by the async view when ASYNC_VIEWS is on
+pages = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     # Shows the list of all active conversations (the "Inbox")
-    path('', views.inbox_view, name='inbox'),
+    path('', pages.inbox_view, name='inbox'),
     
     # Opens a specific conversation thread
     path('<int:thread_id>/', views.thread_view, name='thread'),
+
+    # JSON history: page back through older messages, or poll for new ones
+    path('<int:thread_id>/messages/older/', views.older_messages_view, name='older_messages'),
+    path('<int:thread_id>/messages/since/', views.new_messages_view, name='new_messages'),
     
     # Allows a user to start a new chat thread from another user's profile
     path('start/<str:username>/', views.start_thread_view, name='start_thread'),
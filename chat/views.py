@@ -1,13 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
 
 from .models import ChatThread, Message
 from .forms import MessageForm 
+from .inbox import decorate, inbox_threads, mark_read, record_last_message, trim_page
+from .history import (
+    HISTORY_PAGE_SIZE, clamp_limit, history_page, messages_since, serialize_message,
+)
 
 User = get_user_model()
 
+INBOX_PAGE_SIZE = 50
+
 
 # =========================================================
 # 1. INBOX VIEW (Lists all active conversations)
@@ -16,13 +23,15 @@ User = get_user_model()
 def inbox_view(request):
     """Lists all chat threads the current user is a part of."""
     
-    # Find all threads where the current user is either user1 OR user2
-    threads = ChatThread.objects.filter(
-        Q(user1=request.user) | Q(user2=request.user)
-    ).distinct()
+    # One query: threads with the other participant, last message preview
+    # and unread count (see chat/inbox.py)
+    threads = inbox_threads(request.user, request.GET.get('cursor'))[:INBOX_PAGE_SIZE + 1]
+    threads, next_cursor = trim_page(threads, INBOX_PAGE_SIZE)
 
     context = {
-        'threads': threads,
+        'threads': decorate(threads, request.user),
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None,
         'page_title': 'Message Inbox'
     }
     return render(request, 'chat/inbox.html', context)
@@ -45,15 +54,9 @@ def start_thread_view(request, username):
     if other_user == current_user:
         return redirect('inbox') # Or an error page
 
-    # Find an existing thread between the two users (regardless of order)
-    thread = ChatThread.objects.filter(
-        Q(user1=current_user, user2=other_user) | 
-        Q(user1=other_user, user2=current_user)
-    ).first()
-
-    # If no thread exists, create one
-    if not thread:
-        thread = ChatThread.objects.create(user1=current_user, user2=other_user)
+    # Find or atomically create the thread between the two users
+    # (regardless of order; the pair is stored canonically)
+    thread, _ = ChatThread.objects.get_or_create_between(current_user, other_user)
     
     # Redirect to the thread view
     return redirect('thread', thread_id=thread.id)
@@ -69,15 +72,14 @@ def thread_view(request, thread_id):
     This is the core chat room logic.
     """
     
-    thread = get_object_or_404(ChatThread, id=thread_id)
+    thread = get_participant_thread(request, thread_id)
     
     # Security check: Ensure the user is a participant in this thread
-    if request.user not in [thread.user1, thread.user2]:
+    if thread is None:
         return redirect('inbox') # Deny access
 
-    messages = thread.messages.all()
+    # Sending redirects straight back, so it skips loading the history
     form = MessageForm()
-
     if request.method == 'POST':
         form = MessageForm(request.POST)
         if form.is_valid():
@@ -86,13 +88,21 @@ def thread_view(request, thread_id):
             message.thread = thread
             message.sender = request.user
             message.save()
-            
-            # Update the thread's 'updated' timestamp
-            thread.save()
-            
+
+            # Update the thread's 'updated' timestamp and last message; the
+            # pointer is recomputed rather than saved, so it cannot move back
+            # past a newer message a concurrent chat batch just wrote
+            record_last_message([thread.id], timezone.now())
+            mark_read(thread, request.user, message.id)
+
             # Since we're not using JS, we must redirect back to the page
             # to show the newly saved message.
-            return redirect('thread', thread_id=thread.id) 
+            return redirect('thread', thread_id=thread.id)
+
+    # Only the latest page of history; older pages are fetched on demand
+    messages, older_cursor = history_page(thread)
+    if messages:
+        mark_read(thread, request.user, messages[-1].id)
 
     # Determine the other user for display purposes
     other_user = thread.user1 if thread.user2 == request.user else thread.user2
@@ -100,8 +110,73 @@ def thread_view(request, thread_id):
     context = {
         'thread': thread,
         'messages': messages,
+        'older_cursor': older_cursor,
+        'last_message_id': messages[-1].id if messages else 0,
         'form': form,
         'other_user': other_user, # Pass the other user to the template
         'page_title': f'Chat with {other_user.username}'
     }
-    return render(request, 'chat/thread.html', context)
\ No newline at end of file
+    return render(request, 'chat/thread.html', context)
+
+
+# =========================================================
+# 4. HISTORY ENDPOINTS (JSON, for incremental loading)
+# =========================================================
+def get_participant_thread(request, thread_id):
+    """Returns the thread if the current user is in it, otherwise None."""
+    thread = get_object_or_404(
+        ChatThread.objects.select_related('user1', 'user2'), id=thread_id
+    )
+    if request.user.id not in (thread.user1_id, thread.user2_id):
+        return None
+    return thread
+
+
+def _limit(request, default):
+    try:
+        return clamp_limit(int(request.GET.get('limit', default)))
+    except ValueError:
+        return None
+
+
+@login_required
+def older_messages_view(request, thread_id):
+    """One page of messages before the ``before`` cursor ("load older")."""
+    thread = get_participant_thread(request, thread_id)
+    if thread is None:
+        return JsonResponse({'error': 'Not a participant'}, status=403)
+
+    limit = _limit(request, HISTORY_PAGE_SIZE)
+    if limit is None:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    messages, older_cursor = history_page(thread, before=request.GET.get('before'), limit=limit)
+    return JsonResponse({
+        'messages': [serialize_message(message) for message in messages],
+        'older_cursor': older_cursor,
+        'has_older': older_cursor is not None,
+    })
+
+
+@login_required
+def new_messages_view(request, thread_id):
+    """Messages after the ``after`` id the client already has (delta polling)."""
+    thread = get_participant_thread(request, thread_id)
+    if thread is None:
+        return JsonResponse({'error': 'Not a participant'}, status=403)
+
+    limit = _limit(request, HISTORY_PAGE_SIZE)
+    try:
+        after_id = int(request.GET.get('after', 0))
+    except ValueError:
+        after_id = None
+    if limit is None or after_id is None:
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+
+    messages = messages_since(thread, after_id, limit=limit)
+    if messages:
+        mark_read(thread, request.user, messages[-1].id)
+    return JsonResponse({
+        'messages': [serialize_message(message) for message in messages],
+        'last_id': messages[-1].id if messages else after_id,
+    })
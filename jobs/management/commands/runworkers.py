@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.worker import work
+
+
+def _worker_main(index, stop, burst, poll_interval):
+    django.setup()
+    # Ctrl-C reaches the whole process group; let the parent coordinate shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # so can SIGTERM (systemd's default KillMode), or it may be sent to this
+    # worker alone; either way finish the current job, then exit
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    work(
+        worker_id, should_stop=lambda: stop.is_set() or stopping.is_set(),
+        burst=burst, poll_interval=poll_interval,
+    )
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (see jobs/worker.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=settings.JOBS_WORKERS,
+            help="Number of worker processes (default: JOBS_WORKERS).",
+        )
+        parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty.")
+        parser.add_argument(
+            "--poll-interval", type=float, default=settings.JOBS_POLL_INTERVAL,
+            help="Seconds to sleep when no job is due.",
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        burst, poll_interval = options["burst"], options["poll_interval"]
+
+        if workers == 1:
+            # finish the current job, then exit
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:0"
+            processed = work(worker_id, should_stop=stop.is_set, burst=burst, poll_interval=poll_interval)
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs."))
+            return
+
+        # Children must open their own connections, not share the parent's sockets
+        connections.close_all()
+        stop = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=_worker_main, args=(index, stop, burst, poll_interval))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        def shutdown(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(f"Started {workers} workers.")
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
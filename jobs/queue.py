@@ -0,0 +1,83 @@
+"""
+Job registry and producer side of the queue.
+
+Handlers are plain functions registered under a name with ``@job`` (by
+convention in an app's ``tasks.py``, which JobsConfig autodiscovers) and
+called with the job payload as keyword arguments. Payloads are stored as
+JSON, so pass ids rather than model instances.
+
+With JOBS_RUN_INLINE the handler runs straight away in the calling
+process instead, which is handy in development when no worker is running.
+It runs once the transaction commits, and a handler that fails there is
+logged and kept as a FAILED Job, as a worker would, rather than failing
+the request that queued it.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class UnknownJob(LookupError):
+    pass
+
+
+def job(name):
+    """Register the decorated function as the handler for ``name``."""
+    def register(func):
+        if name in _registry and _registry[name] is not func:
+            raise ValueError(f"Job {name!r} is already registered")
+        _registry[name] = func
+        return func
+    return register
+
+
+def handler_for(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownJob(f"No handler registered for job {name!r}") from None
+
+
+def enqueue(name, payload=None, priority=0, delay=0, max_attempts=None):
+    """
+    Queue job ``name`` with ``payload``. The row is only inserted once the
+    surrounding transaction commits, so workers never see a job for data
+    that was rolled back. Returns the Job, or None when run inline.
+    """
+    handler = handler_for(name)
+    payload = payload or {}
+
+    job = Job(
+        name=name,
+        payload=payload,
+        priority=priority,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+    if settings.JOBS_RUN_INLINE:
+        transaction.on_commit(lambda: _run_inline(job, handler))
+        return None
+
+    transaction.on_commit(job.save)
+    return job
+
+
+def _run_inline(job, handler):
+    try:
+        handler(**job.payload)
+    except Exception:
+        logger.exception("Inline job %s failed", job.name)
+        job.status = Job.FAILED
+        job.attempts = 1
+        job.last_error = traceback.format_exc()
+        job.save()
@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import enqueue, job
+from .worker import claim, requeue_stale, run, work
+
+calls = []
+
+
+@job("tests.record")
+def record(value):
+    calls.append(value)
+
+
+@job("tests.fail")
+def fail():
+    raise RuntimeError("handler failed")
+
+
+@override_settings(JOBS_RUN_INLINE=False, JOBS_RETRY_BASE=10, JOBS_RETRY_MAX=3600)
+class WorkerTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def queue(self, name, payload=None, **fields):
+        return Job.objects.create(name=name, payload=payload or {}, **fields)
+
+    def test_enqueue_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            enqueue("tests.record", {"value": 1})
+        self.assertFalse(Job.objects.exists())
+        callbacks[0]()
+        self.assertEqual(Job.objects.get().payload, {"value": 1})
+
+    def test_claim_takes_the_most_urgent_due_job(self):
+        self.queue("tests.record", {"value": "later"}, priority=9, run_at=timezone.now() + timedelta(hours=1))
+        self.queue("tests.record", {"value": "low"}, priority=0)
+        urgent = self.queue("tests.record", {"value": "high"}, priority=5)
+
+        claimed = claim("worker-1")
+        self.assertEqual(claimed.id, urgent.id)
+        self.assertEqual((claimed.status, claimed.attempts, claimed.locked_by), (Job.RUNNING, 1, "worker-1"))
+        # a running job is not claimed twice
+        self.assertEqual(claim("worker-2").payload, {"value": "low"})
+        self.assertIsNone(claim("worker-3"))
+
+    def test_success_deletes_the_job(self):
+        self.queue("tests.record", {"value": 1})
+        self.assertTrue(run(claim("worker")))
+        self.assertEqual(calls, [1])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failures_back_off_then_stay_failed(self):
+        queued = self.queue("tests.fail", max_attempts=2)
+
+        with self.assertLogs("jobs.worker", "WARNING"):
+            self.assertFalse(run(claim("worker")))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_by), (Job.QUEUED, 1, ""))
+        self.assertIn("handler failed", queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=7))
+        self.assertIsNone(claim("worker"))
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        with self.assertLogs("jobs.worker", "ERROR"):
+            self.assertFalse(run(claim("worker")))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 2))
+
+    def test_unknown_job_fails_at_once(self):
+        queued = self.queue("tests.missing")
+        with self.assertLogs("jobs.worker", "ERROR"):
+            run(claim("worker"))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+
+    def test_outcome_needs_the_lock(self):
+        queued = self.queue("tests.record", {"value": 1})
+        claimed = claim("worker-1")
+        # the lock went stale and another worker took the job over
+        Job.objects.filter(pk=queued.pk).update(locked_by="worker-2")
+        with self.assertLogs("jobs.worker", "WARNING"):
+            self.assertTrue(run(claimed))
+        self.assertEqual(Job.objects.get().locked_by, "worker-2")
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_stale_locks_are_requeued(self):
+        stale = self.queue("tests.record", {"value": 1}, status=Job.RUNNING, locked_by="dead",
+                           locked_at=timezone.now() - timedelta(minutes=5))
+        self.queue("tests.record", {"value": 2}, status=Job.RUNNING, locked_by="alive", locked_at=timezone.now())
+        self.assertEqual(requeue_stale(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), (Job.QUEUED, ""))
+
+    def test_burst_work_drains_the_queue(self):
+        for value in range(3):
+            self.queue("tests.record", {"value": value})
+        self.assertEqual(work("worker", burst=True), 3)
+        self.assertEqual(sorted(calls), [0, 1, 2])
+
+
+@override_settings(JOBS_RUN_INLINE=True)
+class InlineTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(enqueue("tests.record", {"value": 1}))
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [1])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_is_logged_and_recorded(self):
+        with self.assertLogs("jobs.queue", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+            enqueue("tests.fail", priority=3)
+        failed = Job.objects.get()
+        self.assertEqual((failed.name, failed.status, failed.attempts, failed.priority), ("tests.fail", Job.FAILED, 1, 3))
+        self.assertIn("handler failed", failed.last_error)
@@ -0,0 +1,159 @@
+"""
+Consumer side of the queue: claim a due job, run it, record the outcome.
+
+On databases with ``SELECT ... FOR UPDATE SKIP LOCKED`` (PostgreSQL,
+MySQL 8) concurrent workers each lock a different row and never wait on
+one another. SQLite has no row locks, so there a worker picks a
+candidate and claims it with a conditional UPDATE that only succeeds
+while the row is still queued; a worker that loses the race tries the
+next candidate.
+
+Failed jobs are retried with exponential backoff until ``max_attempts``,
+then left as FAILED with the traceback in ``last_error``.
+
+While a job runs, a heartbeat thread renews its ``locked_at``. A job
+whose lock has not been renewed for JOBS_LOCK_TIMEOUT belongs to a
+worker that died, and is handed back to the queue. The outcome of a run
+is only recorded while the row is still locked by the worker that ran
+it, so a run that outlived its lock cannot delete or overwrite the row
+another worker has claimed since.
+"""
+import logging
+import random
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .queue import UnknownJob, handler_for
+
+logger = logging.getLogger(__name__)
+
+# Candidates tried per claim when falling back to the conditional UPDATE
+CLAIM_CANDIDATES = 5
+
+
+def due_jobs(now):
+    return Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+
+
+def claim(worker_id):
+    """Lock the next due job for ``worker_id`` and return it, or None."""
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = due_jobs(now).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = Job.RUNNING
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_at = now
+            job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at'])
+            return job
+
+    for job_id in due_jobs(now).values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, locked_by=worker_id, locked_at=now,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    delay = min(settings.JOBS_RETRY_BASE * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _locked(job):
+    """``job``'s row, as long as the worker that claimed it still holds it."""
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by)
+
+
+@contextmanager
+def heartbeat(job):
+    """Renew ``job``'s lock every third of JOBS_LOCK_TIMEOUT while the block runs."""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(settings.JOBS_LOCK_TIMEOUT / 3):
+                _locked(job).update(locked_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run(job):
+    """Run a claimed job. Successful jobs are deleted; failures are retried or kept."""
+    try:
+        with heartbeat(job):
+            handler_for(job.name)(**job.payload)
+    except Exception as exc:
+        fields = {'last_error': traceback.format_exc(), 'locked_by': '', 'locked_at': None}
+        if isinstance(exc, UnknownJob) or job.attempts >= job.max_attempts:
+            fields['status'] = Job.FAILED
+            logger.error("Job %s failed permanently after %d attempts", job, job.attempts)
+        else:
+            fields['status'] = Job.QUEUED
+            fields['run_at'] = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning("Job %s failed, retrying at %s", job, fields['run_at'])
+        if not _locked(job).update(**fields):
+            logger.warning("Job %s lost its lock while running; leaving the row as it is", job)
+        return False
+
+    if not _locked(job).delete()[0]:
+        logger.warning("Job %s lost its lock while running; leaving the row as it is", job)
+    return True
+
+
+def requeue_stale():
+    """Give jobs whose lock was not renewed (their worker died) back to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by='', locked_at=None,
+    )
+
+
+def work(worker_id, should_stop=lambda: False, burst=False, poll_interval=None):
+    """
+    Claim and run jobs until ``should_stop()`` is true. With ``burst`` the
+    loop exits as soon as nothing is due. Returns the number of jobs run.
+    """
+    poll_interval = settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+    processed = 0
+    last_sweep = 0
+    while not should_stop():
+        close_old_connections()
+
+        if time.monotonic() - last_sweep > settings.JOBS_LOCK_TIMEOUT:
+            if requeue_stale():
+                logger.info("Requeued stale jobs")
+            last_sweep = time.monotonic()
+
+        job = claim(worker_id)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        run(job)
+        processed += 1
+    return processed
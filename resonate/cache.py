@@ -0,0 +1,107 @@
+"""
+Cache backends that count hits and misses.
+
+``StatsRedisCache`` is Django's Redis cache, shared by every process;
+set Redis's ``maxmemory-policy`` to ``allkeys-lru`` for eviction.
+``StatsLocMemCache`` is Django's local-memory cache, which already evicts
+least-recently-used entries. ``LRUFileBasedCache`` is the file-based
+cache with its random culling replaced by LRU: a hit refreshes the
+file's mtime, and culling removes the oldest files first.
+
+Counters are per process and per cache location. Read them with
+``cache.stats()``.
+"""
+import os
+import threading
+from collections import Counter
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+_MISSING = object()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class CacheStatsMixin:
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self._stats_key = f"{type(self).__name__}:{location}"
+
+    def _counter(self):
+        # caches[alias] gives each thread its own backend instance, so the
+        # counters live at module level, keyed by location
+        with _stats_lock:
+            return _stats.setdefault(self._stats_key, Counter())
+
+    def _count(self, hits, misses):
+        counter = self._counter()
+        counter["hits"] += hits
+        counter["misses"] += misses
+
+    def get(self, key, default=None, version=None):
+        # BaseCache.get_many() reads through here too
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return value
+
+    def stats(self):
+        counter = self._counter()
+        hits, misses = counter["hits"], counter["misses"]
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+    def reset_stats(self):
+        self._counter().clear()
+
+
+class StatsRedisCache(CacheStatsMixin, RedisCache):
+
+    def get_many(self, keys, version=None):
+        # one MGET, not a get() per key
+        keys = list(keys)
+        found = super().get_many(keys, version=version)
+        self._count(len(found), len(set(keys)) - len(found))
+        return found
+
+
+class StatsLocMemCache(CacheStatsMixin, LocMemCache):
+    pass
+
+
+class LRUFileBasedCache(CacheStatsMixin, FileBasedCache):
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        # the expiry is stored inside the file, so mtime is free to track recency
+        try:
+            os.utime(self._key_to_file(key, version))
+        except OSError:
+            pass
+        return value
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        num_entries = len(filelist)
+        if num_entries < self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            return self.clear()
+
+        def last_used(fname):
+            try:
+                return os.path.getmtime(fname)
+            except OSError:
+                return 0
+
+        filelist.sort(key=last_used)
+        for fname in filelist[:num_entries // self._cull_frequency]:
+            self._delete(fname)
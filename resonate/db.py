@@ -0,0 +1,107 @@
+"""
+Read replica routing.
+
+ReplicaMiddleware marks GET/HEAD requests to the views named in
+DB_REPLICA_VIEWS, and while such a request runs, ReplicaRouter sends
+its reads to the ``replica`` database. All other reads, and every write,
+go to ``default``. Sessions and users are always read from the primary,
+so a login, logout or password change takes effect at once.
+
+Read-your-writes: any other method (a POST, say) sets a short-lived
+cookie. While the cookie is there, that browser's requests read from the
+primary, which covers the replica's lag behind the write it just made.
+Cache fills use primary() for the same reason, so a lagging replica
+cannot store stale data under a freshly bumped version.
+
+Without a ``replica`` alias in DATABASES the middleware removes itself
+and the router has nothing to route. The middleware is sync and async
+capable, so async views are not adapted through a thread for it.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+
+REPLICA = "replica"
+PIN_COOKIE = "db_primary"
+PRIMARY_ONLY_APPS = {"auth", "sessions"}
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside this block (or decorated function)."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # never fall back to the instance's database, which may be the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the primary
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _replica_reads.set(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context, so the ORM's thread sees the flag
+        token = _replica_reads.set(self.use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=settings.DB_REPLICA_PIN_SECONDS,
+                httponly=True, samesite="Lax", secure=request.is_secure(),
+            )
+        return response
+
+    def use_replica(self, request):
+        if request.method not in ("GET", "HEAD") or PIN_COOKIE in request.COOKIES:
+            return False
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.view_name in settings.DB_REPLICA_VIEWS
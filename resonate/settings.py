@@ -1,5 +1,6 @@
 
 import os
+import sys
 from pathlib import Path
 from decouple import config, Csv 
 
@@ -28,13 +29,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'accounts',
+    'chat',
+    'jobs',
 ]
 
 MIDDLEWARE = [
    
     'whitenoise.middleware.WhiteNoiseMiddleware', 
     'django.middleware.security.SecurityMiddleware',
+    'accounts.middleware.QueryBudgetMiddleware',
+    'resonate.db.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,28 +62,135 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.context_processors.follow_state',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'resonate.wsgi.application'
+ASGI_APPLICATION = 'resonate.asgi.application'
 
+# Serve feed, post, profile, search and inbox pages from the async views
+# (accounts/async_views.py, chat/async_views.py). Worth it under an ASGI
+# server such as daphne; under WSGI each request pays a thread hop.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
 
 
+# Channels: in-memory layer for a single process, Redis when scaled out
+CHANNEL_REDIS_URL = config('CHANNEL_REDIS_URL', default='')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [CHANNEL_REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+
+# WebSocket chat writes (chat.batching): messages are buffered and written
+# in one bulk_create per CHAT_FLUSH_INTERVAL seconds or CHAT_BATCH_SIZE messages.
+CHAT_FLUSH_INTERVAL = config('CHAT_FLUSH_INTERVAL', default=0.05, cast=float)
+CHAT_BATCH_SIZE = config('CHAT_BATCH_SIZE', default=200, cast=int)
+# A failed write is retried CHAT_WRITE_ATTEMPTS times with backoff; at most
+# CHAT_PENDING_MAX messages wait, and senders are told about dropped ones.
+CHAT_WRITE_ATTEMPTS = config('CHAT_WRITE_ATTEMPTS', default=5, cast=int)
+CHAT_PENDING_MAX = config('CHAT_PENDING_MAX', default=10000, cast=int)
+CHAT_MESSAGE_MAX_LENGTH = config('CHAT_MESSAGE_MAX_LENGTH', default=5000, cast=int)
+
+
+
+
+# Database: DB_ENGINE is 'mysql', 'postgresql' or 'sqlite3' (DB_NAME is then
+# the file). Connections are kept for DB_CONN_MAX_AGE seconds and checked
+# before reuse. On PostgreSQL, DB_POOL_MAX_SIZE > 0 switches to Django's
+# native pool (needs psycopg[pool]); pooled connections are not persistent.
+DB_ENGINE = config('DB_ENGINE', default='mysql')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=2, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=0, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=int)  # seconds to wait for a free connection
+
+
+def database(name, host=None):
+    if DB_ENGINE == 'sqlite3':
+        db = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}
+    else:
+        db = {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': name,
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': host,
+            'PORT': config('DB_PORT', cast=int),
+        }
+    db['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    db['CONN_HEALTH_CHECKS'] = DB_CONN_HEALTH_CHECKS
+    if DB_ENGINE == 'postgresql' and DB_POOL_MAX_SIZE:
+        db['CONN_MAX_AGE'] = 0
+        db['OPTIONS'] = {'pool': {
+            'min_size': DB_POOL_MIN_SIZE, 'max_size': DB_POOL_MAX_SIZE, 'timeout': DB_POOL_TIMEOUT,
+        }}
+    return db
+
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.mysql', 
-        'NAME': config('DB_NAME'), 
-        'USER': config('DB_USER'), 
-        'PASSWORD': config('DB_PASSWORD'), 
-        'HOST': config('DB_HOST'),
-        'PORT': config('DB_PORT', cast=int),
-    }
+    'default': database(
+        config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')) if DB_ENGINE == 'sqlite3' else config('DB_NAME'),
+        config('DB_HOST', default=''),
+    ),
 }
 
-
+# Read replica (resonate/db.py): set DB_REPLICA_HOST, or DB_REPLICA_NAME for a
+# second SQLite file. GET/HEAD requests to DB_REPLICA_VIEWS read from it;
+# after any other request the browser reads from the primary for
+# DB_REPLICA_PIN_SECONDS, to see its own writes despite replication lag.
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+if DB_REPLICA_HOST or DB_REPLICA_NAME:
+    DATABASES['replica'] = database(
+        DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        DB_REPLICA_HOST or DATABASES['default'].get('HOST'),
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['resonate.db.ReplicaRouter']
+DB_REPLICA_VIEWS = [
+    'accounts:feed',
+    'accounts:search_musicians',
+    'accounts:profile',
+    'accounts:profile_with_username',
+    'accounts:musician_detail',
+]
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=10, cast=int)
+
+
+
+
+# Sessions: 'cached_db' reads them from the cache and falls back to the
+# database, 'signed_cookies' keeps them in the browser, 'db' is Django's default.
+# Expired database sessions are removed by `manage.py clear_expired_sessions`.
+SESSION_BACKEND = config('SESSION_BACKEND', default='cached_db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_BACKEND]
+
+# request.user comes from the shared cache (accounts.backends), with the profile
+# joined; saving the user or profile (a password change included) invalidates
+# it in every process. With CACHE_BACKEND=locmem the user is read from the
+# database instead. ModelBackend stays listed only so sessions from before the
+# switch remain valid; CachedModelBackend rejects bad passwords itself, so a
+# failed login is hashed once.
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=60, cast=int)
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -119,6 +232,93 @@ LOGOUT_REDIRECT_URL = "accounts:login"
 PASSWORD_CHANGE_REDIRECT_URL = 'accounts:edit_profile' 
 
 
+# Home timeline (accounts.timeline)
+# Entries kept per user, recent posts copied in on follow, and the follower
+# count above which an author's posts are merged in at read time instead.
+# Fan-out trims a timeline back to the maximum once it is TIMELINE_TRIM_SLACK over.
+TIMELINE_MAX_ENTRIES = config('TIMELINE_MAX_ENTRIES', default=500, cast=int)
+TIMELINE_TRIM_SLACK = config('TIMELINE_TRIM_SLACK', default=50, cast=int)
+TIMELINE_BACKFILL_POSTS = config('TIMELINE_BACKFILL_POSTS', default=50, cast=int)
+TIMELINE_FANOUT_LIMIT = config('TIMELINE_FANOUT_LIMIT', default=10000, cast=int)
+
+
+# Query budgets (accounts.middleware.QueryBudgetMiddleware)
+# Max queries per URL name, including the session and user lookups.
+# Over-budget requests are logged, and raise under `manage.py test` or pytest
+# (pytest-django loads these settings after importing pytest).
+QUERY_BUDGETS = {
+    'accounts:feed': 6,
+    'accounts:feed_api': 6,
+    'accounts:home_feed': 8,
+    'accounts:home_feed_api': 8,
+    'accounts:view_post': 8,
+    'accounts:post_comments': 4,
+    'accounts:profile': 10,
+    'accounts:profile_with_username': 10,
+    'accounts:musician_detail': 10,
+    'accounts:search_musicians': 8,
+}
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=0, cast=int)  # 0 = no budget
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=TESTING, cast=bool)
+QUERY_REPEAT_THRESHOLD = config('QUERY_REPEAT_THRESHOLD', default=5, cast=int)
+QUERY_REPORT_FILE = config('QUERY_REPORT_FILE', default='')
+
+
+# Cache: Redis at CACHE_REDIS_URL by default, shared by the web workers and
+# runworkers so a write in one process invalidates the others' entries
+# (accounts/caching.py). 'file' shares files under CACHE_DIR between the
+# processes on one host. 'locmem' is per process and only suits a single
+# process (tests, or runserver with JOBS_RUN_INLINE); `manage.py check` warns
+# otherwise, and its entries live at most LOCAL_CACHE_TIMEOUT seconds, since
+# nothing outside the process can invalidate them. All count hits/misses
+# (resonate/cache.py); file and locmem evict least-recently-used entries past
+# CACHE_MAX_ENTRIES.
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem' if TESTING else 'redis')  # 'redis', 'file' or 'locmem'
+CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='redis://127.0.0.1:6379/1')
+CACHES = {
+    'default': {
+        'BACKEND': {
+            'redis': 'resonate.cache.StatsRedisCache',
+            'locmem': 'resonate.cache.StatsLocMemCache',
+            'file': 'resonate.cache.LRUFileBasedCache',
+        }[CACHE_BACKEND],
+        'LOCATION': {
+            'redis': CACHE_REDIS_URL,
+            'file': config('CACHE_DIR', default=str(BASE_DIR / '.cache')),
+        }.get(CACHE_BACKEND, 'resonate'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+    },
+}
+if CACHE_BACKEND != 'redis':
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        'CULL_FREQUENCY': 4,
+    }
+# Versioned profile headers and post cards (accounts.caching) never go stale
+# through a shared cache, so they can live long; each object keeps one entry.
+PROFILE_CACHE_TIMEOUT = config('PROFILE_CACHE_TIMEOUT', default=24 * 3600, cast=int)
+LOCAL_CACHE_TIMEOUT = config('LOCAL_CACHE_TIMEOUT', default=60, cast=int)
+if CACHE_BACKEND == 'locmem':
+    PROFILE_CACHE_TIMEOUT = min(PROFILE_CACHE_TIMEOUT, LOCAL_CACHE_TIMEOUT)
+
+# Search autocomplete (accounts.autocomplete): how often each process rebuilds
+# its in-memory prefix index to pick up writes made by other workers.
+AUTOCOMPLETE_REFRESH_SECONDS = config('AUTOCOMPLETE_REFRESH_SECONDS', default=300, cast=int)
+
+
+# Background jobs (jobs app): image processing, timeline fan-out and email
+# run in `manage.py runworkers`. JOBS_RUN_INLINE runs them in the request
+# instead, for development without a worker; tests run them inline by default.
+JOBS_RUN_INLINE = config('JOBS_RUN_INLINE', default=TESTING, cast=bool)
+JOBS_WORKERS = config('JOBS_WORKERS', default=2, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1.0, cast=float)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_RETRY_BASE = config('JOBS_RETRY_BASE', default=10, cast=int)  # seconds, doubled per attempt
+JOBS_RETRY_MAX = config('JOBS_RETRY_MAX', default=3600, cast=int)
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', default=600, cast=int)  # requeue jobs whose lock went unrenewed this long
+
+
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='')
 EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
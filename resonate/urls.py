@@ -13,6 +13,7 @@ def landing_view(request):
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
+    path("chat/", include("chat.urls")),
     path("", landing_view, name="landing"),
 ]
 